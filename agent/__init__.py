@@ -1,5 +1,11 @@
 """LangGraph agent module."""
 
-from agent.graph import create_agent_graph
+__all__ = ["acreate_agent_graph", "create_agent_graph"]
 
-__all__ = ["create_agent_graph"]
+
+def __getattr__(name: str):
+    """延迟加载 graph，使 ``import agent.xxx`` 不必付出构建依赖的导入开销."""
+    if name in __all__:
+        from agent import graph
+        return getattr(graph, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,287 @@
+"""Batch runner that drives scripted conversations through the graph concurrently.
+
+输入为 JSONL，每行一个对话::
+
+    {"id": "add-1", "turns": ["15 加 27 等于多少？", "再加 3 呢？"]}
+    {"id": "greet", "message": "你好"}
+
+每个对话在独立的 thread_id 下按顺序执行各轮；对话之间通过 ``abatch_as_completed``
+以有界并发执行，每完成一个对话就把结果交给写入任务追加到输出 JSONL（文件 I/O 在线程中执行，
+不阻塞事件循环）。重新运行时会跳过输出文件中已成功完成的对话，因此进程中断后可以直接续跑::
+
+    python -m agent.batch conversations.jsonl --output results.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent.deadline import turn_deadline
+from agent.logs import log_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Conversation:
+    """一段脚本化的对话."""
+
+    id: str
+    turns: list[str]
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+def load_conversations(path: str) -> list[Conversation]:
+    """读取 JSONL 格式的对话；缺少 id 时使用行号."""
+    conversations = []
+    for line_number, line in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        turns = data.get("turns") or ([data["message"]] if "message" in data else [])
+        if not turns or not all(isinstance(turn, str) for turn in turns):
+            raise ValueError(f"{path}:{line_number} 需要字符串列表 turns 或字符串 message")
+        conversations.append(Conversation(
+            id=str(data.get("id", line_number)),
+            turns=turns,
+            metadata=data.get("metadata", {}),
+        ))
+    return conversations
+
+
+def load_completed_ids(path: str) -> set[str]:
+    """读取输出文件中已成功完成的对话 id；忽略中断时写了一半的最后一行."""
+    output = Path(path)
+    if not output.exists():
+        return set()
+    completed = set()
+    for line in output.read_text(encoding="utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("error") is None:
+            completed.add(record["id"])
+    return completed
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """返回毫秒单位的延迟分布."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+    return {
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "mean_ms": statistics.fmean(ordered),
+        "max_ms": ordered[-1],
+    }
+
+
+class BatchRunner:
+    """以有界并发执行多段对话，并把结果流式写入 JSONL."""
+
+    def __init__(self, app, concurrency: int = 8, thread_prefix: str = "batch"):
+        """初始化批量执行器.
+
+        Args:
+            app: 编译后的 agent graph（需配置 checkpointer，每段对话使用独立的 thread_id）
+            concurrency: 同时执行的对话数
+            thread_prefix: thread_id 前缀
+        """
+        self.app = app
+        self.concurrency = max(1, concurrency)
+        self.thread_prefix = thread_prefix
+        # 每段对话包装为一个 Runnable，借助 abatch_as_completed 的并发控制按完成顺序取结果
+        self.runnable: RunnableLambda[Conversation, dict[str, Any]] = RunnableLambda(self._run, name="conversation")
+
+    def _thread_id(self, conversation: Conversation) -> str:
+        return f"{self.thread_prefix}-{conversation.id}"
+
+    async def _run(self, conversation: Conversation) -> dict[str, Any]:
+        thread_id = self._thread_id(conversation)
+        config = {"configurable": {"thread_id": thread_id}}
+        turns = []
+        started = time.perf_counter()
+        try:
+            for index, user_input in enumerate(conversation.turns):
+                turn_started = time.perf_counter()
+                message = HumanMessage(content=user_input)
+                with turn_deadline(), log_context(thread_id=thread_id, turn_id=str(index)):
+                    result = await self.app.ainvoke({"messages": [message]}, config)
+                turns.append(_turn_record(user_input, result["messages"], time.perf_counter() - turn_started))
+        finally:
+            # 结果已写入输出文件，不再保留会话状态
+            if self.app.checkpointer is not None:
+                from agent.checkpoint import adelete_thread
+
+                await adelete_thread(self.app, thread_id)
+        return {
+            "id": conversation.id,
+            "thread_id": thread_id,
+            "metadata": conversation.metadata,
+            "turns": turns,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "error": None,
+        }
+
+    async def run(self, conversations: list[Conversation], output: str, resume: bool = True) -> dict[str, Any]:
+        """执行全部对话，返回吞吐与延迟统计."""
+        completed = await asyncio.to_thread(load_completed_ids, output) if resume else set()
+        pending = [conversation for conversation in conversations if conversation.id not in completed]
+        if not resume:
+            await asyncio.to_thread(Path(output).write_text, "", encoding="utf-8")
+
+        conversation_latencies: list[float] = []
+        turn_latencies: list[float] = []
+        failed = 0
+        started = time.perf_counter()
+        records: asyncio.Queue[Optional[dict[str, Any]]] = asyncio.Queue()
+        writer = asyncio.create_task(_write_records(output, records))
+        try:
+            results = self.runnable.abatch_as_completed(
+                pending, {"max_concurrency": self.concurrency}, return_exceptions=True
+            )
+            async for index, result in results:
+                if isinstance(result, Exception):
+                    failed += 1
+                    logger.warning(f"对话 {pending[index].id} 执行失败: {result}")
+                    result = {"id": pending[index].id, "error": f"{type(result).__name__}: {result}"}
+                else:
+                    conversation_latencies.append(result["latency_ms"])
+                    turn_latencies.extend(turn["latency_ms"] for turn in result["turns"])
+                records.put_nowait(result)
+        finally:
+            # 等待已完成的结果全部落盘（写入失败时在这里抛出）
+            records.put_nowait(None)
+            await writer
+        elapsed = time.perf_counter() - started
+
+        return {
+            "total": len(conversations),
+            "skipped": len(conversations) - len(pending),
+            "succeeded": len(pending) - failed,
+            "failed": failed,
+            "concurrency": self.concurrency,
+            "elapsed_seconds": elapsed,
+            "conversations_per_second": len(pending) / elapsed if elapsed else 0.0,
+            "turns_per_second": len(turn_latencies) / elapsed if elapsed else 0.0,
+            "conversation_latency": percentiles(conversation_latencies),
+            "turn_latency": percentiles(turn_latencies),
+        }
+
+
+def _append(f: IO[str], text: str) -> None:
+    f.write(text)
+    f.flush()
+
+
+async def _write_records(output: str, records: asyncio.Queue[Optional[dict[str, Any]]]) -> None:
+    """把队列中的结果逐个追加写入输出文件，直到收到 None.
+
+    每个结果写入后立即 flush，进程中断后可据此续跑；写入在线程中执行，
+    期间到达的结果合并为一次写入。
+    """
+    f = await asyncio.to_thread(open, output, "a", encoding="utf-8")
+    try:
+        done = False
+        while not done:
+            batch = [await records.get()]
+            while not records.empty():
+                batch.append(records.get_nowait())
+            if None in batch:
+                done = True
+            lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch if record is not None)
+            if lines:
+                await asyncio.to_thread(_append, f, lines)
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _turn_record(user_input: str, messages: list, latency: float) -> dict[str, Any]:
+    """从本轮结束时的消息历史中提取回答与工具调用."""
+    new_messages = []
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        new_messages.append(message)
+    new_messages.reverse()
+    answers = [message for message in new_messages if isinstance(message, AIMessage)]
+    return {
+        "input": user_input,
+        "response": answers[-1].content if answers else "",
+        "finish_reason": answers[-1].response_metadata.get("finish_reason") if answers else None,
+        "tool_calls": [
+            {"name": message.name, "content": message.content, "status": message.status}
+            for message in new_messages
+            if isinstance(message, ToolMessage)
+        ],
+        "latency_ms": latency * 1000,
+    }
+
+
+def _print_report(report: dict[str, Any]) -> None:
+    print(
+        f"对话: 共 {report['total']}，跳过 {report['skipped']}，成功 {report['succeeded']}，失败 {report['failed']}"
+    )
+    print(
+        f"耗时 {report['elapsed_seconds']:.1f} 秒，{report['conversations_per_second']:.2f} 段对话/秒，"
+        f"{report['turns_per_second']:.2f} 轮/秒（并发 {report['concurrency']}）"
+    )
+    for name in ("conversation_latency", "turn_latency"):
+        stats = report[name]
+        if stats:
+            print(
+                f"  {name:<22} p50 {stats['p50_ms']:8.1f} ms  p90 {stats['p90_ms']:8.1f} ms  "
+                f"p99 {stats['p99_ms']:8.1f} ms"
+            )
+
+
+async def run_batch(
+    input_path: str, output: str, concurrency: int, resume: bool = True
+) -> dict[str, Any]:
+    """构建 graph 并执行输入文件中的全部对话."""
+    from agent import acreate_agent_graph
+    from agent.checkpoint import aclose_checkpointer, acreate_checkpointer
+
+    conversations = load_conversations(input_path)
+    # 每段对话使用独立的 thread_id，内存 checkpointer 足够，完成后即删除
+    checkpointer = await acreate_checkpointer("memory")
+    app = await acreate_agent_graph(checkpointer=checkpointer)
+    try:
+        return await BatchRunner(app, concurrency).run(conversations, output, resume)
+    finally:
+        await aclose_checkpointer(checkpointer)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="并发执行 JSONL 中的脚本化对话")
+    parser.add_argument("input", help="对话 JSONL 文件")
+    parser.add_argument("--output", default="batch_results.jsonl", help="结果 JSONL 文件（追加写入）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时执行的对话数")
+    parser.add_argument("--no-resume", action="store_true", help="清空输出文件并重新执行全部对话")
+    parser.add_argument("--report", help="把吞吐与延迟统计写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_batch(args.input, args.output, args.concurrency, resume=not args.no_resume))
+    _print_report(report)
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
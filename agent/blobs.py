@@ -0,0 +1,275 @@
+"""Content-addressed, memory-mapped blob store for large tool outputs kept out of AgentState.
+
+超过 AGENT_BLOB_INLINE_MAX_CHARS 的工具结果写入磁盘上的 blob（按 sha256 寻址，相同内容只存一份），
+会话状态中的 ToolMessage 只保留 LLM 看到的截断视图，完整内容的引用放在 ``artifact`` 中::
+
+    ToolMessage(
+        content="<开头>…[已省略 … 完整内容保存在 blob 3f2a…]…<结尾>",
+        artifact={"blob": "3f2a…", "size": 1048576, "chars": 1048576, "media_type": "text/plain; charset=utf-8"},
+    )
+
+LLM 需要其余内容时调用内置的 ``read_blob`` 工具按字节分段读取（通过 mmap 只读取请求的区间）。
+会话状态引用的 blob 计入引用计数（历史压缩丢弃消息、删除会话时释放），总大小超过
+AGENT_BLOB_MAX_BYTES 时按最近访问时间淘汰未被引用的 blob。
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from uuid import uuid4
+
+from langchain_core.messages import BaseMessage
+from langchain_core.tools import StructuredTool
+
+from agent.config import get_blob_dir, get_blob_inline_max_chars, get_blob_max_bytes
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+READ_BLOB_TOOL_NAME = "read_blob"
+
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+
+class BlobStore:
+    """内容寻址的磁盘 blob 存储，带引用计数与 LRU 淘汰.
+
+    blob 保存在 ``<directory>/<sha256 前两位>/<sha256>``，先写临时文件再原子替换；
+    启动时按文件修改时间重建 LRU 顺序。引用计数只在进程内有效：进程重启后，
+    已持久化的会话仍引用的 blob 在淘汰前依然可读，被淘汰后读取返回 None。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """初始化存储.
+
+        Args:
+            directory: blob 文件所在目录
+            max_bytes: 全部 blob 的总大小上限；超出时淘汰最久未访问且未被引用的 blob
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # digest -> 字节数，按最近访问排序（最久未访问的在前）
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._refs: dict[str, int] = {}
+        self._bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def _load(self) -> None:
+        entries = []
+        for path in self.directory.glob("??/*"):
+            if path.suffix == ".tmp":
+                # 上次退出时没有写完的临时文件
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._sizes[digest] = size
+            self._bytes += size
+        if entries:
+            logger.info(f"blob 存储 {self.directory}: {len(entries)} 个 blob，共 {self._bytes} 字节")
+
+    def put(self, data: bytes, media_type: str = TEXT_MEDIA_TYPE, retain: bool = True) -> dict[str, Any]:
+        """写入 blob 并返回引用；内容已存在时只更新访问顺序.
+
+        Args:
+            data: blob 内容
+            media_type: 内容类型，记录在返回的引用中
+            retain: 是否为返回的引用增加一次引用计数（写入会话状态的引用需要计数）
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        metrics = get_metrics()
+        with self._lock:
+            if digest in self._sizes:
+                self._sizes.move_to_end(digest)
+                metrics.blob_operations.inc("dedup")
+            else:
+                path = self._path(digest)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f"{digest}.{uuid4().hex[:8]}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                self._sizes[digest] = len(data)
+                self._bytes += len(data)
+                metrics.blob_operations.inc("put")
+            if retain:
+                self._refs[digest] = self._refs.get(digest, 0) + 1
+            self._evict(keep=digest)
+        return {"blob": digest, "size": len(data), "media_type": media_type}
+
+    def read(self, digest: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        """读取 blob 的 [offset, offset + length) 区间；blob 不存在或已被淘汰时返回 None."""
+        with self._lock:
+            size = self._sizes.get(digest)
+            if size is None:
+                get_metrics().blob_operations.inc("miss")
+                return None
+            self._sizes.move_to_end(digest)
+        offset = min(max(0, offset), size)
+        end = size if length is None else min(size, offset + max(0, length))
+        if offset == end:
+            return b""
+        try:
+            with open(self._path(digest), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[offset:end]
+        except (FileNotFoundError, ValueError):
+            get_metrics().blob_operations.inc("miss")
+            return None
+        get_metrics().blob_operations.inc("read")
+        return data
+
+    def size(self, digest: str) -> Optional[int]:
+        with self._lock:
+            return self._sizes.get(digest)
+
+    def retain(self, digest: str) -> None:
+        with self._lock:
+            if digest in self._sizes:
+                self._refs[digest] = self._refs.get(digest, 0) + 1
+
+    def release(self, digest: str) -> None:
+        """减少一次引用计数；不再被引用的 blob 可以被淘汰."""
+        with self._lock:
+            count = self._refs.get(digest, 0) - 1
+            if count > 0:
+                self._refs[digest] = count
+            else:
+                self._refs.pop(digest, None)
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # 调用方持有锁；被引用的 blob 即使超出上限也保留
+        if self._bytes <= self.max_bytes:
+            return
+        for digest in list(self._sizes):
+            if self._bytes <= self.max_bytes:
+                break
+            if digest == keep or self._refs.get(digest):
+                continue
+            self._bytes -= self._sizes.pop(digest)
+            self._path(digest).unlink(missing_ok=True)
+            self.evictions += 1
+            get_metrics().blob_operations.inc("evict")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            referenced = sum(self._sizes.get(digest, 0) for digest in self._refs)
+            return {
+                "blobs": len(self._sizes),
+                "bytes": self._bytes,
+                "referenced_bytes": referenced,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+def blob_ref(message: BaseMessage) -> Optional[dict[str, Any]]:
+    """返回消息引用的 blob（ToolMessage.artifact）；没有时返回 None."""
+    artifact = getattr(message, "artifact", None)
+    if isinstance(artifact, dict) and isinstance(artifact.get("blob"), str):
+        return artifact
+    return None
+
+
+def release_blobs(messages: Iterable[BaseMessage]) -> None:
+    """释放一组即将从会话状态中移除的消息所引用的 blob."""
+    store = get_blob_store()
+    if store is None:
+        return
+    for message in messages:
+        ref = blob_ref(message)
+        if ref is not None:
+            store.release(ref["blob"])
+
+
+def offload_text(text: str, max_chars: Optional[int] = None) -> tuple[str, Optional[dict[str, Any]]]:
+    """把过长的文本写入 blob，返回 (LLM 看到的截断视图, blob 引用)；未超长时返回 (原文, None).
+
+    视图保留开头约 3/4 与结尾约 1/4 的内容，中间注明省略的字符数与 blob 引用。
+    """
+    store = get_blob_store()
+    max_chars = get_blob_inline_max_chars() if max_chars is None else max_chars
+    if store is None or max_chars <= 0 or len(text) <= max_chars:
+        return text, None
+    ref = store.put(text.encode("utf-8"))
+    ref["chars"] = len(text)
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    note = (
+        f"…[已省略 {len(text) - max_chars} 个字符（共 {len(text)} 个字符）。完整内容保存在 blob {ref['blob']}，"
+        f"可调用 {READ_BLOB_TOOL_NAME} 按字节分段读取]…"
+    )
+    view = f"{text[:head]}\n{note}\n{text[len(text) - tail:]}" if tail else f"{text[:head]}\n{note}"
+    return view, ref
+
+
+def _complete_utf8(data: bytes) -> bytes:
+    """去掉末尾不完整的 UTF-8 字符（下一段从该字符的首字节开始读）."""
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            continue
+        width = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+        return data if width <= i else data[:-i]
+    return data
+
+
+def create_read_blob_tool(store: "BlobStore", max_chars: int) -> StructuredTool:
+    """创建供 LLM 分段读取 blob 的工具；每次最多返回约 max_chars 个字符."""
+
+    def read_blob(blob: str, offset: int = 0, limit: int = max_chars) -> str:
+        """读取被截断的工具结果的完整内容.
+
+        Args:
+            blob: 截断提示中给出的 blob 引用
+            offset: 起始字节偏移
+            limit: 最多读取的字节数
+        """
+        size = store.size(blob)
+        data = store.read(blob, offset, min(max(1, limit), max_chars))
+        if size is None or data is None:
+            return f"错误: blob {blob} 不存在或已被淘汰"
+        start = min(max(0, offset), size)
+        # offset 落在多字节字符中间时从下一个字符开始
+        skipped = len(data) - len(data.lstrip(bytes(range(0x80, 0xC0))))
+        data, start = data[skipped:], start + skipped
+        data = _complete_utf8(data) or data
+        end = start + len(data)
+        position = f"字节 {start}-{end} / {size}" + (f"，下一段 offset={end}" if end < size else "，已读完")
+        return f"[{position}]\n{data.decode('utf-8', errors='replace')}"
+
+    return StructuredTool.from_function(
+        func=read_blob,
+        name=READ_BLOB_TOOL_NAME,
+        description="分段读取被截断的工具结果（截断提示中会给出 blob 引用），offset 与 limit 以字节为单位",
+    )
+
+
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    """获取全局 blob 存储；AGENT_BLOB_INLINE_MAX_CHARS 为 0 时返回 None（工具结果保持内联）."""
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None and get_blob_inline_max_chars() > 0:
+            _blob_store = BlobStore(get_blob_dir(), get_blob_max_bytes())
+            store = _blob_store
+
+            def byte_samples() -> dict[tuple[str, ...], float]:
+                stats = store.stats()
+                return {("referenced",): stats["referenced_bytes"], ("total",): stats["bytes"]}
+
+            get_metrics().blob_store_bytes.register("blobs", byte_samples)
+        return _blob_store
@@ -0,0 +1,232 @@
+"""LRU + TTL caches, including the LLM response cache in front of call_model."""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+
+from agent.config import (
+    get_llm_cache_kind,
+    get_llm_cache_max_entries,
+    get_llm_cache_path,
+    get_llm_cache_ttl,
+)
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheStats:
+    """命中/未命中计数."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hit_ratio, 4)}
+
+
+class TTLCache(Generic[K, V]):
+    """线程安全的进程内 LRU 缓存，条目超过 ttl 秒后失效."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        """写入条目；ttl 为 None 时使用缓存的默认 ttl."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _normalize_messages(messages: list[BaseMessage]) -> list[dict[str, Any]]:
+    """把消息转换为与 id 无关的规范形式.
+
+    消息 id 和 tool_call id 每次都不同，这里把 tool_call id 替换为出现顺序，
+    使得内容相同的历史得到相同的 key。
+    """
+    call_ids: dict[str, int] = {}
+    normalized = []
+    for message in messages:
+        item: dict[str, Any] = {"type": message.type, "content": message.content}
+        if isinstance(message, AIMessage) and message.tool_calls:
+            item["tool_calls"] = []
+            for call in message.tool_calls:
+                call_id = call["id"]
+                index = call_ids.setdefault(call_id, len(call_ids)) if call_id is not None else None
+                item["tool_calls"].append({"name": call["name"], "args": call["args"], "id": index})
+        tool_call_id = getattr(message, "tool_call_id", None)
+        if tool_call_id is not None:
+            item["tool_call_id"] = call_ids.get(tool_call_id, tool_call_id)
+        normalized.append(item)
+    return normalized
+
+
+def make_cache_key(model: str, temperature: Optional[float], tools: list[dict], messages: list[BaseMessage]) -> str:
+    """根据 (model, temperature, 绑定的工具 schema, 消息) 计算缓存 key."""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "tools": tools,
+        "messages": _normalize_messages(messages),
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _fresh_copy(message: AIMessage) -> AIMessage:
+    """返回带新 id 的副本，避免与历史中的原消息冲突（add_messages 按 id 覆盖）."""
+    tool_calls = [{**call, "id": f"call_{uuid4().hex[:24]}"} for call in message.tool_calls]
+    return message.model_copy(update={"id": None, "tool_calls": tool_calls})
+
+
+class ResponseCache(ABC):
+    """LLM 响应缓存的基类；存储后端实现 _get / _set."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[str]:
+        """读取序列化的响应；未命中或已过期返回 None."""
+
+    @abstractmethod
+    def _set(self, key: str, value: str) -> None:
+        """写入序列化的响应."""
+
+    def lookup(self, key: str) -> Optional[AIMessage]:
+        """查找缓存的响应；未命中返回 None."""
+        value = self._get(key)
+        self.stats.record(value is not None)
+        if value is None:
+            return None
+        message = messages_from_dict([json.loads(value)])[0]
+        if not isinstance(message, AIMessage):
+            return None
+        return _fresh_copy(message)
+
+    def update(self, key: str, message: BaseMessage) -> None:
+        """缓存一次成功的响应."""
+        if not isinstance(message, AIMessage) or not (message.content or message.tool_calls):
+            return
+        self._set(key, json.dumps(message_to_dict(message), ensure_ascii=False))
+
+
+class MemoryResponseCache(ResponseCache):
+    """进程内响应缓存."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        super().__init__()
+        self._cache: TTLCache[str, str] = TTLCache(max_entries, ttl)
+
+    def _get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def _set(self, key: str, value: str) -> None:
+        self._cache.set(key, value)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """落盘的响应缓存，可在进程之间共享."""
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        super().__init__()
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # 超出容量时淘汰最久未访问的条目
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+def create_response_cache(kind: Optional[str] = None) -> Optional[ResponseCache]:
+    """按配置创建 LLM 响应缓存；kind 为 none 时返回 None."""
+    kind = (kind or get_llm_cache_kind()).lower()
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemoryResponseCache(get_llm_cache_max_entries(), get_llm_cache_ttl())
+    if kind == "sqlite":
+        logger.info(f"使用 SQLite LLM 响应缓存: {get_llm_cache_path()}")
+        return SQLiteResponseCache(get_llm_cache_path(), get_llm_cache_max_entries(), get_llm_cache_ttl())
+    raise ValueError(f"未知的 LLM 缓存类型: {kind}，可选值: none, memory, sqlite")
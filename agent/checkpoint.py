@@ -0,0 +1,91 @@
+"""Checkpointers that persist conversation state per thread_id."""
+
+import logging
+import sqlite3
+from typing import Any, Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.blobs import release_blobs
+from agent.config import get_checkpoint_db_path, get_checkpointer_kind
+
+# SQLite checkpointer 集成
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    SQLITE_CHECKPOINT_AVAILABLE = True
+except ImportError:
+    # 未安装时这些名称不存在；所有使用处都先经过 SQLITE_CHECKPOINT_AVAILABLE 检查
+    SQLITE_CHECKPOINT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTER_KINDS = ("none", "memory", "sqlite")
+
+
+def _resolve(kind: Optional[str], path: Optional[str]) -> tuple[str, str]:
+    kind = (kind or get_checkpointer_kind()).lower()
+    if kind not in CHECKPOINTER_KINDS:
+        raise ValueError(f"未知的 checkpointer 类型: {kind}，可选值: {', '.join(CHECKPOINTER_KINDS)}")
+    if kind == "sqlite" and not SQLITE_CHECKPOINT_AVAILABLE:
+        raise ValueError("使用 sqlite checkpointer 需要安装 langgraph-checkpoint-sqlite")
+    return kind, path or get_checkpoint_db_path()
+
+
+def create_checkpointer(kind: Optional[str] = None, path: Optional[str] = None) -> Optional[BaseCheckpointSaver]:
+    """创建同步 graph 使用的 checkpointer.
+
+    Args:
+        kind: none / memory / sqlite，默认读取 AGENT_CHECKPOINTER
+        path: sqlite 数据库文件路径，默认读取 AGENT_CHECKPOINT_DB
+
+    Returns:
+        checkpointer 实例；kind 为 none 时返回 None
+    """
+    kind, path = _resolve(kind, path)
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemorySaver()
+    logger.info(f"使用 SQLite checkpointer: {path}")
+    # SqliteSaver 内部加锁，允许跨线程使用同一个连接
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+async def acreate_checkpointer(
+    kind: Optional[str] = None, path: Optional[str] = None
+) -> Optional[BaseCheckpointSaver]:
+    """创建异步 graph 使用的 checkpointer（需在运行中的事件循环内调用）.
+
+    sqlite 类型持有一个 aiosqlite 连接，其工作线程不是守护线程，
+    退出前需要调用 aclose_checkpointer 关闭，否则进程不会结束。
+    """
+    kind, path = _resolve(kind, path)
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemorySaver()
+    logger.info(f"使用 SQLite checkpointer: {path}")
+    return AsyncSqliteSaver(aiosqlite.connect(path))
+
+
+async def aclose_checkpointer(checkpointer: Optional[BaseCheckpointSaver]) -> None:
+    """关闭 acreate_checkpointer 创建的 checkpointer 所持有的连接."""
+    if SQLITE_CHECKPOINT_AVAILABLE and isinstance(checkpointer, AsyncSqliteSaver):
+        await checkpointer.conn.close()
+
+
+def delete_thread(app: Any, thread_id: str) -> None:
+    """删除会话的全部 checkpoint，并释放其消息引用的 blob."""
+    config = {"configurable": {"thread_id": thread_id}}
+    release_blobs(app.get_state(config).values.get("messages", []))
+    app.checkpointer.delete_thread(thread_id)
+
+
+async def adelete_thread(app: Any, thread_id: str) -> None:
+    """delete_thread 的异步版本."""
+    config = {"configurable": {"thread_id": thread_id}}
+    release_blobs((await app.aget_state(config)).values.get("messages", []))
+    await app.checkpointer.adelete_thread(thread_id)
@@ -8,6 +8,10 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+# 默认不发送 system prompt（与原来的行为一致）；通过 AGENT_SYSTEM_PROMPT 设置时应保持固定不变
+# （不含日期等易变内容），才能作为 DeepSeek 上下文缓存的公共前缀
+DEFAULT_SYSTEM_PROMPT = ""
+
 
 def get_deepseek_api_key() -> Optional[str]:
     """Get DeepSeek API key from environment variable."""
@@ -24,6 +28,31 @@ def get_deepseek_model() -> str:
     return os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
 
+def get_model_routes() -> Optional[str]:
+    """Get the models of the routing cascade, cheapest first ("fast=deepseek-chat,strong=deepseek-reasoner")."""
+    return os.getenv("AGENT_MODEL_ROUTES") or None
+
+
+def get_router_max_simple_chars() -> int:
+    """Get the message length at which a turn counts as fully complex."""
+    return int(os.getenv("AGENT_ROUTER_MAX_SIMPLE_CHARS", "400"))
+
+
+def get_router_max_history_turns() -> int:
+    """Get the number of earlier turns at which the history counts as fully complex."""
+    return int(os.getenv("AGENT_ROUTER_MAX_HISTORY_TURNS", "8"))
+
+
+def get_router_min_confidence() -> float:
+    """Get the confidence below which a routing decision falls back to the classifier or the strongest model."""
+    return float(os.getenv("AGENT_ROUTER_MIN_CONFIDENCE", "0.5"))
+
+
+def get_router_classifier_enabled() -> bool:
+    """Whether uncertain turns are classified by the cheapest model before escalating."""
+    return os.getenv("AGENT_ROUTER_CLASSIFIER", "false").lower() in ("1", "true", "yes")
+
+
 def get_langfuse_public_key() -> Optional[str]:
     """Get Langfuse public key from environment variable."""
     return os.getenv("LANGFUSE_PUBLIC_KEY")
@@ -37,3 +66,377 @@ def get_langfuse_secret_key() -> Optional[str]:
 def get_langfuse_host() -> str:
     """Get Langfuse host URL."""
     return os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
+
+
+def get_mcp_pool_size() -> int:
+    """Get the maximum number of pooled MCP sessions."""
+    return int(os.getenv("MCP_POOL_SIZE", "4"))
+
+
+def get_mcp_pool_idle_timeout() -> float:
+    """Get the idle time (seconds) after which a pooled MCP session is closed."""
+    return float(os.getenv("MCP_POOL_IDLE_TIMEOUT", "300"))
+
+
+def get_mcp_health_check_interval() -> float:
+    """Get the interval (seconds) between health checks of an idle MCP session."""
+    return float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+
+
+def get_mcp_call_timeout() -> float:
+    """Get the timeout (seconds) for a single MCP tool call."""
+    return float(os.getenv("MCP_CALL_TIMEOUT", "30"))
+
+
+def get_parallel_tools_enabled() -> bool:
+    """Whether tool calls from one LLM turn are dispatched concurrently."""
+    return os.getenv("AGENT_PARALLEL_TOOLS", "true").lower() in ("1", "true", "yes")
+
+
+def get_turn_timeout() -> float:
+    """Get the deadline (seconds) for one agent turn, LLM and tool calls included; 0 disables it."""
+    return float(os.getenv("AGENT_TURN_TIMEOUT", "300"))
+
+
+def get_max_tool_rounds() -> int:
+    """Get the maximum number of agent -> tools rounds in one turn before the model must answer."""
+    return int(os.getenv("AGENT_MAX_TOOL_ROUNDS", "8"))
+
+
+def get_speculative_tools_enabled() -> bool:
+    """Whether streamed tool calls are started before the LLM finishes its message (requires streaming)."""
+    return os.getenv("AGENT_SPECULATIVE_TOOLS", "false").lower() in ("1", "true", "yes")
+
+
+def get_tool_max_concurrency() -> int:
+    """Get the maximum number of tool calls executed at once within one turn."""
+    return int(os.getenv("AGENT_TOOL_MAX_CONCURRENCY", "4"))
+
+
+def get_tool_call_timeout() -> float:
+    """Get the per-call timeout (seconds) enforced by the tool dispatcher."""
+    return float(os.getenv("AGENT_TOOL_CALL_TIMEOUT", "60"))
+
+
+def get_streaming_enabled() -> bool:
+    """Whether the LLM response is streamed token by token."""
+    return os.getenv("AGENT_STREAMING", "true").lower() in ("1", "true", "yes")
+
+
+def get_system_prompt() -> str:
+    """Get the fixed system prompt placed at the start of every LLM request (empty, the default, disables it)."""
+    return os.getenv("AGENT_SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
+
+
+def get_history_max_tokens() -> int:
+    """Get the token budget for the history sent to the LLM (0 disables compaction)."""
+    return int(os.getenv("AGENT_HISTORY_MAX_TOKENS", "32000"))
+
+
+def get_tool_result_max_chars() -> int:
+    """Get the length above which older tool results are truncated (0 disables)."""
+    return int(os.getenv("AGENT_TOOL_RESULT_MAX_CHARS", "4000"))
+
+
+def get_history_target_ratio() -> float:
+    """Get the fraction of the history budget kept after a compaction (lower = fewer, larger rewrites)."""
+    return float(os.getenv("AGENT_HISTORY_TARGET_RATIO", "0.7"))
+
+
+def get_blob_inline_max_chars() -> int:
+    """Get the length above which tool results are moved to the blob store (0 keeps them inline)."""
+    return int(os.getenv("AGENT_BLOB_INLINE_MAX_CHARS", "8000"))
+
+
+def get_blob_dir() -> str:
+    """Get the directory holding out-of-line tool results."""
+    return os.getenv("AGENT_BLOB_DIR", "blobs")
+
+
+def get_blob_max_bytes() -> int:
+    """Get the size above which unreferenced blobs are evicted (least recently used first)."""
+    return int(os.getenv("AGENT_BLOB_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+def get_history_summary_enabled() -> bool:
+    """Whether messages dropped from the history are folded into a rolling summary."""
+    return os.getenv("AGENT_HISTORY_SUMMARY", "false").lower() in ("1", "true", "yes")
+
+
+def get_checkpointer_kind() -> str:
+    """Get the conversation checkpointer type: none, memory or sqlite."""
+    return os.getenv("AGENT_CHECKPOINTER", "none").lower()
+
+
+def get_checkpoint_db_path() -> str:
+    """Get the SQLite file used by the sqlite checkpointer."""
+    return os.getenv("AGENT_CHECKPOINT_DB", "checkpoints.sqlite")
+
+
+def get_console_thread_id() -> str:
+    """Get the thread_id used by the console session."""
+    return os.getenv("AGENT_THREAD_ID", "1")
+
+
+def get_llm_cache_kind() -> str:
+    """Get the LLM response cache backend: none, memory or sqlite."""
+    return os.getenv("AGENT_LLM_CACHE", "none").lower()
+
+
+def get_llm_cache_path() -> str:
+    """Get the SQLite file used by the sqlite LLM response cache."""
+    return os.getenv("AGENT_LLM_CACHE_DB", "llm_cache.sqlite")
+
+
+def get_llm_cache_max_entries() -> int:
+    """Get the maximum number of cached LLM responses."""
+    return int(os.getenv("AGENT_LLM_CACHE_MAX_ENTRIES", "1000"))
+
+
+def get_llm_cache_ttl() -> float:
+    """Get the lifetime (seconds) of a cached LLM response."""
+    return float(os.getenv("AGENT_LLM_CACHE_TTL", "3600"))
+
+
+def get_tool_cache_max_entries() -> int:
+    """Get the maximum number of memoized tool results (0 disables the cache)."""
+    return int(os.getenv("AGENT_TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+
+def get_tool_cache_ttl() -> float:
+    """Get the default lifetime (seconds) of a memoized tool result."""
+    return float(os.getenv("AGENT_TOOL_CACHE_TTL", "300"))
+
+
+def get_mcp_server_command() -> str:
+    """Get the command that starts the MCP server."""
+    return os.getenv("MCP_SERVER_COMMAND", "python")
+
+
+def get_mcp_server_args() -> list[str]:
+    """Get the arguments passed to the MCP server command."""
+    return os.getenv("MCP_SERVER_ARGS", "-m agent.mcp.server").split()
+
+
+def get_mcp_servers() -> Optional[str]:
+    """Get the MCP server endpoints, e.g. "math=stdio:python -m agent.mcp.server;shared=http://127.0.0.1:9000/mcp".
+
+    Unset means a single stdio server started with MCP_SERVER_COMMAND and MCP_SERVER_ARGS.
+    """
+    return os.getenv("MCP_SERVERS") or None
+
+
+def get_tool_schema_cache_path() -> Optional[str]:
+    """Get the file caching MCP tool schemas between runs (empty disables the cache)."""
+    return os.getenv("AGENT_TOOL_SCHEMA_CACHE", ".cache/mcp_tools.json") or None
+
+
+def get_trace_exporter_kind() -> str:
+    """Get the trace exporter: langfuse, file, noop or none (default: langfuse when keys are set)."""
+    default = "langfuse" if get_langfuse_public_key() and get_langfuse_secret_key() else "none"
+    return os.getenv("AGENT_TRACE_EXPORTER", default).lower()
+
+
+def get_trace_file_path() -> str:
+    """Get the JSON Lines file written by the file trace exporter."""
+    return os.getenv("AGENT_TRACE_FILE", "traces.jsonl")
+
+
+def get_trace_sample_rate() -> float:
+    """Get the fraction of turns (traces) that are recorded."""
+    return float(os.getenv("AGENT_TRACE_SAMPLE_RATE", "1.0"))
+
+
+def get_trace_queue_size() -> int:
+    """Get the capacity of the trace export queue; spans beyond it are dropped."""
+    return int(os.getenv("AGENT_TRACE_QUEUE_SIZE", "2048"))
+
+
+def get_trace_batch_size() -> int:
+    """Get the maximum number of spans sent in one export batch."""
+    return int(os.getenv("AGENT_TRACE_BATCH_SIZE", "64"))
+
+
+def get_trace_flush_interval() -> float:
+    """Get the interval (seconds) between trace export batches."""
+    return float(os.getenv("AGENT_TRACE_FLUSH_INTERVAL", "2"))
+
+
+def get_trace_preview_chars() -> int:
+    """Get the length to which traced strings (inputs, outputs, metadata) are truncated."""
+    return int(os.getenv("AGENT_TRACE_PREVIEW_CHARS", "500"))
+
+
+def get_server_host() -> str:
+    """Get the address the HTTP agent server binds to."""
+    return os.getenv("AGENT_SERVER_HOST", "127.0.0.1")
+
+
+def get_server_port() -> int:
+    """Get the port the HTTP agent server listens on."""
+    return int(os.getenv("AGENT_SERVER_PORT", "8000"))
+
+
+def get_server_max_in_flight() -> int:
+    """Get the maximum number of agent turns the server runs at once."""
+    return int(os.getenv("AGENT_SERVER_MAX_IN_FLIGHT", "16"))
+
+
+def get_server_max_queue() -> int:
+    """Get the maximum number of turns waiting for a slot; further requests are rejected."""
+    return int(os.getenv("AGENT_SERVER_MAX_QUEUE", "64"))
+
+
+def get_server_queue_timeout() -> float:
+    """Get the time (seconds) a turn may wait for a slot before it is rejected."""
+    return float(os.getenv("AGENT_SERVER_QUEUE_TIMEOUT", "30"))
+
+
+def get_server_shutdown_timeout() -> float:
+    """Get the time (seconds) in-flight turns are given to finish on shutdown."""
+    return float(os.getenv("AGENT_SERVER_SHUTDOWN_TIMEOUT", "30"))
+
+
+def get_server_workers() -> int:
+    """Get the number of worker processes started by agent.supervisor (0 = one per CPU core)."""
+    return int(os.getenv("AGENT_SERVER_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def get_worker_health_interval() -> float:
+    """Get the interval (seconds) between health checks of supervised workers."""
+    return float(os.getenv("AGENT_WORKER_HEALTH_INTERVAL", "5"))
+
+
+def get_worker_startup_timeout() -> float:
+    """Get the time (seconds) a worker may take to start serving before it is restarted."""
+    return float(os.getenv("AGENT_WORKER_STARTUP_TIMEOUT", "60"))
+
+
+def get_server_max_body_bytes() -> int:
+    """Get the maximum accepted request body size in bytes."""
+    return int(os.getenv("AGENT_SERVER_MAX_BODY_BYTES", str(1024 * 1024)))
+
+
+def get_llm_timeout() -> float:
+    """Get the per-request timeout (seconds) for LLM API calls."""
+    return float(os.getenv("AGENT_LLM_TIMEOUT", "120"))
+
+
+def get_llm_connect_timeout() -> float:
+    """Get the timeout (seconds) for establishing a connection to the LLM API."""
+    return float(os.getenv("AGENT_LLM_CONNECT_TIMEOUT", "10"))
+
+
+def get_llm_max_connections() -> int:
+    """Get the maximum number of concurrent connections to the LLM API."""
+    return int(os.getenv("AGENT_LLM_MAX_CONNECTIONS", "64"))
+
+
+def get_llm_max_keepalive_connections() -> int:
+    """Get the maximum number of idle keep-alive connections kept to the LLM API."""
+    return int(os.getenv("AGENT_LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+
+
+def get_llm_keepalive_expiry() -> float:
+    """Get the idle time (seconds) after which a keep-alive connection is closed."""
+    return float(os.getenv("AGENT_LLM_KEEPALIVE_EXPIRY", "60"))
+
+
+def get_llm_max_retries() -> int:
+    """Get the number of retries for LLM requests failing with 429/5xx or connection errors."""
+    return int(os.getenv("AGENT_LLM_MAX_RETRIES", "3"))
+
+
+def get_llm_retry_base_delay() -> float:
+    """Get the base delay (seconds) of the exponential retry backoff."""
+    return float(os.getenv("AGENT_LLM_RETRY_BASE_DELAY", "0.5"))
+
+
+def get_llm_retry_max_delay() -> float:
+    """Get the longest delay (seconds) waited before a retry, including Retry-After."""
+    return float(os.getenv("AGENT_LLM_RETRY_MAX_DELAY", "30"))
+
+
+def get_llm_requests_per_second() -> float:
+    """Get the client-side limit on LLM requests per second (0 disables)."""
+    return float(os.getenv("AGENT_LLM_REQUESTS_PER_SECOND", "0"))
+
+
+def get_llm_tokens_per_minute() -> float:
+    """Get the client-side limit on estimated prompt tokens per minute (0 disables)."""
+    return float(os.getenv("AGENT_LLM_TOKENS_PER_MINUTE", "0"))
+
+
+def get_mcp_server_thread_workers() -> int:
+    """Get the number of threads the MCP server uses for blocking tools."""
+    return int(os.getenv("MCP_SERVER_THREAD_WORKERS", "8"))
+
+
+def get_mcp_server_process_workers() -> int:
+    """Get the number of processes the MCP server uses for CPU-bound tools (0 means one per CPU)."""
+    return int(os.getenv("MCP_SERVER_PROCESS_WORKERS", "0"))
+
+
+def get_metrics_enabled() -> bool:
+    """Whether latency/token/queue metrics are recorded (default: true)."""
+    return os.getenv("AGENT_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def get_metrics_port() -> int:
+    """Get the port of the standalone /metrics endpoint for non-server processes (0 disables)."""
+    return int(os.getenv("AGENT_METRICS_PORT", "0"))
+
+
+def get_profile_mode() -> str:
+    """Get the per-turn profiler: off, cprofile or pyinstrument (can be toggled at runtime)."""
+    return os.getenv("AGENT_PROFILE", "off").lower()
+
+
+def get_profile_dir() -> str:
+    """Get the directory per-turn profiles are written to."""
+    return os.getenv("AGENT_PROFILE_DIR", "profiles")
+
+
+def get_profile_sample_rate() -> float:
+    """Get the fraction of turns that are profiled while profiling is on."""
+    return float(os.getenv("AGENT_PROFILE_SAMPLE_RATE", "1.0"))
+
+
+def get_log_file() -> Optional[str]:
+    """Get the log file of the agent package (empty disables file logging)."""
+    return os.getenv("AGENT_LOG_FILE", "agent.log") or None
+
+
+def get_log_level() -> str:
+    """Get the level of the agent package logger."""
+    return os.getenv("AGENT_LOG_LEVEL", "INFO").upper()
+
+
+def get_log_stderr_level() -> Optional[str]:
+    """Get the minimum level also written to stderr (empty, the default, disables stderr output)."""
+    return os.getenv("AGENT_LOG_STDERR_LEVEL", "").upper() or None
+
+
+def get_log_format() -> str:
+    """Get the log file format: json (one record per line) or text."""
+    return os.getenv("AGENT_LOG_FORMAT", "json").lower()
+
+
+def get_log_max_bytes() -> int:
+    """Get the size (bytes) at which the log file is rotated."""
+    return int(os.getenv("AGENT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+
+
+def get_log_rotate_when() -> Optional[str]:
+    """Get the time-based rotation interval (e.g. "midnight", "H"); set it to rotate by time instead of size."""
+    return os.getenv("AGENT_LOG_ROTATE_WHEN") or None
+
+
+def get_log_backup_count() -> int:
+    """Get the number of rotated log files kept."""
+    return int(os.getenv("AGENT_LOG_BACKUP_COUNT", "5"))
+
+
+def get_log_queue_size() -> int:
+    """Get the capacity of the log queue; records beyond it are dropped instead of blocking."""
+    return int(os.getenv("AGENT_LOG_QUEUE_SIZE", "10000"))
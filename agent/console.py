@@ -1,42 +1,35 @@
 """Console interaction module for the agent."""
 
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from uuid import uuid4
 
-from langchain_core.messages import HumanMessage, ToolMessage, AIMessage
-from agent.config import (
-    get_langfuse_public_key,
-    get_langfuse_secret_key,
-    get_langfuse_host,
-)
-
-# Langfuse 集成
-try:
-    from langfuse import Langfuse
-    LANGFUSE_AVAILABLE = True
-except ImportError:
-    LANGFUSE_AVAILABLE = False
-    Langfuse = None
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from agent.checkpoint import delete_thread
+from agent.config import get_console_thread_id, get_streaming_enabled
+from agent.deadline import turn_deadline, unstreamed_text
+from agent.logs import log_context
+from agent.metrics import get_metrics, start_metrics_server
+from agent.profiling import get_profiler
+from agent.tracing import Span, get_tracer
 
 
 class ConsoleInterface:
     """Console interface for agent interaction."""
 
-    def __init__(self, agent_app: Any):
-        """Initialize console interface with agent app."""
+    def __init__(self, agent_app: Any, stream: Optional[bool] = None):
+        """Initialize console interface with agent app.
+
+        Args:
+            agent_app: 编译后的 agent graph
+            stream: 是否流式输出；默认读取 AGENT_STREAMING 配置
+        """
         self.agent_app = agent_app
         self.running = False
-
-        # 初始化 Langfuse 客户端（如果配置了）
-        self.langfuse = None
-        if LANGFUSE_AVAILABLE:
-            public_key = get_langfuse_public_key()
-            secret_key = get_langfuse_secret_key()
-            if public_key and secret_key:
-                self.langfuse = Langfuse(
-                    public_key=public_key,
-                    secret_key=secret_key,
-                    host=get_langfuse_host(),
-                )
+        self.stream = get_streaming_enabled() if stream is None else stream
+        self.tracer = get_tracer()
+        self.metrics = get_metrics()
+        self.profiler = get_profiler()
 
     def start(self):
         """Start the console interaction loop."""
@@ -46,11 +39,16 @@ class ConsoleInterface:
         print("=" * 60)
         print("输入 'exit' 或 'quit' 退出")
         print("输入 'clear' 清空对话历史")
+        print("输入 'profile cprofile|pyinstrument|off' 开关每轮的 profile，'metrics' 查看指标")
         print("-" * 60)
+        # 设置了 AGENT_METRICS_PORT 时在后台提供 /metrics
+        start_metrics_server()
 
-        config = {"configurable": {"thread_id": "1"}}
+        config = {"configurable": {"thread_id": get_console_thread_id()}}
+        # 配置了 checkpointer 时由 graph 按 thread_id 保存历史，每轮只需发送新消息
+        persistent = getattr(self.agent_app, "checkpointer", None) is not None
         # 维护消息历史
-        messages = []
+        messages = self._restore_history(config) if persistent else []
 
         while self.running:
             try:
@@ -68,90 +66,40 @@ class ConsoleInterface:
                 # 处理清空命令
                 if user_input.lower() == "clear":
                     messages = []
+                    if persistent:
+                        delete_thread(self.agent_app, config["configurable"]["thread_id"])
                     print("对话历史已清空")
                     continue
 
+                if user_input.lower() == "metrics":
+                    self._print_metrics()
+                    continue
+
+                if user_input.lower().startswith("profile"):
+                    self._toggle_profiler(user_input.split()[1:])
+                    continue
+
                 # 添加用户消息到历史
-                user_message = HumanMessage(content=user_input)
+                user_message = HumanMessage(content=user_input, id=str(uuid4()))
                 messages.append(user_message)
 
-                # 创建包含完整消息历史的状态
-                state = {"messages": messages}
-
-                # 使用 Langfuse 包装整个流程为一个 trace
-                if self.langfuse and LANGFUSE_AVAILABLE:
-                    # 创建根 span，包装从用户输入到输出的整个过程
-                    with self.langfuse.start_as_current_observation(
-                        as_type="span",
-                        name="user_query_to_response",
-                        input={"user_input": user_input},
-                    ) as root_span:
-                        # 更新 trace 的 user_id 和 session_id
-                        root_span.update_trace(
-                            user_id="console_user",
-                            session_id=config.get("configurable", {}).get("thread_id", "default"),
-                        )
-                        try:
-                            # 调用 agent（LLM 调用会在 graph 中自动记录为 generation）
-                            result = self.agent_app.invoke(state, config)
-
-                            # 更新消息历史（包含新的响应）
-                            if result.get("messages"):
-                                # 获取新添加的消息（通常是最后一条）
-                                new_messages = result["messages"][len(messages):]
-                                messages.extend(new_messages)
-
-                                # 显示 agent 响应
-                                if new_messages:
-                                    last_message = new_messages[-1]
-                                    last2message = None if len(new_messages) < 2 else new_messages[-2]
-                                    if last2message and isinstance(last2message, ToolMessage):
-                                        print(f"\nTool call: {last2message.to_json()} {last2message.content}")
-
-                                    output_content = last_message.content if hasattr(
-                                        last_message, "content") else str(last_message)
-                                    print(f"\nAgent: {output_content}")
-
-                                    # 更新根 span 和 trace 的输出
-                                    root_span.update(output={"response": output_content})
-                                    root_span.update_trace(
-                                        input={"user_input": user_input},
-                                        output={"response": output_content},
-                                    )
-                            else:
-                                root_span.update(output={"response": "No response"})
-                                root_span.update_trace(
-                                    input={"user_input": user_input},
-                                    output={"response": "No response"},
-                                )
-                        except Exception as e:
-                            # 记录错误
-                            root_span.update(
-                                output={"error": str(e)},
-                                level="ERROR",
-                            )
-                            root_span.update_trace(
-                                input={"user_input": user_input},
-                                output={"error": str(e)},
-                            )
-                            raise
-                else:
-                    # 没有 Langfuse 时，直接调用
-                    result = self.agent_app.invoke(state, config)
-
-                    # 更新消息历史（包含新的响应）
-                    if result.get("messages"):
-                        # 获取新添加的消息（通常是最后一条）
-                        new_messages = result["messages"][len(messages):]
-                        messages.extend(new_messages)
-
-                        # 显示 agent 响应
-                        if new_messages:
-                            last_message = new_messages[-1]
-                            last2message = None if len(new_messages) < 2 else new_messages[-2]
-                            if last2message and isinstance(last2message, ToolMessage):
-                                print(f"\nTool call: {last2message.to_json()} {last2message.content}")
-                            print(f"\nAgent: {last_message.content}")
+                # 创建状态：无 checkpointer 时需要包含完整消息历史
+                state = {"messages": [user_message] if persistent else messages}
+
+                # 把整轮对话包装为一个 trace（LLM 调用会在 graph 中自动记录为 generation）
+                with (
+                    turn_deadline(),
+                    log_context(thread_id=config["configurable"]["thread_id"], turn_id=user_message.id[:12]),
+                    self.metrics.turn_latency.time("console"),
+                    self.profiler.profile("console-turn") as profile_path,
+                    self._traced_turn(user_input, config) as root_span,
+                ):
+                    # graph 可能压缩了历史，因此以本轮结束时的状态作为新的历史
+                    messages = self._run_turn(state, config)
+                    new_messages = _messages_after(messages, user_message.id)
+                    self._record_output(root_span, user_input, new_messages)
+                if profile_path is not None:
+                    print(f"\n[profile] {profile_path}")
 
             except KeyboardInterrupt:
                 print("\n\n再见！")
@@ -162,3 +110,149 @@ class ConsoleInterface:
             except Exception as e:
                 print(f"\n错误: {e}")
                 continue
+
+    def _toggle_profiler(self, args: list[str]) -> None:
+        """profile [模式] [采样率]：不带参数时显示当前状态."""
+        try:
+            status = self.profiler.configure(
+                mode=args[0] if args else None,
+                sample_rate=float(args[1]) if len(args) > 1 else None,
+            )
+        except ValueError as e:
+            print(f"错误: {e}")
+            return
+        print(f"profiler: {status['mode']}（采样率 {status['sample_rate']:g}，输出目录 {status['directory']}）")
+
+    def _print_metrics(self) -> None:
+        """打印各直方图的次数与估算的 p50/p99."""
+        snapshot = self.metrics.snapshot()
+        for name, series in snapshot.items():
+            for labels, value in series.items():
+                if not isinstance(value, dict):
+                    print(f"{name}[{labels}] {value:g}")
+                elif name.endswith("_seconds"):
+                    print(
+                        f"{name}[{labels}] count={value['count']} "
+                        f"p50={value['p50'] * 1000:.1f}ms p99={value['p99'] * 1000:.1f}ms"
+                    )
+                else:
+                    print(f"{name}[{labels}] count={value['count']} mean={value['mean']:.0f}")
+
+    def _restore_history(self, config: dict) -> list[BaseMessage]:
+        """读取 checkpointer 中已保存的会话历史."""
+        snapshot = self.agent_app.get_state(config)
+        messages = list(snapshot.values.get("messages", []))
+        if messages:
+            print(f"已恢复会话 {config['configurable']['thread_id']}（{len(messages)} 条消息）")
+        return messages
+
+    @contextmanager
+    def _traced_turn(self, user_input: str, config: dict) -> Iterator[Optional[Span]]:
+        """创建包装一轮对话的根 span（未启用 tracing 或未被采样时返回 None）."""
+        with self.tracer.span(
+            "user_query_to_response",
+            input={"user_input": user_input},
+        ) as root_span:
+            if root_span is None:
+                yield None
+                return
+            root_span.update_trace(
+                user_id="console_user",
+                session_id=config.get("configurable", {}).get("thread_id", "default"),
+                input={"user_input": user_input},
+            )
+            try:
+                yield root_span
+            except Exception as e:
+                # 记录错误
+                root_span.update(output={"error": str(e)})
+                root_span.update_trace(output={"error": str(e)})
+                raise
+
+    @staticmethod
+    def _record_output(root_span: Any, user_input: str, new_messages: list[BaseMessage]) -> None:
+        """更新根 span 和 trace 的输出."""
+        if root_span is None:
+            return
+        if new_messages:
+            last_message = new_messages[-1]
+            output_content = last_message.content if hasattr(last_message, "content") else str(last_message)
+        else:
+            output_content = "No response"
+        root_span.update(output={"response": output_content})
+        root_span.update_trace(output={"response": output_content})
+
+    def _run_turn(self, state: dict, config: dict) -> list[BaseMessage]:
+        """执行一轮对话，返回本轮结束时的完整消息历史."""
+        if self.stream:
+            return self._stream_turn(state, config)
+
+        result = self.agent_app.invoke(state, config)
+        messages = result.get("messages", [])
+        # 获取新添加的消息
+        new_messages = _messages_after(messages, state["messages"][-1].id)
+
+        # 显示 agent 响应
+        if new_messages:
+            last_message = new_messages[-1]
+            last2message = None if len(new_messages) < 2 else new_messages[-2]
+            if last2message and isinstance(last2message, ToolMessage):
+                print(f"\nTool call: {last2message.to_json()} {last2message.content}")
+            print(f"\nAgent: {last_message.content}")
+        return messages
+
+    def _stream_turn(self, state: dict, config: dict) -> list[BaseMessage]:
+        """流式执行一轮对话：token 和工具调用事件到达即输出."""
+        messages = state["messages"]
+        # 已流式输出的文本，按消息 id 累计
+        streamed: dict[str, str] = {}
+        in_answer = False
+
+        stream_mode = ["messages", "updates", "values"]
+        for mode, payload in self.agent_app.stream(state, config, stream_mode=stream_mode):
+            if mode == "values":
+                messages = payload.get("messages", messages)
+                continue
+            if mode == "messages":
+                chunk, metadata = payload
+                if not isinstance(chunk, AIMessageChunk) or metadata.get("langgraph_node") != "agent":
+                    continue
+                for tool_call_chunk in chunk.tool_call_chunks:
+                    if tool_call_chunk.get("name"):
+                        print(f"\n[调用工具] {tool_call_chunk['name']}", flush=True)
+                if chunk.content:
+                    if not in_answer:
+                        print("\nAgent: ", end="", flush=True)
+                        in_answer = True
+                    print(chunk.content, end="", flush=True)
+                    if chunk.id is not None:
+                        streamed[chunk.id] = streamed.get(chunk.id, "") + chunk.text
+                continue
+
+            # updates 模式：agent/tools 节点执行完毕，输出完整消息
+            for node, update in payload.items():
+                if node not in ("agent", "tools"):
+                    continue
+                for message in (update or {}).get("messages", []):
+                    if isinstance(message, ToolMessage):
+                        print(f"\nTool call: {message.name} {message.content}", flush=True)
+                    elif isinstance(message, AIMessage) and (text := unstreamed_text(message, streamed)):
+                        if message.id in streamed:
+                            # 截断的部分回答：接着已输出的文本补上未完成的原因
+                            print(text, end="", flush=True)
+                        else:
+                            # 未经流式输出的响应（例如模型不支持流式）直接整体打印
+                            print(f"\nAgent: {text}", flush=True)
+            if in_answer:
+                print()
+                in_answer = False
+
+        return messages
+
+
+def _messages_after(messages: list[BaseMessage], message_id: Optional[str]) -> list[BaseMessage]:
+    """返回 id 为 message_id 的消息之后的所有消息."""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].id == message_id:
+            return messages[index + 1:]
+    return []
@@ -0,0 +1,145 @@
+"""Per-turn deadlines shared by the LLM calls, the MCP tool calls and the agent/tools loop.
+
+每轮对话开始时用 ``turn_deadline()`` 设置截止时间（通过 contextvars 传递，LangGraph 的节点线程、
+工具调度线程与 asyncio 任务都会继承）::
+
+    with turn_deadline():                  # 默认读取 AGENT_TURN_TIMEOUT
+        app.invoke({"messages": [...]}, config)
+
+截止时间之内：
+
+- LLM 调用的超时取 min(AGENT_LLM_TIMEOUT, 剩余时间)，流式调用到达截止时间即停止接收；
+  transport 不再发起会超出截止时间的重试或限流等待
+- 工具调用与 MCP ``call_tool`` 的超时取 min(配置的超时, 剩余时间)
+- 到达截止时间后 agent 节点不再调用 LLM 与工具，直接返回带原因的部分回答
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from agent.config import get_turn_timeout
+
+# 截止时间（time.monotonic() 时刻）；None 表示不限制
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("agent_turn_deadline", default=None)
+
+# 未完成的回答在 response_metadata["finish_reason"] 中标明原因
+FINISH_DEADLINE = "deadline"
+FINISH_MAX_TOOL_ROUNDS = "max_tool_rounds"
+
+
+class DeadlineExceeded(TimeoutError):
+    """本轮对话已超过截止时间."""
+
+    def __init__(self, message: str = "已超过本轮的截止时间", partial: str = "", message_id: Optional[str] = None):
+        super().__init__(message)
+        # 超时前已经生成的部分回答及其流式消息的 id（流式调用中断时）
+        self.partial = partial
+        self.message_id = message_id
+
+
+@contextmanager
+def turn_deadline(timeout: Optional[float] = None) -> Iterator[Optional[float]]:
+    """在代码块内限制本轮对话的总耗时，yield 截止时刻.
+
+    Args:
+        timeout: 允许的秒数，默认读取 AGENT_TURN_TIMEOUT；0 或负数表示不限制。
+            外层已有更早的截止时间时保留更早的
+    """
+    timeout = get_turn_timeout() if timeout is None else timeout
+    current = _deadline.get()
+    deadline = current
+    if timeout > 0:
+        candidate = time.monotonic() + timeout
+        deadline = candidate if current is None else min(current, candidate)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """距离截止时间的秒数（可能为负）；未设置截止时间时返回 None."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def clamp(timeout: Optional[float]) -> Optional[float]:
+    """把超时时间限制在剩余时间之内；已超过截止时间时抛出 DeadlineExceeded."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if timeout is None else min(timeout, left)
+
+
+def allows(delay: float) -> bool:
+    """等待 delay 秒之后是否仍在截止时间之内."""
+    left = remaining()
+    return left is None or delay < left
+
+
+def caused_by_deadline(error: BaseException) -> bool:
+    """error 是否由本轮的截止时间引起（包括 SDK 把 DeadlineExceeded 包装成连接错误、请求超时恰逢截止的情况）."""
+    seen: Optional[BaseException] = error
+    while seen is not None:
+        if isinstance(seen, DeadlineExceeded):
+            return True
+        seen = seen.__cause__ or seen.__context__
+    return expired()
+
+
+def current_turn(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """本轮的消息：最后一条 HumanMessage 之后的全部消息."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return messages[index + 1:]
+    return messages
+
+
+def tool_rounds(messages: list[BaseMessage]) -> int:
+    """本轮已经执行的 agent -> tools 轮数."""
+    return sum(1 for message in current_turn(messages) if isinstance(message, AIMessage) and message.tool_calls)
+
+
+def partial_answer(
+    messages: list[BaseMessage], finish_reason: str, reason: str, text: str = "", message_id: Optional[str] = None
+) -> AIMessage:
+    """本轮未能完成时的最终回复：已生成的部分文本（没有时列出本轮已获得的工具结果）与未完成的原因.
+
+    message_id 为已流式输出 text 的消息 id：回复沿用它，并以 text 开头（见 unstreamed_text）。
+    """
+    parts = [text] if text else []
+    if not text:
+        results = [
+            f"- {message.name}: {str(message.content)[:200]}"
+            for message in current_turn(messages)
+            if isinstance(message, ToolMessage) and message.status != "error"
+        ]
+        if results:
+            parts.append("已获得的工具结果：\n" + "\n".join(results))
+    parts.append(f"（本轮未完成：{reason}）")
+    return AIMessage(content="\n\n".join(parts), id=message_id, response_metadata={"finish_reason": finish_reason})
+
+
+def unstreamed_text(message: AIMessage, streamed: dict[str, str]) -> str:
+    """message 中还没有以流式 chunk 输出的文本.
+
+    streamed 为已输出的文本（按消息 id 累计）。正常完成的消息已全部输出；部分回答沿用被中断的流式消息的 id，
+    只剩末尾未完成的原因需要补上。
+    """
+    text = message.text
+    prefix = streamed.get(message.id) if message.id is not None else None
+    if prefix is None:
+        return text
+    return text[len(prefix):] if text.startswith(prefix) else ""
@@ -0,0 +1,28 @@
+"""DeepSeek chat model: ChatOpenAI that keeps DeepSeek-specific usage fields when streaming.
+
+DeepSeek 在 usage 中返回上下文缓存的命中情况（``prompt_cache_hit_tokens`` /
+``prompt_cache_miss_tokens``）。非流式调用时它们保留在 ``response_metadata["token_usage"]`` 中，
+流式调用时 langchain-openai 只把 usage 转换为 ``usage_metadata``，这两个字段会丢失；
+这里把流式的原始 usage 同样写入 ``response_metadata["token_usage"]``。
+"""
+
+from typing import Any, Optional
+
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+
+
+class ChatDeepSeek(ChatOpenAI):
+    """保留 DeepSeek 原始 usage 的 ChatOpenAI."""
+
+    def _convert_chunk_to_generation_chunk(
+        self,
+        chunk: dict,
+        default_chunk_class: type,
+        base_generation_info: Optional[dict],
+    ) -> Optional[ChatGenerationChunk]:
+        generation_chunk = super()._convert_chunk_to_generation_chunk(chunk, default_chunk_class, base_generation_info)
+        token_usage: Any = chunk.get("usage")
+        if generation_chunk is not None and token_usage:
+            generation_chunk.message.response_metadata["token_usage"] = token_usage
+        return generation_chunk
@@ -1,85 +1,247 @@
 """LangGraph agent graph definition."""
 
-from agent.mcp.tools import get_mcp_tools_sync
+from agent.mcp.discovery import refresh_in_background
+from agent.mcp.tools import get_mcp_tools_sync, load_mcp_tools
+from agent.blobs import READ_BLOB_TOOL_NAME, create_read_blob_tool, get_blob_store
 from agent.config import (
+    get_blob_inline_max_chars,
     get_deepseek_api_key,
     get_deepseek_base_url,
     get_deepseek_model,
-    get_langfuse_public_key,
-    get_langfuse_secret_key,
-    get_langfuse_host,
+    get_llm_timeout,
+    get_max_tool_rounds,
+    get_parallel_tools_enabled,
+    get_speculative_tools_enabled,
+    get_streaming_enabled,
+    get_system_prompt,
 )
-from typing import Annotated, TypedDict
-
-from langchain_core.messages import BaseMessage, ToolMessage
-from langchain_openai import ChatOpenAI
+from agent.cache import ResponseCache, create_response_cache, make_cache_key
+from agent.checkpoint import acreate_checkpointer, create_checkpointer
+from agent.deadline import (
+    FINISH_DEADLINE,
+    FINISH_MAX_TOOL_ROUNDS,
+    DeadlineExceeded,
+    caused_by_deadline,
+    clamp,
+    expired,
+    partial_answer,
+    remaining,
+    tool_rounds,
+)
+from agent.history import HistoryCompactor
+from agent.logs import configure_logging
+from agent.metrics import get_metrics
+from agent.prompt import PromptAssembler, PromptCacheTracker, prompt_cache_usage
+from agent.routing import DEFAULT_ROUTE, ModelRoute, ModelRouter, record_route_usage
+from agent.tool_dispatch import ParallelToolNode
+from agent.tracing import MessagesRef, Span, get_tracer
+from collections.abc import Generator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Annotated, Any, Callable, Iterator, NotRequired, Optional, TypedDict
+
+from langchain_core.messages import AIMessageChunk, BaseMessage, ToolMessage, message_chunk_to_message
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+import asyncio
+import functools
 import logging
-import sys
-from pathlib import Path
+import time
 from langgraph.graph.message import add_messages
+from pydantic import SecretStr
 
-# Langfuse 集成
-try:
-    from langfuse import Langfuse
-    LANGFUSE_AVAILABLE = True
-except ImportError:
-    LANGFUSE_AVAILABLE = False
-    Langfuse = None
-
-# 配置 logger 写入 agent.log 文件
+# agent 包的日志经由队列写入 agent.log（后台线程写文件并按大小/时间轮转），不阻塞 agent 循环
+configure_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# 如果 logger 还没有 handler，添加 FileHandler（写入文件）
-if not logger.handlers:
-    # 创建日志文件路径
-    log_file = Path("agent.log")
-
-    # 添加 FileHandler（写入文件）
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-    # 防止日志传播到根 logger（避免重复输出）
-    logger.propagate = False
-
-
-# 初始化 Langfuse 客户端
-_langfuse_client: Langfuse | None = None
-
-
-def get_langfuse_client() -> Langfuse | None:
-    """获取 Langfuse 客户端实例."""
-    global _langfuse_client
-    if _langfuse_client is None:
-        public_key = get_langfuse_public_key()
-        secret_key = get_langfuse_secret_key()
-        if public_key and secret_key:
-            _langfuse_client = Langfuse(
-                public_key=public_key,
-                secret_key=secret_key,
-                host=get_langfuse_host(),
-            )
-            logger.info("Langfuse 客户端初始化成功")
-        else:
-            logger.warning("Langfuse 配置未设置，将不使用 tracing 功能")
-    return _langfuse_client
+
+
+@dataclass
+class _StreamProgress:
+    """一次流式 LLM 调用是否已经向调用方输出了内容（文本或工具调用）."""
+
+    emitted: bool = False
+
+    def feed(self, chunk: AIMessageChunk) -> None:
+        # 与 console / SSE 的输出规则一致：只有文本与工具调用 chunk 会被输出
+        if chunk.content or chunk.tool_call_chunks:
+            self.emitted = True
 
 
 class AgentState(TypedDict):
     """Agent state definition."""
     messages: Annotated[list[BaseMessage], add_messages]
+    # 本轮使用的模型路由（启用 AGENT_MODEL_ROUTES 时由 route 节点写入）
+    model_route: NotRequired[str]
+
+
+@contextmanager
+def _traced_generation(messages: list[BaseMessage], model: str) -> Iterator[Optional[Span]]:
+    """为一次 LLM 调用创建 generation span（未启用或未被采样时返回 None）.
+
+    只保存消息列表的引用，摘要与截断在后台导出线程中完成。
+    """
+    with get_tracer().span(
+        "llm_call",
+        kind="generation",
+        model=model,
+        input=MessagesRef(messages),
+    ) as generation:
+        yield generation
+
+
+def _usage_details(response: BaseMessage) -> dict[str, int]:
+    """从响应中提取 token 用量（兼容非流式的 token_usage 与流式的 usage_metadata）."""
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        usage = {
+            "input": usage_metadata.get("input_tokens", 0),
+            "output": usage_metadata.get("output_tokens", 0),
+            "total": usage_metadata.get("total_tokens", 0),
+        }
+    else:
+        token_usage = getattr(response, "response_metadata", {}).get("token_usage") or {}
+        usage = {key: value for key, value in token_usage.items() if isinstance(value, int)}
+    # DeepSeek 上下文缓存命中的 prompt token（Langfuse 按 usage_details 的键分别统计与计费）
+    cache_usage = prompt_cache_usage(response)
+    if cache_usage is not None:
+        usage["input_cache_read"], usage["input_cache_miss"] = cache_usage
+    return usage
+
+
+def _record_response(generation: Any, response: BaseMessage) -> None:
+    """把 LLM 响应（流式调用时为聚合后的完整响应）写入 generation span."""
+    if generation is None:
+        return
+    output_content = response.content if hasattr(response, "content") else str(response)
+    generation.update(output={"content": output_content})
+
+    # 如果有 token 使用信息，可以添加
+    usage = _usage_details(response)
+    if usage:
+        generation.update(usage_details=usage)
+
+
+def _record_first_token(generation: Any, model: str, started: float) -> None:
+    """记录首个 token 的到达时间（time-to-first-token）."""
+    get_metrics().llm_ttft.observe(time.perf_counter() - started, model)
+    if generation is not None:
+        generation.update(completion_start_time=time.time())
+
+
+def _record_llm_metrics(response: BaseMessage, model: str, started: float) -> None:
+    """记录一次实际发出的 LLM 调用的耗时与 token 数."""
+    metrics = get_metrics()
+    metrics.llm_latency.observe(time.perf_counter() - started, model)
+    usage = _usage_details(response)
+    prompt_tokens = usage.get("input", usage.get("prompt_tokens"))
+    completion_tokens = usage.get("output", usage.get("completion_tokens"))
+    if prompt_tokens is not None:
+        metrics.llm_tokens.observe(prompt_tokens, model, "prompt")
+    if completion_tokens is not None:
+        metrics.llm_tokens.observe(completion_tokens, model, "completion")
+
+
+def _timed_node(name: str, func: Callable, afunc: Callable) -> RunnableLambda:
+    """包装 graph 节点，记录每次执行的耗时（保留原函数签名，RunnableLambda 据此决定是否传入 config）."""
+    histogram = get_metrics().node_latency
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        with histogram.time(name):
+            return func(*args, **kwargs)
+
+    @functools.wraps(afunc)
+    async def atimed(*args, **kwargs):
+        with histogram.time(name):
+            return await afunc(*args, **kwargs)
+
+    return RunnableLambda(timed, afunc=atimed, name=name)
+
+
+def _record_cache_usage(generation: Any, cache: Optional[ResponseCache], cache_key: Optional[str], hit: bool) -> None:
+    """把响应缓存的命中情况和累计计数写入 generation span."""
+    if generation is None or cache is None or cache_key is None:
+        return
+    generation.update(metadata={"llm_cache": {"hit": hit, **cache.stats.as_dict()}})
+
+
+def _merge_chunks(response: Optional[AIMessageChunk], chunk: AIMessageChunk) -> AIMessageChunk:
+    return chunk if response is None else response + chunk
+
+
+def _stream_result(chunks: Optional[AIMessageChunk]) -> BaseMessage:
+    """把合并后的 chunk 转为完整消息；流中没有任何 chunk 时报错（与 BaseChatModel 的行为一致）."""
+    if chunks is None:
+        raise ValueError("LLM 的流式输出为空")
+    return message_chunk_to_message(chunks)
+
+
+def create_agent_graph(
+    history_compactor: Optional[HistoryCompactor] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    response_cache: Optional[ResponseCache] = None,
+    model_router: Optional[ModelRouter] = None,
+):
+    """Create and return the agent graph.
+
+    The compiled graph supports both ``invoke``/``stream`` and ``ainvoke``/``astream``.
+
+    Args:
+        history_compactor: 每次 LLM 调用前压缩历史的组件；默认按环境变量创建
+        checkpointer: 按 thread_id 保存对话状态的 checkpointer；默认按环境变量创建
+        response_cache: 位于 LLM 调用之前的响应缓存；默认按环境变量创建
+        model_router: 为每轮对话在多个模型之间选择的路由；默认按环境变量创建（未配置时只使用一个模型）
+    """
+    # 加载 MCP 工具
+    try:
+        mcp_tools = get_mcp_tools_sync(refresh=False)
+        logger.info(f"加载了 {len(mcp_tools)} 个 MCP 工具")
+    except Exception as e:
+        logger.warning(f"加载 MCP 工具失败: {e}，将不使用工具调用功能")
+        mcp_tools = []
+
+    if checkpointer is None:
+        checkpointer = create_checkpointer()
+    app = _build_graph(mcp_tools, history_compactor, checkpointer, response_cache, model_router)
+    if mcp_tools:
+        # 工具可能来自磁盘缓存：graph 就绪后再在后台校验缓存并预热会话池
+        refresh_in_background()
+    return app
+
+
+async def acreate_agent_graph(
+    history_compactor: Optional[HistoryCompactor] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    response_cache: Optional[ResponseCache] = None,
+    model_router: Optional[ModelRouter] = None,
+):
+    """Create and return the agent graph without blocking the running event loop."""
+    try:
+        mcp_tools = await load_mcp_tools(refresh=False)
+        logger.info(f"加载了 {len(mcp_tools)} 个 MCP 工具")
+    except Exception as e:
+        logger.warning(f"加载 MCP 工具失败: {e}，将不使用工具调用功能")
+        mcp_tools = []
+
+    if checkpointer is None:
+        checkpointer = await acreate_checkpointer()
+    app = _build_graph(mcp_tools, history_compactor, checkpointer, response_cache, model_router)
+    if mcp_tools:
+        refresh_in_background()
+    return app
 
 
-def create_agent_graph():
-    """Create and return the agent graph."""
+def _build_graph(
+    mcp_tools: list,
+    history_compactor: Optional[HistoryCompactor] = None,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    response_cache: Optional[ResponseCache] = None,
+    model_router: Optional[ModelRouter] = None,
+):
+    """Build and compile the agent/tools graph around the given tools."""
     # 获取配置
     api_key = get_deepseek_api_key()
     if not api_key:
@@ -88,86 +250,339 @@ def create_agent_graph():
             "请在 .env 文件中设置 DEEPSEEK_API_KEY，或通过环境变量设置。"
         )
 
-    # 加载 MCP 工具
-    try:
-        mcp_tools = get_mcp_tools_sync()
-        logger.info(f"加载了 {len(mcp_tools)} 个 MCP 工具")
-    except Exception as e:
-        logger.warning(f"加载 MCP 工具失败: {e}，将不使用工具调用功能")
-        mcp_tools = []
-
     # 创建 DeepSeek LLM 实例
-    # DeepSeek 使用与 OpenAI 兼容的 API
-    llm = ChatOpenAI(
-        model=get_deepseek_model(),
-        base_url=get_deepseek_base_url(),
-        api_key=api_key,
-        temperature=0.7,
-    )
+    # DeepSeek 使用与 OpenAI 兼容的 API（langchain_openai 导入较慢，在此处才加载）
+    from agent.deepseek import ChatDeepSeek
+    from agent.llm_transport import get_async_http_client, get_http_client
+
+    def make_llm(model_name: str, **overrides: Any) -> ChatDeepSeek:
+        # 共享的 HTTP 连接池；重试与限流由 transport 负责，因此关闭 SDK 自身的重试
+        options = {"temperature": 0.7, "timeout": get_llm_timeout(), **overrides}
+        return ChatDeepSeek(
+            model=model_name,
+            base_url=get_deepseek_base_url(),
+            api_key=SecretStr(api_key),
+            stream_usage=True,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            max_retries=0,
+            **options,
+        )
 
-    # 如果有工具，绑定到 LLM
-    if mcp_tools:
-        llm_with_tools = llm.bind_tools(mcp_tools)
-    else:
-        llm_with_tools = llm
+    # 模型级联：AGENT_MODEL_ROUTES 按从便宜到强的顺序配置多个模型，route 节点为每轮选择其一；
+    # 未配置时只有一档 DEEPSEEK_MODEL
+    if model_router is None:
+        model_router = ModelRouter.from_config(lambda name: make_llm(name, temperature=0.0, max_tokens=4))
+    routes = model_router.routes if model_router is not None else [ModelRoute(DEFAULT_ROUTE, get_deepseek_model())]
+    llms = {route.name: make_llm(route.model) for route in routes}
+    default_route = routes[-1].name
+    # 历史摘要交给最便宜的一档
+    llm = llms[routes[0].name]
+    streaming = get_streaming_enabled()
+    if history_compactor is None:
+        history_compactor = HistoryCompactor.from_config(llm)
+
+    # 响应缓存（key 包含绑定的工具 schema，工具变化后旧缓存自然失效）
+    if response_cache is None:
+        response_cache = create_response_cache()
+    if response_cache is not None:
+        get_metrics().register_cache("llm_response", response_cache.stats)
+    # 过长的工具结果保存在 blob 存储中，LLM 可以通过 read_blob 分段读取完整内容
+    blob_store = get_blob_store()
+    if mcp_tools and blob_store is not None and all(tool.name != READ_BLOB_TOOL_NAME for tool in mcp_tools):
+        mcp_tools = [*mcp_tools, create_read_blob_tool(blob_store, get_blob_inline_max_chars())]
+    # 工具按名称排序：工具 schema 属于 prompt 前缀，顺序变化会使 DeepSeek 的上下文缓存失效
+    mcp_tools = sorted(mcp_tools, key=lambda tool: tool.name)
+    tools_schema = [convert_to_openai_tool(tool) for tool in mcp_tools]
 
-    def call_model(state: AgentState) -> AgentState:
+    # 如果有工具，绑定到 LLM
+    bound_llms = {name: route_llm.bind_tools(mcp_tools) if mcp_tools else route_llm for name, route_llm in llms.items()}
+    # 本轮的工具调用达到 AGENT_MAX_TOOL_ROUNDS 轮后，最后一次调用仍携带相同的工具 schema（不破坏 prompt 前缀），
+    # 但以 tool_choice="none" 要求模型直接回答
+    max_tool_rounds = get_max_tool_rounds()
+    answer_llms = {
+        name: route_llm.bind_tools(mcp_tools, tool_choice="none") if mcp_tools else route_llm
+        for name, route_llm in llms.items()
+    }
+
+    # 固定的 system prompt 位于每次请求的开头；上下文缓存的命中情况按会话累计
+    prompt_assembler = PromptAssembler(get_system_prompt())
+    prompt_cache = PromptCacheTracker()
+    get_metrics().cache_hit_ratio.register("llm_prompt", lambda: {("llm_prompt",): prompt_cache.hit_ratio})
+
+    # 同一轮的多个工具调用并发执行；开启投机执行时，参数完整的调用在 LLM 流式输出期间就启动
+    parallel_node = ParallelToolNode(mcp_tools) if mcp_tools and get_parallel_tools_enabled() else None
+    speculative_node = parallel_node if streaming and get_speculative_tools_enabled() else None
+
+    def request_options() -> dict[str, Any]:
+        # 设置了本轮截止时间时，单次请求的超时不超过剩余时间（已超过时抛出 DeadlineExceeded）
+        return {} if remaining() is None else {"timeout": clamp(get_llm_timeout())}
+
+    def invoke_llm(
+        messages: list[BaseMessage],
+        route: str,
+        generation: Any,
+        config: RunnableConfig,
+        final: bool = False,
+        progress: Optional[_StreamProgress] = None,
+    ) -> BaseMessage:
+        model = llms[route].model_name
+        runnable = (answer_llms if final else bound_llms)[route]
+        started = time.perf_counter()
+        response: BaseMessage
+        if not streaming:
+            response = runnable.invoke(messages, **request_options())
+        else:
+            # 逐块流式接收；LangGraph 的 "messages" 流模式会把每个 chunk 转发给调用方
+            chunks: Optional[AIMessageChunk] = None
+            streamed: Optional[BaseMessage] = None
+            speculation = speculative_node.speculate(config) if speculative_node and not final else None
+            stream = None
+            try:
+                stream = runnable.stream(messages, **request_options())
+                for chunk in stream:
+                    if not isinstance(chunk, AIMessageChunk):
+                        continue
+                    if chunks is None:
+                        _record_first_token(generation, model, started)
+                    chunks = _merge_chunks(chunks, chunk)
+                    if progress is not None:
+                        progress.feed(chunk)
+                    if speculation is not None:
+                        speculation.feed(chunk)
+                    if expired():
+                        # 到达截止时间：已收到的内容作为部分回答（沿用流式消息的 id，调用方不会重复输出）
+                        raise DeadlineExceeded(partial=chunks.text, message_id=chunks.id)
+                streamed = _stream_result(chunks)
+            finally:
+                # 提前退出时立即关闭流（断开连接），不等生成器被回收
+                if isinstance(stream, Generator):
+                    stream.close()
+                if speculation is not None:
+                    speculation.finish(streamed)
+            response = streamed
+        record_llm_call(response, route, started)
+        return response
+
+    async def ainvoke_llm(
+        messages: list[BaseMessage],
+        route: str,
+        generation: Any,
+        config: RunnableConfig,
+        final: bool = False,
+        progress: Optional[_StreamProgress] = None,
+    ) -> BaseMessage:
+        model = llms[route].model_name
+        runnable = (answer_llms if final else bound_llms)[route]
+        started = time.perf_counter()
+        response: BaseMessage
+        if not streaming:
+            try:
+                async with asyncio.timeout(remaining()):
+                    response = await runnable.ainvoke(messages, **request_options())
+            except TimeoutError as e:
+                if not expired():
+                    raise
+                raise DeadlineExceeded() from e
+        else:
+            chunks: Optional[AIMessageChunk] = None
+            streamed: Optional[BaseMessage] = None
+            speculation = (
+                speculative_node.speculate(config, asynchronous=True) if speculative_node and not final else None
+            )
+            try:
+                # 到达截止时间时取消流式请求，已收到的内容作为部分回答
+                async with asyncio.timeout(remaining()):
+                    async for chunk in runnable.astream(messages, **request_options()):
+                        if not isinstance(chunk, AIMessageChunk):
+                            continue
+                        if chunks is None:
+                            _record_first_token(generation, model, started)
+                        chunks = _merge_chunks(chunks, chunk)
+                        if progress is not None:
+                            progress.feed(chunk)
+                        if speculation is not None:
+                            speculation.feed(chunk)
+                streamed = _stream_result(chunks)
+            except TimeoutError as e:
+                if not expired():
+                    raise
+                if chunks is None:
+                    raise DeadlineExceeded() from e
+                raise DeadlineExceeded(partial=chunks.text, message_id=chunks.id) from e
+            finally:
+                if speculation is not None:
+                    speculation.finish(streamed)
+            response = streamed
+        record_llm_call(response, route, started)
+        return response
+
+    def record_llm_call(response: BaseMessage, route: str, started: float) -> None:
+        _record_llm_metrics(response, llms[route].model_name, started)
+        if model_router is not None:
+            record_route_usage(route, _usage_details(response), time.perf_counter() - started)
+
+    def current_route(state: AgentState) -> str:
+        route = state.get("model_route")
+        return route if route in llms else default_route
+
+    def escalation(route: str, error: Exception, progress: _StreamProgress) -> Optional[str]:
+        """较便宜的模型调用失败时升级到的路由.
+
+        已是最强的模型（或未启用路由）、失败由截止时间引起，或失败前已经向调用方流式输出了部分内容
+        （重新生成的回答会接在已输出的内容之后）时返回 None。
+        """
+        if model_router is None or route == model_router.strongest.name or caused_by_deadline(error):
+            return None
+        if progress.emitted:
+            logger.warning(f"模型 {llms[route].model_name} 在流式输出中途失败，已输出部分内容，不再升级: {error}")
+            return None
+        logger.warning(f"模型 {llms[route].model_name} 调用失败，升级到 {model_router.strongest.model}: {error}")
+        return model_router.escalate("llm_error").route
+
+    def cache_key_for(
+        messages: list[BaseMessage], route: str, config: RunnableConfig, final: bool = False
+    ) -> Optional[str]:
+        """计算响应缓存 key；未启用缓存或本次调用要求绕过缓存（llm_cache=False）时返回 None."""
+        if response_cache is None or not config.get("configurable", {}).get("llm_cache", True):
+            return None
+        tools = [*tools_schema, {"tool_choice": "none"}] if final and tools_schema else tools_schema
+        return make_cache_key(llms[route].model_name, llms[route].temperature, tools, messages)
+
+    def record_prompt_cache(response: BaseMessage, route: str, config: RunnableConfig, generation: Any) -> None:
+        thread_id = config.get("configurable", {}).get("thread_id")
+        prompt_cache.record(response, llms[route].model_name, thread_id, generation)
+
+    def incomplete(
+        state: AgentState, finish_reason: str, text: str = "", message_id: Optional[str] = None
+    ) -> AgentState:
+        """本轮无法正常完成（到达截止时间或工具轮数上限）时返回的部分回答.
+
+        text 已经流式输出时传入该流式消息的 id，部分回答沿用它，调用方只需补上未完成的原因。
+        """
+        if finish_reason == FINISH_DEADLINE:
+            reason = "已超过本轮的截止时间"
+        else:
+            reason = f"工具调用已达到 {max_tool_rounds} 轮上限"
+        get_metrics().turns_incomplete.inc(finish_reason)
+        logger.warning(f"本轮返回部分回答: {reason}", extra={"finish_reason": finish_reason})
+        return {"messages": [partial_answer(state["messages"], finish_reason, reason, text, message_id)]}
+
+    def finish_call(
+        state: AgentState,
+        route: str,
+        config: RunnableConfig,
+        generation: Any,
+        response: BaseMessage,
+        cache_key: Optional[str],
+        cached: bool,
+        final: bool = False,
+    ) -> AgentState:
+        if not cached:
+            record_prompt_cache(response, route, config, generation)
+            if cache_key and response_cache is not None:
+                response_cache.update(cache_key, response)
+        _record_response(generation, response)
+        if generation is not None and model_router is not None:
+            generation.update(model=llms[route].model_name, metadata={"model_route": route})
+        if final and getattr(response, "tool_calls", None):
+            # 模型没有遵守 tool_choice="none"：不再执行工具，已生成的文本作为部分回答
+            update = incomplete(state, FINISH_MAX_TOOL_ROUNDS, response.text, response.id)
+        else:
+            # 返回新消息（LangGraph 会自动追加到现有消息列表）
+            update = {"messages": [response]}
+        # 升级后的路由写回状态，本轮后续调用沿用
+        if model_router is not None:
+            update["model_route"] = route
+        return update
+
+    def call_model(state: AgentState, config: RunnableConfig) -> AgentState:
         """Call DeepSeek LLM with conversation history."""
-        langfuse = get_langfuse_client()
-
-        # 使用 Langfuse 包装 LLM 调用
-        if langfuse and LANGFUSE_AVAILABLE:
-            # 准备输入消息
-            input_messages = []
-            for msg in state["messages"]:
-                if hasattr(msg, "content"):
-                    input_messages.append(msg.content)
-                else:
-                    input_messages.append(str(msg))
-
-            # 使用 context manager 创建 generation span，自动嵌套到当前 trace
-            with langfuse.start_as_current_observation(
-                as_type="generation",
-                name="llm_call",
-                model=get_deepseek_model(),
-                input={"messages": input_messages},
-            ) as generation:
+        if expired():
+            return incomplete(state, FINISH_DEADLINE)
+        route = current_route(state)
+        final = bool(mcp_tools) and tool_rounds(state["messages"]) >= max_tool_rounds
+        messages = prompt_assembler.build(state["messages"])
+        cache_key = cache_key_for(messages, route, config, final)
+        with _traced_generation(messages, llms[route].model_name) as generation:
+            cached = response_cache.lookup(cache_key) if response_cache is not None and cache_key else None
+            _record_cache_usage(generation, response_cache, cache_key, cached is not None)
+            if cached is not None:
+                return finish_call(state, route, config, generation, cached, cache_key, cached=True, final=final)
+            progress = _StreamProgress()
+            try:
                 try:
-                    # 调用 LLM
-                    response = llm_with_tools.invoke(state["messages"])
-
-                    # 更新 generation 的输出
-                    output_content = response.content if hasattr(response, "content") else str(response)
-                    generation.update(output={"content": output_content})
-
-                    # 如果有 token 使用信息，可以添加
-                    if hasattr(response, "response_metadata"):
-                        metadata = response.response_metadata
-                        if "token_usage" in metadata:
-                            generation.update(usage=metadata["token_usage"])
+                    response = invoke_llm(messages, route, generation, config, final, progress)
                 except Exception as e:
-                    # 记录错误
-                    generation.update(
-                        output={"error": str(e)},
-                        level="ERROR",
-                    )
+                    if (escalated := escalation(route, e, progress)) is None:
+                        raise
+                    route, cache_key = escalated, cache_key_for(messages, escalated, config, final)
+                    response = invoke_llm(messages, route, generation, config, final)
+            except Exception as e:
+                if not caused_by_deadline(e):
                     raise
-        else:
-            # 没有 Langfuse 时，直接调用
-            response = llm_with_tools.invoke(state["messages"])
-
-        # 返回新消息（LangGraph 会自动追加到现有消息列表）
-        return {"messages": [response]}
+                return incomplete(state, FINISH_DEADLINE, getattr(e, "partial", ""), getattr(e, "message_id", None))
+            return finish_call(state, route, config, generation, response, cache_key, cached=False, final=final)
+
+    async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
+        """Call DeepSeek LLM with conversation history (async)."""
+        if expired():
+            return incomplete(state, FINISH_DEADLINE)
+        route = current_route(state)
+        final = bool(mcp_tools) and tool_rounds(state["messages"]) >= max_tool_rounds
+        messages = prompt_assembler.build(state["messages"])
+        cache_key = cache_key_for(messages, route, config, final)
+        with _traced_generation(messages, llms[route].model_name) as generation:
+            cached = response_cache.lookup(cache_key) if response_cache is not None and cache_key else None
+            _record_cache_usage(generation, response_cache, cache_key, cached is not None)
+            if cached is not None:
+                return finish_call(state, route, config, generation, cached, cache_key, cached=True, final=final)
+            progress = _StreamProgress()
+            try:
+                try:
+                    response = await ainvoke_llm(messages, route, generation, config, final, progress)
+                except Exception as e:
+                    if (escalated := escalation(route, e, progress)) is None:
+                        raise
+                    route, cache_key = escalated, cache_key_for(messages, escalated, config, final)
+                    response = await ainvoke_llm(messages, route, generation, config, final)
+            except Exception as e:
+                if not caused_by_deadline(e):
+                    raise
+                return incomplete(state, FINISH_DEADLINE, getattr(e, "partial", ""), getattr(e, "message_id", None))
+            return finish_call(state, route, config, generation, response, cache_key, cached=False, final=final)
 
     # 创建图
     workflow = StateGraph(AgentState)
 
-    # 添加节点
-    workflow.add_node("agent", call_model)
+    # 添加节点（同时提供同步与异步实现，invoke/ainvoke 各走各的路径）
+    # 每个节点的耗时记录在 agent_node_seconds 中
+    workflow.add_node("agent", _timed_node("agent", call_model, acall_model))
+    llm_entry = "agent"
+
+    # 每轮开始时选择模型，本轮工具调用失败时升级
+    if model_router is not None:
+        workflow.add_node("route", _timed_node("route", model_router.node, model_router.anode))
+        workflow.add_edge("route", llm_entry)
+        llm_entry = "route"
+
+    # 每次调用 LLM 之前先压缩历史
+    if history_compactor is not None:
+        workflow.add_node(
+            "compact",
+            _timed_node("compact", history_compactor.node, history_compactor.anode),
+        )
+        workflow.add_edge("compact", llm_entry)
+        llm_entry = "compact"
+    workflow.set_entry_point(llm_entry)
 
     # 如果有工具，添加工具调用节点
     if mcp_tools:
-        tool_node = ToolNode(mcp_tools)
+        tool_node: Runnable
+        if parallel_node is not None:
+            tool_node = _timed_node("tools", parallel_node.invoke, parallel_node.ainvoke)
+        else:
+            tool_node = ToolNode(mcp_tools)
         workflow.add_node("tools", tool_node)
 
         # 添加条件边：根据是否有工具调用来决定下一步
@@ -180,9 +595,6 @@ def create_agent_graph():
                 return "tools"
             return "end"
 
-        # 设置入口点
-        workflow.set_entry_point("agent")
-
         # 从 agent 节点添加条件边
         workflow.add_conditional_edges(
             "agent",
@@ -193,14 +605,15 @@ def create_agent_graph():
             },
         )
 
-        # 从 tools 节点返回到 agent 节点
-        workflow.add_edge("tools", "agent")
+        # 从 tools 节点返回到 agent 节点（先经过历史压缩）
+        workflow.add_edge("tools", llm_entry)
     else:
         # 没有工具时，直接连接 agent 到 END
-        workflow.set_entry_point("agent")
         workflow.add_edge("agent", END)
 
-    # 编译图
-    app = workflow.compile()
+    # 编译图（配置了 checkpointer 时，状态按 thread_id 持久化，每轮只需传入新消息）
+    # 每轮工具调用最多经过 compact/route/agent/tools 四个节点；递归上限留出 AGENT_MAX_TOOL_ROUNDS 轮与最后的回答
+    recursion_limit = max(25, 4 * (max_tool_rounds + 1) + 1)
+    app = workflow.compile(checkpointer=checkpointer).with_config(recursion_limit=recursion_limit)
 
     return app
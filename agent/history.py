@@ -0,0 +1,240 @@
+"""Token-budgeted compaction of the conversation history kept in AgentState."""
+
+import logging
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from agent.blobs import blob_ref, release_blobs
+from agent.config import (
+    get_history_max_tokens,
+    get_history_summary_enabled,
+    get_history_target_ratio,
+    get_tool_result_max_chars,
+)
+
+logger = logging.getLogger(__name__)
+
+# 滚动摘要消息使用固定 id，便于后续轮次识别和更新
+SUMMARY_MESSAGE_ID = "history-summary"
+
+SUMMARY_PROMPT = (
+    "你负责压缩对话历史。请把下面的早期对话与已有摘要合并为一份简洁的中文摘要，"
+    "保留用户的目标、关键事实、工具调用得到的结论和尚未解决的问题，不要超过 {max_tokens} 个 token。"
+)
+
+
+def group_messages(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """把消息切分为不可拆分的单元.
+
+    带 tool_calls 的 AIMessage 与紧随其后的 ToolMessage 属于同一单元，
+    其余消息各自成为一个单元。
+    """
+    groups: list[list[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and groups and _expects_tool_results(groups[-1]):
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+def _expects_tool_results(group: list[BaseMessage]) -> bool:
+    head = group[0]
+    return isinstance(head, AIMessage) and bool(head.tool_calls)
+
+
+def _current_turn_start(groups: list[list[BaseMessage]]) -> int:
+    """当前轮第一个单元的下标：最后一条 HumanMessage 所在的单元；没有 HumanMessage 时为最后一个单元."""
+    for index in range(len(groups) - 1, -1, -1):
+        if isinstance(groups[index][0], HumanMessage):
+            return index
+    return max(0, len(groups) - 1)
+
+
+def _truncate_tool_result(message: ToolMessage, max_chars: int) -> ToolMessage:
+    content = message.content
+    if not isinstance(content, str) or len(content) <= max_chars:
+        return message
+    omitted = len(content) - max_chars
+    ref = blob_ref(message)
+    # 完整内容在 blob 中时保留引用，LLM 仍可通过 read_blob 读取
+    where = f"，完整内容保存在 blob {ref['blob']}" if ref is not None else ""
+    return message.model_copy(update={"content": f"{content[:max_chars]}\n…[已截断 {omitted} 个字符{where}]"})
+
+
+def _render_for_summary(messages: list[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(f"{call['name']}({call['args']})" for call in message.tool_calls)
+            lines.append(f"assistant: {message.content} [调用工具 {calls}]")
+        else:
+            lines.append(f"{message.type}: {message.content}")
+    return "\n".join(lines)
+
+
+class HistoryCompactor:
+    """在每次 LLM 调用前把消息历史压缩到 token 预算之内.
+
+    历史在预算之内时保持原样（只在末尾追加），使发送给 LLM 的前缀在多轮之间不变、持续命中
+    DeepSeek 的上下文缓存。超出预算时一次性压缩到 ``max_tokens * target_ratio``，
+    之后若干轮又可以只追加。压缩时依次执行三种策略：
+
+    1. 截断较早轮次中过长的工具结果（当前轮的工具结果保持完整）
+    2. 从最早的消息单元开始丢弃，直到总量落入目标；开头的 SystemMessage 始终保留
+    3. （可选）把丢弃的消息交给 LLM 合并进一条滚动摘要
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        max_tool_result_chars: int = 0,
+        summary_llm: Optional[BaseChatModel] = None,
+        summary_max_tokens: int = 512,
+        token_counter: Callable[[list[BaseMessage]], int] = count_tokens_approximately,
+        target_ratio: float = 1.0,
+    ):
+        """初始化压缩器.
+
+        Args:
+            max_tokens: 发送给 LLM 的历史 token 上限
+            max_tool_result_chars: 较早工具结果的最大字符数，0 表示不截断
+            summary_llm: 生成滚动摘要的模型，None 表示直接丢弃超出预算的消息
+            summary_max_tokens: 为摘要预留的 token 数
+            token_counter: token 计数函数
+            target_ratio: 压缩后保留的历史占预算的比例（越小改写越少、每次改写丢弃越多）
+        """
+        self.max_tokens = max_tokens
+        self.max_tool_result_chars = max_tool_result_chars
+        self.summary_llm = summary_llm
+        self.summary_max_tokens = summary_max_tokens
+        self.token_counter = token_counter
+        self.target_ratio = min(1.0, max(0.1, target_ratio))
+
+    @classmethod
+    def from_config(cls, llm: BaseChatModel) -> Optional["HistoryCompactor"]:
+        """按环境变量创建压缩器；预算为 0 时返回 None（不压缩）."""
+        max_tokens = get_history_max_tokens()
+        if max_tokens <= 0:
+            return None
+        return cls(
+            max_tokens=max_tokens,
+            max_tool_result_chars=get_tool_result_max_chars(),
+            summary_llm=llm if get_history_summary_enabled() else None,
+            target_ratio=get_history_target_ratio(),
+        )
+
+    def _plan(self, messages: list[BaseMessage]) -> Optional[dict[str, Any]]:
+        """计算压缩方案；无需改动时返回 None."""
+        pinned: list[BaseMessage] = []
+        summary: Optional[BaseMessage] = None
+        index = 0
+        while index < len(messages) and isinstance(messages[index], SystemMessage):
+            if messages[index].id == SUMMARY_MESSAGE_ID:
+                summary = messages[index]
+            else:
+                pinned.append(messages[index])
+            index += 1
+
+        budget = self.max_tokens - self.token_counter(pinned)
+        if self.summary_llm is not None:
+            budget -= self.summary_max_tokens
+        elif summary is not None:
+            budget -= self.token_counter([summary])
+
+        groups = group_messages(messages[index:])
+        costs = [self.token_counter(group) for group in groups]
+        # 未超出预算时不做任何改写，保持 prompt 前缀稳定
+        if sum(costs) <= budget:
+            return None
+
+        truncated = False
+        if self.max_tool_result_chars > 0:
+            # 当前轮（最后一条 HumanMessage 及之后）的各轮工具结果都保持完整
+            for group in groups[:_current_turn_start(groups)]:
+                for i, message in enumerate(group):
+                    if isinstance(message, ToolMessage):
+                        shortened = _truncate_tool_result(message, self.max_tool_result_chars)
+                        truncated = truncated or shortened is not message
+                        group[i] = shortened
+
+        # 从最新的单元向前保留，直到达到目标；最后一个单元无论多大都必须保留
+        target = int(budget * self.target_ratio)
+        kept_count, used = 0, 0
+        for group in reversed(groups):
+            cost = self.token_counter(group)
+            if kept_count and used + cost > target:
+                break
+            kept_count += 1
+            used += cost
+
+        dropped = [message for group in groups[: len(groups) - kept_count] for message in group]
+        if not dropped and not truncated:
+            return None
+        kept = [message for group in groups[len(groups) - kept_count:] for message in group]
+        return {"pinned": pinned, "summary": summary, "kept": kept, "dropped": dropped}
+
+    def _summary_request(self, previous: Optional[BaseMessage], dropped: list[BaseMessage]) -> list[BaseMessage]:
+        parts = []
+        if previous is not None:
+            parts.append(f"已有摘要：\n{previous.content}")
+        parts.append(f"早期对话：\n{_render_for_summary(dropped)}")
+        return [
+            SystemMessage(content=SUMMARY_PROMPT.format(max_tokens=self.summary_max_tokens)),
+            HumanMessage(content="\n\n".join(parts)),
+        ]
+
+    @staticmethod
+    def _summary_message(content: Any) -> SystemMessage:
+        return SystemMessage(content=f"早期对话摘要：\n{content}", id=SUMMARY_MESSAGE_ID)
+
+    def _rewrite(self, plan: dict[str, Any], summary: Optional[BaseMessage]) -> list[BaseMessage]:
+        logger.info(
+            f"压缩历史: 丢弃 {len(plan['dropped'])} 条消息，保留 {len(plan['kept'])} 条"
+        )
+        head = plan["pinned"] + ([summary] if summary is not None else [])
+        # 被丢弃的工具结果不再引用其 blob
+        release_blobs(plan["dropped"])
+        # 整体替换状态中的消息列表，保证摘要位于开头且消息顺序不变
+        return [RemoveMessage(id=REMOVE_ALL_MESSAGES), *head, *plan["kept"]]
+
+    def compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """返回写回 AgentState 的消息更新；无需压缩时返回空列表."""
+        plan = self._plan(messages)
+        if plan is None:
+            return []
+        summary = plan["summary"]
+        if self.summary_llm is not None and plan["dropped"]:
+            response = self.summary_llm.invoke(self._summary_request(summary, plan["dropped"]))
+            summary = self._summary_message(response.content)
+        return self._rewrite(plan, summary)
+
+    async def acompact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """compact 的异步版本."""
+        plan = self._plan(messages)
+        if plan is None:
+            return []
+        summary = plan["summary"]
+        if self.summary_llm is not None and plan["dropped"]:
+            response = await self.summary_llm.ainvoke(self._summary_request(summary, plan["dropped"]))
+            summary = self._summary_message(response.content)
+        return self._rewrite(plan, summary)
+
+    def node(self, state: dict[str, Any]) -> dict[str, Any]:
+        """LangGraph 节点：压缩 state["messages"]."""
+        return {"messages": self.compact(state["messages"])}
+
+    async def anode(self, state: dict[str, Any]) -> dict[str, Any]:
+        """LangGraph 节点（异步）."""
+        return {"messages": await self.acompact(state["messages"])}
@@ -0,0 +1,294 @@
+"""Shared HTTP transport for the DeepSeek client: keep-alive pool, retries and rate limiting.
+
+所有 ChatOpenAI 实例共用同一对 httpx 客户端（同步与异步），因此连接在 graph、历史摘要
+以及 HTTP 服务的各个会话之间复用；异步连接绑定创建它的事件循环，因此异步客户端为每个事件循环
+维护各自的连接池。重试与限流在 transport 层完成，openai SDK 自身的重试被关闭，
+避免两层重试叠加。设置了本轮截止时间（见 agent.deadline）时，会超出截止时间的重试与限流等待不再进行。
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import httpx
+
+from agent.config import (
+    get_llm_connect_timeout,
+    get_llm_keepalive_expiry,
+    get_llm_max_connections,
+    get_llm_max_keepalive_connections,
+    get_llm_max_retries,
+    get_llm_requests_per_second,
+    get_llm_retry_base_delay,
+    get_llm_retry_max_delay,
+    get_llm_timeout,
+    get_llm_tokens_per_minute,
+)
+from agent.deadline import DeadlineExceeded, allows
+
+logger = logging.getLogger(__name__)
+
+# 可以重试的状态码：限流与服务端临时错误
+RETRY_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RateLimiter:
+    """客户端令牌桶限流：每秒请求数与每分钟 token 数（0 表示不限制）.
+
+    ``reserve`` 立即扣减额度并返回需要等待的秒数，额度可以透支，
+    因此并发的调用方按到达顺序依次排队，而不是同时醒来再次争抢。
+    """
+
+    def __init__(self, requests_per_second: float, tokens_per_minute: float):
+        self.request_rate = requests_per_second
+        self.token_rate = tokens_per_minute / 60
+        # 桶容量：1 秒的请求数与 1 分钟的 token 数，允许这个范围内的突发
+        self._request_capacity = max(1.0, requests_per_second)
+        self._token_capacity = tokens_per_minute
+        self._requests = self._request_capacity
+        self._tokens = self._token_capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.request_rate > 0 or self.token_rate > 0
+
+    def reserve(self, tokens: int) -> float:
+        """为一次请求预约额度，返回发送前需要等待的秒数."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._updated = now - self._updated, now
+            delay = 0.0
+            if self.request_rate > 0:
+                self._requests = min(self._request_capacity, self._requests + elapsed * self.request_rate) - 1
+                delay = max(delay, -self._requests / self.request_rate)
+            if self.token_rate > 0:
+                self._tokens = min(self._token_capacity, self._tokens + elapsed * self.token_rate) - tokens
+                delay = max(delay, -self._tokens / self.token_rate)
+            return delay
+
+
+class RetryPolicy:
+    """带抖动的指数退避；响应携带 Retry-After 时按其等待."""
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def delay_for(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """返回重试前的等待时间；不应重试时返回 None."""
+        if response.status_code not in RETRY_STATUS_CODES:
+            return None
+        retry_after = _retry_after(response)
+        if retry_after is None:
+            return self.backoff(attempt)
+        # 服务端要求的等待时间超过上限时不再重试，把 429/503 直接交给调用方
+        return retry_after if retry_after <= self.max_delay else None
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _limiter_wait(limiter: RateLimiter, request: httpx.Request) -> float:
+    """预约限流额度，返回需要等待的秒数；等待会超出本轮截止时间时抛出 DeadlineExceeded."""
+    wait = limiter.reserve(_estimate_tokens(request))
+    if wait > 0 and not allows(wait):
+        raise DeadlineExceeded(f"等待 LLM 限流额度（{wait:.2f} 秒）会超过本轮的截止时间")
+    return wait
+
+
+def _estimate_tokens(request: httpx.Request) -> int:
+    # 粗略估算：请求体约 4 个字节一个 token（与 fake_llm 的 usage 估算一致）
+    try:
+        return len(request.content) // 4
+    except httpx.RequestNotRead:
+        return 0
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """在发送前限流、对可重试的失败自动重试的同步 transport."""
+
+    def __init__(self, transport: httpx.BaseTransport, policy: RetryPolicy, limiter: RateLimiter):
+        self._transport = transport
+        self.policy = policy
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        wait = _limiter_wait(self.limiter, request)
+        if wait > 0:
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self.policy.max_retries:
+                    raise
+                delay = self.policy.backoff(attempt)
+                if not allows(delay):
+                    raise
+                logger.warning(f"LLM 请求失败（{type(e).__name__}: {e}），{delay:.2f} 秒后重试")
+            else:
+                retry_delay = self.policy.delay_for(response, attempt) if attempt < self.policy.max_retries else None
+                if retry_delay is None or not allows(retry_delay):
+                    return response
+                delay = retry_delay
+                response.close()
+                logger.warning(f"LLM 请求返回 {response.status_code}，{delay:.2f} 秒后重试")
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """ResilientTransport 的异步版本，等待期间不阻塞事件循环."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: RetryPolicy, limiter: RateLimiter):
+        self._transport = transport
+        self.policy = policy
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        wait = _limiter_wait(self.limiter, request)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self.policy.max_retries:
+                    raise
+                delay = self.policy.backoff(attempt)
+                if not allows(delay):
+                    raise
+                logger.warning(f"LLM 请求失败（{type(e).__name__}: {e}），{delay:.2f} 秒后重试")
+            else:
+                retry_delay = self.policy.delay_for(response, attempt) if attempt < self.policy.max_retries else None
+                if retry_delay is None or not allows(retry_delay):
+                    return response
+                delay = retry_delay
+                await response.aclose()
+                logger.warning(f"LLM 请求返回 {response.status_code}，{delay:.2f} 秒后重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class PerLoopAsyncTransport(httpx.AsyncBaseTransport):
+    """按正在运行的事件循环分别创建底层 transport.
+
+    httpx 的异步连接只能在创建它的事件循环中使用，graph 在一个事件循环中构建、
+    之后在另一个事件循环中调用（例如多次 ``asyncio.run``）时，共用的连接池会报
+    "Event loop is closed"。事件循环被回收后，对应的连接池随之释放。
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self._factory = factory
+        self._transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = self._factory()
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环的连接池（其他事件循环的连接池不受影响）."""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=get_llm_max_connections(),
+        max_keepalive_connections=get_llm_max_keepalive_connections(),
+        keepalive_expiry=get_llm_keepalive_expiry(),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(get_llm_timeout(), connect=get_llm_connect_timeout())
+
+
+def _policy() -> RetryPolicy:
+    return RetryPolicy(get_llm_max_retries(), get_llm_retry_base_delay(), get_llm_retry_max_delay())
+
+
+# 全局共享的客户端与限流器（同步与异步客户端共用同一份限流额度）
+_limiter: Optional[RateLimiter] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(get_llm_requests_per_second(), get_llm_tokens_per_minute())
+    return _limiter
+
+
+def get_http_client() -> httpx.Client:
+    """获取共享的同步 HTTP 客户端."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            transport = ResilientTransport(httpx.HTTPTransport(limits=_limits()), _policy(), _get_limiter())
+            _http_client = httpx.Client(transport=transport, timeout=_timeout())
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """获取共享的异步 HTTP 客户端（可在多个事件循环中使用，每个事件循环有各自的连接池）."""
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            policy, limiter = _policy(), _get_limiter()
+            transport = PerLoopAsyncTransport(
+                lambda: AsyncResilientTransport(httpx.AsyncHTTPTransport(limits=_limits()), policy, limiter)
+            )
+            _async_http_client = httpx.AsyncClient(transport=transport, timeout=_timeout())
+        return _async_http_client
@@ -0,0 +1,197 @@
+"""Non-blocking logging for the ``agent`` package: queue handler, background writer and rotation.
+
+调用方只把日志记录放进有界队列（队列满时丢弃并计数，从不阻塞），格式化、写文件与轮转
+都在后台线程中完成。每条记录附带当前的 thread_id 与 turn_id（通过 contextvars 传递，
+asyncio 任务与 LangGraph 的线程池都会继承）::
+
+    with log_context(thread_id="t1", turn_id="a1b2"):
+        logger.info("...")   # {"ts": ..., "level": "INFO", "thread_id": "t1", "turn_id": "a1b2", ...}
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+
+from agent.config import (
+    get_log_backup_count,
+    get_log_file,
+    get_log_format,
+    get_log_level,
+    get_log_max_bytes,
+    get_log_queue_size,
+    get_log_rotate_when,
+    get_log_stderr_level,
+)
+from agent.metrics import get_metrics
+
+_thread_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("agent_log_thread_id", default=None)
+_turn_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("agent_log_turn_id", default=None)
+
+# 标准 LogRecord 属性，JSON 输出时不作为额外字段
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+@contextmanager
+def log_context(thread_id: Optional[str] = None, turn_id: Optional[str] = None) -> Iterator[None]:
+    """在代码块内为日志记录附加 thread_id / turn_id."""
+    tokens = []
+    if thread_id is not None:
+        tokens.append((_thread_id, _thread_id.set(thread_id)))
+    if turn_id is not None:
+        tokens.append((_turn_id, _turn_id.set(turn_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """在调用方线程中把 contextvars 写入记录（后台线程读不到调用方的上下文）."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.thread_id = _thread_id.get()
+        record.turn_id = _turn_id.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """每条记录一行 JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """沿用原来的文本格式，有上下文时附加 [thread_id/turn_id]."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        thread_id = getattr(record, "thread_id", None)
+        if thread_id is None:
+            return text
+        return f"{text} [{thread_id}/{getattr(record, 'turn_id', None) or '-'}]"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不是阻塞或报错."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用方线程中合并消息参数并展开异常栈（它们可能引用调用方随后会修改或释放的对象），
+        # 但保留异常文本单独存放，由后台线程的 formatter 决定如何输出
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _file_handler(path: str) -> logging.Handler:
+    """按大小（AGENT_LOG_MAX_BYTES）或时间（AGENT_LOG_ROTATE_WHEN）轮转的文件 handler."""
+    when = get_log_rotate_when()
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=when, backupCount=get_log_backup_count(), encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=get_log_max_bytes(), backupCount=get_log_backup_count(), encoding="utf-8"
+    )
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """为 ``agent`` logger 安装队列 handler 与后台写入线程（重复调用无副作用）."""
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = JSONFormatter() if get_log_format() == "json" else TextFormatter()
+        handlers: list[logging.Handler] = []
+        path = get_log_file()
+        if path:
+            file_handler = _file_handler(path)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        # 可选：把不低于 AGENT_LOG_STDERR_LEVEL 的记录同时输出到 stderr（默认不输出，不干扰 console 的界面）
+        stderr_level = get_log_stderr_level()
+        if stderr_level:
+            stderr_handler = logging.StreamHandler(sys.stderr)
+            stderr_handler.setLevel(stderr_level)
+            stderr_handler.setFormatter(TextFormatter())
+            handlers.append(stderr_handler)
+
+        log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=get_log_queue_size())
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(_ContextFilter())
+        logger = logging.getLogger("agent")
+        logger.setLevel(get_log_level())
+        logger.addHandler(_queue_handler)
+        # 防止日志传播到根 logger（避免重复输出）
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        get_metrics().register_queue("logging", lambda: {"log_records": log_queue.qsize()})
+
+
+def shutdown_logging() -> None:
+    """写出队列中剩余的记录并停止后台线程."""
+    global _listener, _queue_handler
+    with _configure_lock:
+        listener, _listener = _listener, None
+        handler, _queue_handler = _queue_handler, None
+    if listener is None:
+        return
+    if handler is not None:
+        logging.getLogger("agent").removeHandler(handler)
+    listener.stop()
+    for target in listener.handlers:
+        target.close()
+
+
+def dropped_records() -> int:
+    """队列满时被丢弃的记录数."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -1,41 +1,132 @@
-"""MCP client wrapper for connecting to MCP server."""
+"""MCP client wrapper for connecting to an MCP server over stdio, a Unix socket or streamable HTTP."""
 
 import asyncio
+import base64
+import json
+import time
+from datetime import timedelta
 from typing import Any, Optional
 
+from langchain_core.tools import ToolException
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from agent.config import get_mcp_call_timeout
+from agent.mcp.endpoints import MCPEndpoint, get_mcp_endpoints
+from agent.metrics import get_metrics
+
+# server 提供的批量调用入口（一次往返执行同一工具的多组参数）
+BATCH_TOOL_NAME = "batch_call"
+
+
+def _binary_placeholder(kind: str, data: str, mime_type: Optional[str], label: str = "") -> str:
+    """把二进制内容块（base64）写入 blob 存储，返回替代它的文本占位."""
+    from agent.blobs import get_blob_store
+
+    raw = base64.b64decode(data)
+    description = f"{kind}{label} {mime_type or 'application/octet-stream'}，{len(raw)} 字节"
+    store = get_blob_store()
+    if store is None:
+        return f"[{description}]"
+    # 不计入引用计数：占位文本不是 artifact，blob 只按 LRU 保留
+    ref = store.put(raw, mime_type or "application/octet-stream", retain=False)
+    return f"[{description}，blob {ref['blob']}]"
+
+
+def render_content(blocks: list[Any]) -> str:
+    """把工具结果的全部内容块合并为文本.
+
+    文本块与内嵌的文本资源按顺序拼接；图片、音频与二进制资源写入 blob 存储，
+    以带 blob 引用的占位文本代替，资源链接只保留 URI。
+    """
+    parts = []
+    for block in blocks or []:
+        if block.type == "text":
+            parts.append(block.text)
+        elif block.type in ("image", "audio"):
+            parts.append(_binary_placeholder(block.type, block.data, block.mimeType))
+        elif block.type == "resource":
+            resource = block.resource
+            if getattr(resource, "text", None) is not None:
+                parts.append(resource.text)
+            else:
+                parts.append(_binary_placeholder("resource", resource.blob, resource.mimeType, f" {resource.uri}"))
+        elif block.type == "resource_link":
+            parts.append(f"[resource {block.uri}]")
+    return "\n".join(parts)
+
 
 class MCPClient:
     """MCP 客户端，用于连接和调用 MCP server 的工具."""
 
-    def __init__(self, server_command: str = "python", server_args: Optional[list[str]] = None):
+    def __init__(
+        self,
+        server_command: Optional[str] = None,
+        server_args: Optional[list[str]] = None,
+        endpoint: Optional[MCPEndpoint] = None,
+    ):
         """初始化 MCP 客户端.
 
         Args:
-            server_command: 启动 MCP server 的命令
-            server_args: MCP server 的命令参数
+            server_command: 启动 MCP server 的命令（stdio），默认读取 MCP_SERVER_COMMAND
+            server_args: MCP server 的命令参数（stdio），默认读取 MCP_SERVER_ARGS
+            endpoint: server 端点；未指定时使用 MCP_SERVERS 中的第一个端点，
+                或由 server_command/server_args 启动的 stdio server
         """
-        if server_args is None:
-            server_args = ["-m", "agent.mcp.server"]
-
-        self.server_params = StdioServerParameters(
-            command=server_command,
-            args=server_args,
-        )
+        if endpoint is None:
+            endpoint = get_mcp_endpoints()[0]
+            if server_command is not None or server_args is not None:
+                endpoint = MCPEndpoint(
+                    endpoint.name,
+                    "stdio",
+                    command=server_command if server_command is not None else endpoint.command,
+                    args=tuple(server_args if server_args is not None else endpoint.args),
+                )
+        self.endpoint = endpoint
         self._session: Optional[ClientSession] = None
         self._read = None
         self._write = None
         self._client_context = None
 
+    def _open_transport(self):
+        """按端点类型创建 transport 上下文，进入后得到 (read_stream, write_stream, ...)."""
+        if self.endpoint.transport == "stdio":
+            server_params = StdioServerParameters(command=self.endpoint.command, args=list(self.endpoint.args))
+            return stdio_client(server_params)
+
+        from mcp.client.streamable_http import streamablehttp_client
+
+        if self.endpoint.transport == "http":
+            return streamablehttp_client(self.endpoint.url, timeout=get_mcp_call_timeout())
+
+        # Unix socket：同样是 streamable HTTP，只是底层连接走 socket 文件
+        import httpx
+
+        def client_factory(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=self.endpoint.path),
+                headers=headers,
+                timeout=timeout,
+                auth=auth,
+            )
+
+        return streamablehttp_client(
+            self.endpoint.url, timeout=get_mcp_call_timeout(), httpx_client_factory=client_factory
+        )
+
     async def __aenter__(self):
         """异步上下文管理器入口."""
-        self._client_context = stdio_client(self.server_params)
-        self._read, self._write = await self._client_context.__aenter__()
+        # spawn：启动子进程或建立连接；handshake：initialize 往返（stdio 时包含 server 进程的启动与导入）
+        started = time.perf_counter()
+        self._client_context = self._open_transport()
+        self._read, self._write, *_ = await self._client_context.__aenter__()
+        connected = time.perf_counter()
         self._session = ClientSession(self._read, self._write)
         await self._session.__aenter__()
         await self._session.initialize()
+        histogram = get_metrics().mcp_connect_latency
+        histogram.observe(connected - started, self.endpoint.name, "spawn")
+        histogram.observe(time.perf_counter() - connected, self.endpoint.name, "handshake")
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -51,23 +142,58 @@ class MCPClient:
             raise RuntimeError("MCP client not initialized. Use async context manager.")
         return await self._session.list_tools()
 
-    async def call_tool(self, name: str, arguments: dict[str, Any]):
+    async def ping(self):
+        """向 server 发送 ping，用于连接健康检查."""
+        if not self._session:
+            raise RuntimeError("MCP client not initialized. Use async context manager.")
+        return await self._session.send_ping()
+
+    async def call_tool(self, name: str, arguments: dict[str, Any], timeout: Optional[float] = None):
         """调用指定的工具.
 
         Args:
             name: 工具名称
             arguments: 工具参数
+            timeout: 等待结果的超时时间（秒），None 表示不限制
 
         Returns:
-            工具调用的结果
+            全部内容块合并后的结果文本（见 render_content）
+
+        Raises:
+            ToolException: server 报告工具执行失败（``CallToolResult.isError``），异常消息为错误内容
         """
         if not self._session:
             raise RuntimeError("MCP client not initialized. Use async context manager.")
-        result = await self._session.call_tool(name, arguments)
-        # 提取文本内容
-        if result.content and len(result.content) > 0:
-            return result.content[0].text
-        return ""
+        read_timeout = timedelta(seconds=timeout) if timeout is not None else None
+        result = await self._session.call_tool(name, arguments, read_timeout_seconds=read_timeout)
+        text = render_content(result.content)
+        if result.isError:
+            raise ToolException(text or f"工具 {name} 执行失败")
+        return text
+
+    async def call_tool_batch(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float] = None
+    ) -> list[str]:
+        """在一次请求中对同一工具执行多组参数.
+
+        Args:
+            name: 工具名称
+            arguments_list: 每个元素是一次调用的参数
+            timeout: 等待结果的超时时间（秒），None 表示不限制
+
+        Returns:
+            与 arguments_list 顺序一致的结果文本
+        """
+        text = await self.call_tool(BATCH_TOOL_NAME, {"tool": name, "calls": arguments_list}, timeout=timeout)
+        try:
+            results = json.loads(text)
+        except ValueError:
+            raise RuntimeError(f"批量调用 {name} 失败: {text}") from None
+        if not isinstance(results, list):
+            raise RuntimeError(f"批量调用 {name} 失败: {text}")
+        if len(results) != len(arguments_list):
+            raise RuntimeError(f"批量调用 {name} 返回了 {len(results)} 个结果，期望 {len(arguments_list)} 个")
+        return results
 
 
 # 全局 MCP 客户端实例（用于同步调用）
@@ -84,6 +210,21 @@ async def get_mcp_client() -> MCPClient:
         return _mcp_client
 
 
+async def call_mcp_tool(name: str, arguments: dict[str, Any]) -> str:
+    """异步调用 MCP 工具（复用全局会话池，可在任意事件循环中 await）.
+
+    Args:
+        name: 工具名称
+        arguments: 工具参数
+
+    Returns:
+        工具调用的结果文本
+    """
+    from agent.mcp.pool import get_mcp_pool
+
+    return await get_mcp_pool().call_tool(name, arguments)
+
+
 def call_mcp_tool_sync(name: str, arguments: dict[str, Any]) -> str:
     """同步调用 MCP 工具（用于 LangChain 工具包装）.
 
@@ -94,8 +235,28 @@ def call_mcp_tool_sync(name: str, arguments: dict[str, Any]) -> str:
     Returns:
         工具调用的结果文本
     """
-    async def _call():
-        async with MCPClient() as client:
-            return await client.call_tool(name, arguments)
+    from agent.mcp.pool import get_mcp_pool
+
+    return get_mcp_pool().call_tool_sync(name, arguments)
+
+
+async def call_mcp_tool_batch(name: str, arguments_list: list[dict[str, Any]]) -> list[str]:
+    """异步批量调用 MCP 工具：多组参数在一次请求中执行.
+
+    Args:
+        name: 工具名称
+        arguments_list: 每个元素是一次调用的参数
+
+    Returns:
+        与 arguments_list 顺序一致的结果文本
+    """
+    from agent.mcp.pool import get_mcp_pool
+
+    return await get_mcp_pool().call_tool_batch(name, arguments_list)
+
+
+def call_mcp_tool_batch_sync(name: str, arguments_list: list[dict[str, Any]]) -> list[str]:
+    """同步批量调用 MCP 工具（参数同 call_mcp_tool_batch）."""
+    from agent.mcp.pool import get_mcp_pool
 
-    return asyncio.run(_call())
+    return get_mcp_pool().call_tool_batch_sync(name, arguments_list)
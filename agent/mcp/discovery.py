@@ -0,0 +1,113 @@
+"""On-disk cache of MCP tool schemas, so the graph can be built without contacting the server."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Optional
+
+from agent.config import get_tool_schema_cache_path
+from agent.mcp.endpoints import get_mcp_endpoints
+
+logger = logging.getLogger(__name__)
+
+
+def _package_version() -> str:
+    try:
+        return metadata.version("langgraph-cursor-base")
+    except metadata.PackageNotFoundError:
+        return "0"
+
+
+def _cache_key() -> str:
+    """缓存 key：全部 server 端点 + 版本；任一变化都会让旧缓存失效."""
+    payload = [[endpoint.describe() for endpoint in get_mcp_endpoints()], _package_version()]
+    return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+def _read_cache_file(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def load_cached_tool_specs() -> Optional[list[dict[str, Any]]]:
+    """读取缓存的工具 schema；未启用、不存在或 key 不匹配时返回 None."""
+    path = get_tool_schema_cache_path()
+    if path is None:
+        return None
+    entry = _read_cache_file(Path(path)).get(_cache_key())
+    return entry["tools"] if entry else None
+
+
+def save_tool_specs(specs: list[dict[str, Any]]) -> None:
+    """把工具 schema 写入缓存文件（先写临时文件再替换，避免并发读到半个文件）."""
+    configured = get_tool_schema_cache_path()
+    if configured is None:
+        return
+    path = Path(configured)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(
+            json.dumps({_cache_key(): {"tools": specs, "saved_at": time.time()}}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"写入工具 schema 缓存失败: {e}")
+
+
+def tool_specs_from_result(list_tools_result) -> list[dict[str, Any]]:
+    """把 list_tools 的结果转换为可 JSON 序列化的工具 schema."""
+    return [
+        tool.model_dump(by_alias=True, mode="json", exclude_none=True)
+        for tool in list_tools_result.tools
+    ]
+
+
+def _save_complete(specs: list[dict[str, Any]], failed: list[str]) -> list[dict[str, Any]]:
+    # 部分 server 不可用时本次仍返回其余 server 的工具，但不写入缓存，下次启动重新获取
+    if not failed:
+        save_tool_specs(specs)
+    return specs
+
+
+def fetch_tool_specs() -> list[dict[str, Any]]:
+    """并发地从所有 MCP server 获取最新的工具 schema 并更新缓存."""
+    from agent.mcp.pool import get_mcp_pool
+
+    return _save_complete(*get_mcp_pool().list_tool_specs_sync())
+
+
+async def afetch_tool_specs() -> list[dict[str, Any]]:
+    """fetch_tool_specs 的异步版本."""
+    from agent.mcp.pool import get_mcp_pool
+
+    return _save_complete(*await get_mcp_pool().list_tool_specs())
+
+
+def refresh_in_background() -> threading.Thread:
+    """后台重新获取工具 schema：校正过期的缓存，同时预热 MCP 会话池.
+
+    在 graph 构建完成后再调用，避免与构建过程争抢 CPU。
+    """
+    def refresh():
+        cached_specs = load_cached_tool_specs()
+        try:
+            specs = fetch_tool_specs()
+        except Exception as e:
+            logger.warning(f"后台刷新工具 schema 失败: {e}")
+            return
+        # 未启用缓存时只预热会话池
+        if cached_specs is not None and specs != cached_specs:
+            logger.warning("MCP server 的工具列表已变化，缓存已更新，重启后生效")
+
+    thread = threading.Thread(target=refresh, name="mcp-tool-refresh", daemon=True)
+    thread.start()
+    return thread
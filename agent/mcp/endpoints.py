@@ -0,0 +1,77 @@
+"""MCP server endpoint configuration (stdio, Unix domain socket or streamable HTTP).
+
+只依赖标准库，工具 schema 缓存在构建 graph 时可以据此计算缓存 key 而不必导入 mcp SDK。
+"""
+
+import shlex
+from dataclasses import dataclass
+from typing import Optional
+
+from agent.config import get_mcp_server_args, get_mcp_server_command, get_mcp_servers
+
+TRANSPORTS = ("stdio", "unix", "http")
+
+# 多个 server 时，暴露给 LLM 的工具名为 "<server>__<tool>"
+NAMESPACE_SEPARATOR = "__"
+
+
+@dataclass(frozen=True)
+class MCPEndpoint:
+    """一个 MCP server 的连接方式.
+
+    - stdio：启动 ``command args`` 子进程，通过标准输入输出通信（每个客户端独占一个 server）
+    - unix：通过 Unix domain socket 上的 streamable HTTP 连接常驻 server
+    - http：通过本地 streamable HTTP 连接常驻 server
+    """
+
+    name: str
+    transport: str
+    command: Optional[str] = None
+    args: tuple[str, ...] = ()
+    path: Optional[str] = None
+    url: Optional[str] = None
+
+    def describe(self) -> str:
+        """端点的完整描述，用作工具 schema 缓存 key 的一部分."""
+        if self.transport == "stdio":
+            return f"{self.name}=stdio:{shlex.join([self.command or '', *self.args])}"
+        if self.transport == "unix":
+            return f"{self.name}=unix:{self.path}"
+        return f"{self.name}={self.url}"
+
+
+def parse_endpoint(spec: str, default_name: str) -> MCPEndpoint:
+    """解析 ``[name=]stdio:<命令行>``、``[name=]unix:<socket 路径>`` 或 ``[name=]http(s)://...``."""
+    name, sep, target = spec.strip().partition("=")
+    # 没有 name= 前缀，或 "=" 出现在目标内部（例如 URL 的查询参数）
+    if not sep or ":" in name or " " in name:
+        name, target = default_name, spec.strip()
+    if not name.isidentifier() or NAMESPACE_SEPARATOR in name:
+        raise ValueError(f"MCP server 名称必须是合法的标识符且不能包含 {NAMESPACE_SEPARATOR!r}: {name!r}")
+
+    if target.startswith("stdio:"):
+        argv = shlex.split(target.removeprefix("stdio:"))
+        if not argv:
+            raise ValueError(f"MCP server 端点缺少启动命令: {spec!r}")
+        command, *args = argv
+        return MCPEndpoint(name, "stdio", command=command, args=tuple(args))
+    if target.startswith("unix:"):
+        return MCPEndpoint(name, "unix", path=target.removeprefix("unix:"), url="http://localhost/mcp/")
+    if target.startswith(("http://", "https://")):
+        return MCPEndpoint(name, "http", url=target)
+    raise ValueError(f"无法解析 MCP server 端点: {spec!r}（支持 stdio:、unix:、http(s)://）")
+
+
+def get_mcp_endpoints() -> list[MCPEndpoint]:
+    """读取 MCP_SERVERS（以 ; 分隔）；未配置时返回由 MCP_SERVER_COMMAND/ARGS 启动的单个 stdio server."""
+    spec = get_mcp_servers()
+    if not spec:
+        return [MCPEndpoint("default", "stdio", command=get_mcp_server_command(), args=tuple(get_mcp_server_args()))]
+    endpoints = [
+        parse_endpoint(entry, f"server{i}")
+        for i, entry in enumerate(part for part in spec.split(";") if part.strip())
+    ]
+    names = [endpoint.name for endpoint in endpoints]
+    if len(set(names)) != len(names):
+        raise ValueError(f"MCP server 名称重复: {names}")
+    return endpoints
@@ -0,0 +1,515 @@
+"""Long-lived pools of MCP client sessions, one per server, running on a shared background event loop."""
+
+import asyncio
+import atexit
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Optional, TypeVar
+
+import anyio
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from agent.config import (
+    get_mcp_call_timeout,
+    get_mcp_health_check_interval,
+    get_mcp_pool_idle_timeout,
+    get_mcp_pool_size,
+)
+from agent.deadline import clamp
+from agent.mcp.client import MCPClient
+from agent.mcp.endpoints import NAMESPACE_SEPARATOR, MCPEndpoint, get_mcp_endpoints
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 连接断开时 session 可能抛出的异常，命中后丢弃该连接并重连一次
+_CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, EOFError, OSError)
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """判断异常是否意味着 MCP server 已断开."""
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, _CONNECTION_ERRORS)
+
+
+class _BackgroundLoop:
+    """在守护线程中常驻运行的事件循环."""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> concurrent.futures.Future[T]:
+        """把协程提交到后台循环执行."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """在后台循环中执行协程并阻塞等待结果."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在 MCP 后台事件循环内同步等待，请使用异步接口")
+        return self.submit(coro).result()
+
+    def stop(self):
+        """停止事件循环并等待线程退出."""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+class _PooledSession:
+    """一个已初始化的常驻 MCP 会话.
+
+    stdio_client 基于 anyio task group，要求在同一个任务中进入和退出上下文，
+    因此每个会话都由专属任务持有，调用方只借用其中的 client。
+    """
+
+    def __init__(self, client_factory: Callable[[], MCPClient]):
+        self._client_factory = client_factory
+        self.client: Optional[MCPClient] = None
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.client is not None and self._task is not None and not self._task.done()
+
+    async def open(self):
+        """启动 server 子进程并完成 initialize 握手."""
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with self._client_factory() as client:
+                self.client = client
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            logger.warning(f"MCP 会话异常退出: {e}")
+        finally:
+            self.client = None
+            self._ready.set()
+
+    async def close(self):
+        """关闭会话并回收 server 子进程."""
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """有界的 MCP 会话池.
+
+    会话在后台事件循环中常驻，按需创建、空闲时健康检查、server 退出后自动重连，
+    超过空闲时间的会话会被回收。对外同时提供异步接口（可在任意事件循环中 await）
+    和同步接口。
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], MCPClient] = MCPClient,
+        max_size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        health_check_interval: Optional[float] = None,
+        call_timeout: Optional[float] = None,
+        loop: Optional[_BackgroundLoop] = None,
+    ):
+        """初始化会话池.
+
+        Args:
+            client_factory: 创建 MCPClient 的工厂函数
+            max_size: 最大会话数
+            idle_timeout: 会话空闲多久后被关闭（秒）
+            health_check_interval: 空闲会话在复用前多久需要重新 ping 一次（秒）
+            call_timeout: 默认的单次工具调用超时（秒）
+            loop: 共用的后台事件循环；未指定时会话池自行创建并在 close 时停止
+        """
+        self._client_factory = client_factory
+        self.max_size = max(1, max_size if max_size is not None else get_mcp_pool_size())
+        self.idle_timeout = idle_timeout if idle_timeout is not None else get_mcp_pool_idle_timeout()
+        self.health_check_interval = (
+            health_check_interval if health_check_interval is not None else get_mcp_health_check_interval()
+        )
+        self.call_timeout = call_timeout if call_timeout is not None else get_mcp_call_timeout()
+
+        self._owns_loop = loop is None
+        self._loop = loop if loop is not None else _BackgroundLoop("mcp-session-pool")
+        self._idle: list[_PooledSession] = []
+        self._size = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+        self._reaper: Optional[asyncio.Task] = None
+        self._closing_tasks: set[asyncio.Task] = set()
+        self._waiting = 0
+
+    def stats(self) -> dict[str, int]:
+        """会话数（在用 + 空闲）、空闲会话数与等待会话的调用数."""
+        return {"sessions": self._size, "idle": len(self._idle), "waiting": self._waiting}
+
+    # ---- 后台循环内部实现 ----
+
+    async def _connect(self) -> _PooledSession:
+        session = _PooledSession(self._client_factory)
+        await session.open()
+        logger.info("MCP 会话已建立")
+        return session
+
+    async def _is_healthy(self, session: _PooledSession) -> bool:
+        client = session.client
+        if client is None or not session.alive:
+            return False
+        if time.monotonic() - session.last_checked < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(client.ping(), timeout=self.call_timeout)
+        except Exception as e:
+            logger.warning(f"MCP 会话健康检查失败: {e}")
+            return False
+        session.last_checked = time.monotonic()
+        return True
+
+    async def _acquire(self) -> _PooledSession:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+        while True:
+            async with self._cond:
+                self._waiting += 1
+                try:
+                    await self._cond.wait_for(lambda: self._closed or self._idle or self._size < self.max_size)
+                finally:
+                    self._waiting -= 1
+                if self._closed:
+                    raise RuntimeError("MCP session pool is closed")
+                # 后进先出：优先复用最近用过的会话，让冷会话自然过期
+                session = self._idle.pop() if self._idle else None
+                if session is None:
+                    self._size += 1
+
+            if session is None:
+                try:
+                    return await self._connect()
+                except BaseException:
+                    await self._forget()
+                    raise
+
+            if await self._is_healthy(session):
+                return session
+            await self._discard(session)
+
+    async def _release(self, session: _PooledSession):
+        if self._closed or not session.alive:
+            await self._discard(session)
+            return
+        session.last_used = time.monotonic()
+        async with self._cond:
+            self._idle.append(session)
+            self._cond.notify()
+
+    async def _forget(self):
+        async with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    async def _discard(self, session: _PooledSession):
+        """让出名额并在后台关闭会话，不阻塞正在等待连接的调用方."""
+        await self._forget()
+        task = asyncio.create_task(self._close_session(session))
+        self._closing_tasks.add(task)
+        task.add_done_callback(self._closing_tasks.discard)
+
+    async def _close_session(self, session: _PooledSession):
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"关闭 MCP 会话失败: {e}")
+
+    async def _reap_idle(self):
+        """定期关闭空闲超时的会话."""
+        interval = max(1.0, self.idle_timeout / 2)
+        while not self._closed:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - self.idle_timeout
+            async with self._cond:
+                expired = [s for s in self._idle if s.last_used < deadline]
+                self._idle = [s for s in self._idle if s.last_used >= deadline]
+            for session in expired:
+                logger.info("关闭空闲的 MCP 会话")
+                await self._discard(session)
+
+    async def _with_session(self, operation: Callable[[MCPClient], Awaitable[T]], label: str) -> T:
+        """借用一个会话执行操作；若 server 已退出则换新连接重试一次.
+
+        label 为指标中的工具名：acquire 记录等待会话（含新建连接）的耗时，execute 记录请求往返的耗时。
+        """
+        histogram = get_metrics().tool_call_latency
+        for attempt in range(2):
+            started = time.perf_counter()
+            session = await self._acquire()
+            acquired = time.perf_counter()
+            histogram.observe(acquired - started, label, "acquire")
+            client = session.client
+            if client is None:
+                # 借出前会话已经退出：换新连接
+                await self._discard(session)
+                continue
+            try:
+                result = await operation(client)
+            except Exception as e:
+                if attempt == 0 and _is_connection_error(e):
+                    logger.warning(f"MCP 连接已断开，重新连接: {e}")
+                    await self._discard(session)
+                    continue
+                await self._release(session)
+                raise
+            except BaseException:
+                await self._discard(session)
+                raise
+            histogram.observe(time.perf_counter() - acquired, label, "execute")
+            session.last_checked = time.monotonic()
+            await self._release(session)
+            return result
+        raise RuntimeError("unreachable")
+
+    async def _call_tool(self, name: str, arguments: dict[str, Any], timeout: Optional[float]) -> str:
+        timeout = timeout if timeout is not None else self.call_timeout
+        return await self._with_session(lambda client: client.call_tool(name, arguments, timeout=timeout), name)
+
+    async def _call_tool_batch(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float]
+    ) -> list[str]:
+        timeout = timeout if timeout is not None else self.call_timeout
+        return await self._with_session(
+            lambda client: client.call_tool_batch(name, arguments_list, timeout=timeout), f"{name}[batch]"
+        )
+
+    async def _list_tools(self):
+        return await self._with_session(lambda client: client.list_tools(), "list_tools")
+
+    async def _close(self):
+        async with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for session in idle:
+            await self._discard(session)
+        if self._closing_tasks:
+            await asyncio.gather(*self._closing_tasks, return_exceptions=True)
+        if self._reaper is not None:
+            self._reaper.cancel()
+
+    def _call_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        # 在调用方的上下文中计算：本轮的截止时间不会传到后台事件循环
+        return clamp(timeout if timeout is not None else self.call_timeout)
+
+    # ---- 对外接口 ----
+
+    async def call_tool(self, name: str, arguments: dict[str, Any], timeout: Optional[float] = None) -> str:
+        """异步调用工具，可在任意事件循环中 await."""
+        timeout = self._call_timeout(timeout)
+        return await asyncio.wrap_future(self._loop.submit(self._call_tool(name, arguments, timeout)))
+
+    async def call_tool_batch(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float] = None
+    ) -> list[str]:
+        """异步批量调用工具（一次请求执行多组参数）."""
+        timeout = self._call_timeout(timeout)
+        return await asyncio.wrap_future(self._loop.submit(self._call_tool_batch(name, arguments_list, timeout)))
+
+    async def list_tools(self):
+        """异步列出 server 提供的工具."""
+        return await asyncio.wrap_future(self._loop.submit(self._list_tools()))
+
+    def call_tool_sync(self, name: str, arguments: dict[str, Any], timeout: Optional[float] = None) -> str:
+        """同步调用工具."""
+        return self._loop.run(self._call_tool(name, arguments, self._call_timeout(timeout)))
+
+    def call_tool_batch_sync(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float] = None
+    ) -> list[str]:
+        """同步批量调用工具."""
+        return self._loop.run(self._call_tool_batch(name, arguments_list, self._call_timeout(timeout)))
+
+    def list_tools_sync(self):
+        """同步列出 server 提供的工具."""
+        return self._loop.run(self._list_tools())
+
+    def close(self):
+        """关闭所有会话并停止后台事件循环."""
+        if self._closed:
+            return
+        try:
+            self._loop.run(self._close())
+        finally:
+            if self._owns_loop:
+                self._loop.stop()
+
+
+class MCPServerRouter:
+    """把多个 MCP server 合并为一个工具集.
+
+    每个端点一个会话池，全部运行在同一个后台事件循环上；工具发现并发访问所有 server，
+    N 个 server 的墙钟时间约等于最慢的一次往返。多于一个 server 时工具名加上
+    ``<server>__`` 前缀以避免重名，调用时按前缀路由到对应的会话池。
+    """
+
+    def __init__(
+        self,
+        endpoints: Optional[list[MCPEndpoint]] = None,
+        pool_factory: Callable[..., MCPSessionPool] = MCPSessionPool,
+    ):
+        """初始化路由.
+
+        Args:
+            endpoints: server 端点列表，默认读取 MCP_SERVERS
+            pool_factory: 创建会话池的工厂函数，接收 client_factory 与 loop 参数
+        """
+        self.endpoints = endpoints if endpoints is not None else get_mcp_endpoints()
+        if not self.endpoints:
+            raise ValueError("至少需要一个 MCP server 端点")
+        self._loop = _BackgroundLoop("mcp-session-pool")
+        self.pools: dict[str, MCPSessionPool] = {
+            endpoint.name: pool_factory(client_factory=functools.partial(MCPClient, endpoint=endpoint), loop=self._loop)
+            for endpoint in self.endpoints
+        }
+        self._closed = False
+        get_metrics().register_queue("mcp", self._queue_depths)
+
+    def _queue_depths(self) -> dict[str, float]:
+        return {
+            f"mcp_{name}_{key}": value
+            for name, pool in self.pools.items()
+            for key, value in pool.stats().items()
+        }
+
+    @property
+    def namespaced(self) -> bool:
+        return len(self.pools) > 1
+
+    def qualify(self, server: str, tool_name: str) -> str:
+        """server 内的工具名 -> 对外暴露的工具名."""
+        return f"{server}{NAMESPACE_SEPARATOR}{tool_name}" if self.namespaced else tool_name
+
+    def route(self, name: str) -> tuple[MCPSessionPool, str]:
+        """对外暴露的工具名 -> (会话池, server 内的工具名)."""
+        if not self.namespaced:
+            return next(iter(self.pools.values())), name
+        server, sep, tool_name = name.partition(NAMESPACE_SEPARATOR)
+        if not sep or server not in self.pools:
+            raise ValueError(f"未知的 MCP 工具 '{name}'，工具名应为 <server>{NAMESPACE_SEPARATOR}<tool>")
+        return self.pools[server], tool_name
+
+    async def _list_tool_specs(self) -> tuple[list[dict[str, Any]], list[str]]:
+        from agent.mcp.discovery import tool_specs_from_result
+
+        names = list(self.pools)
+        results = await asyncio.gather(
+            *(self.pools[name]._list_tools() for name in names), return_exceptions=True
+        )
+        specs: list[dict[str, Any]] = []
+        failed = []
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"获取 MCP server {name} 的工具列表失败: {result}")
+                failed.append(name)
+                continue
+            for spec in tool_specs_from_result(result):
+                specs.append({**spec, "name": self.qualify(name, spec["name"])})
+        if len(failed) == len(names):
+            raise RuntimeError(f"所有 MCP server 都不可用: {', '.join(failed)}") from results[0]
+        return specs, failed
+
+    async def list_tool_specs(self) -> tuple[list[dict[str, Any]], list[str]]:
+        """并发获取所有 server 的工具 schema，返回 (合并后的 schema, 失败的 server).
+
+        部分 server 不可用时跳过它们，全部不可用时抛出异常。
+        """
+        return await asyncio.wrap_future(self._loop.submit(self._list_tool_specs()))
+
+    def list_tool_specs_sync(self) -> tuple[list[dict[str, Any]], list[str]]:
+        """list_tool_specs 的同步版本."""
+        return self._loop.run(self._list_tool_specs())
+
+    async def call_tool(self, name: str, arguments: dict[str, Any], timeout: Optional[float] = None) -> str:
+        """异步调用工具，可在任意事件循环中 await."""
+        pool, tool_name = self.route(name)
+        return await pool.call_tool(tool_name, arguments, timeout)
+
+    async def call_tool_batch(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float] = None
+    ) -> list[str]:
+        """异步批量调用工具（一次请求执行多组参数）."""
+        pool, tool_name = self.route(name)
+        return await pool.call_tool_batch(tool_name, arguments_list, timeout)
+
+    def call_tool_sync(self, name: str, arguments: dict[str, Any], timeout: Optional[float] = None) -> str:
+        """同步调用工具."""
+        pool, tool_name = self.route(name)
+        return pool.call_tool_sync(tool_name, arguments, timeout)
+
+    def call_tool_batch_sync(
+        self, name: str, arguments_list: list[dict[str, Any]], timeout: Optional[float] = None
+    ) -> list[str]:
+        """同步批量调用工具."""
+        pool, tool_name = self.route(name)
+        return pool.call_tool_batch_sync(tool_name, arguments_list, timeout)
+
+    def close(self):
+        """并发关闭所有会话池并停止后台事件循环."""
+        if self._closed:
+            return
+        self._closed = True
+
+        async def close_all():
+            await asyncio.gather(*(pool._close() for pool in self.pools.values()), return_exceptions=True)
+
+        try:
+            self._loop.run(close_all())
+        finally:
+            self._loop.stop()
+
+
+# 全局连接（进程内共享）：按 MCP_SERVERS 配置的每个 server 一个会话池
+_mcp_pool: Optional[MCPServerRouter] = None
+_mcp_pool_lock = threading.Lock()
+
+
+def get_mcp_pool() -> MCPServerRouter:
+    """获取全局 MCP 连接实例."""
+    global _mcp_pool
+    with _mcp_pool_lock:
+        if _mcp_pool is None:
+            _mcp_pool = MCPServerRouter()
+            atexit.register(close_mcp_pool)
+        return _mcp_pool
+
+
+def close_mcp_pool():
+    """关闭全局 MCP 连接."""
+    global _mcp_pool
+    with _mcp_pool_lock:
+        pool, _mcp_pool = _mcp_pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,181 @@
+"""Compile MCP tool JSON Schemas into cached Pydantic argument models."""
+
+import hashlib
+import json
+import threading
+from types import GenericAlias
+from typing import Any, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+# JSON Schema 基本类型 -> Python 类型
+_PRIMITIVES: dict[str, Any] = {
+    "string": str,
+    "number": float,
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+# JSON Schema 约束 -> pydantic Field 参数
+_CONSTRAINTS = {
+    "minimum": "ge",
+    "maximum": "le",
+    "exclusiveMinimum": "gt",
+    "exclusiveMaximum": "lt",
+    "multipleOf": "multiple_of",
+    "minLength": "min_length",
+    "maxLength": "max_length",
+    "pattern": "pattern",
+    "minItems": "min_length",
+    "maxItems": "max_length",
+}
+
+
+def schema_hash(schema: dict[str, Any]) -> str:
+    """schema 的稳定哈希（与键顺序无关）."""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _model_name(name: str) -> str:
+    parts = "".join(c if c.isalnum() else " " for c in name).split()
+    return "".join(part[:1].upper() + part[1:] for part in parts) or "Tool"
+
+
+class SchemaCompiler:
+    """把一个工具的 inputSchema（含 $defs）编译为 Pydantic 模型.
+
+    支持基本类型、enum/const、数组、嵌套对象、anyOf/oneOf、可空类型（``["string", "null"]``）、
+    本地 $ref 以及常见的数值/长度约束；无法表达的部分退化为 Any，交给 server 校验。
+    """
+
+    def __init__(self, root: dict[str, Any]):
+        self._defs = {**root.get("definitions", {}), **root.get("$defs", {})}
+        self._resolving: set[str] = set()
+
+    def _resolve_ref(self, ref: str, path: str) -> Any:
+        if not ref.startswith(("#/$defs/", "#/definitions/")):
+            return Any
+        key = ref.rsplit("/", 1)[-1]
+        # 递归引用（例如树形结构）退化为 Any
+        if key not in self._defs or key in self._resolving:
+            return Any
+        self._resolving.add(key)
+        try:
+            return self.annotation(self._defs[key], f"{path}{_model_name(key)}")
+        finally:
+            self._resolving.discard(key)
+
+    def annotation(self, schema: Any, path: str) -> Any:
+        """把一个子 schema 转换为类型注解；path 用于生成嵌套模型的名称."""
+        if not isinstance(schema, dict) or not schema:
+            return Any
+        if "$ref" in schema:
+            return self._resolve_ref(schema["$ref"], path)
+        if "const" in schema:
+            return Literal[schema["const"]]
+        if "enum" in schema:
+            values = schema["enum"]
+            if values and all(isinstance(v, (str, int, float, bool)) or v is None for v in values):
+                return Literal[tuple(values)]
+            return Any
+        for combinator in ("anyOf", "oneOf"):
+            if combinator in schema:
+                options = [self.annotation(option, f"{path}{i}") for i, option in enumerate(schema[combinator])]
+                return Union[tuple(options)] if Any not in options else Any
+        if "allOf" in schema and len(schema["allOf"]) == 1:
+            return self.annotation(schema["allOf"][0], path)
+
+        schema_type = schema.get("type")
+        if isinstance(schema_type, list):
+            options = [self.annotation({**schema, "type": t}, path) for t in schema_type]
+            return Union[tuple(options)]
+        if schema_type in _PRIMITIVES:
+            return _PRIMITIVES[schema_type]
+        if schema_type == "array":
+            items = schema.get("items")
+            # 运行时构造的泛型：等价于 list[<item 类型>]
+            return GenericAlias(list, (self.annotation(items, f"{path}Item"),)) if items else list[Any]
+        if schema_type == "object" or "properties" in schema:
+            if schema.get("properties"):
+                return self.model(schema, path)
+            additional = schema.get("additionalProperties")
+            if isinstance(additional, dict):
+                return GenericAlias(dict, (str, self.annotation(additional, f"{path}Value")))
+            return dict[str, Any]
+        return Any
+
+    def _field(self, prop_name: str, prop_schema: Any, required: bool, path: str) -> tuple[Any, Any]:
+        annotation = self.annotation(prop_schema, f"{path}{_model_name(prop_name)}")
+        kwargs: dict[str, Any] = {}
+        if isinstance(prop_schema, dict):
+            if prop_schema.get("description"):
+                kwargs["description"] = prop_schema["description"]
+            for key, option in _CONSTRAINTS.items():
+                if key in prop_schema and isinstance(prop_schema[key], (int, float, str)):
+                    kwargs[option] = prop_schema[key]
+        # pydantic 不允许以下划线开头的字段名，通过 alias 保留原始名称
+        if prop_name.startswith("_"):
+            kwargs["alias"] = prop_name
+        if required:
+            return annotation, Field(..., **kwargs)
+        default = prop_schema.get("default") if isinstance(prop_schema, dict) else None
+        return Optional[annotation], Field(default, **kwargs)
+
+    def model(self, schema: dict[str, Any], path: str) -> type[BaseModel]:
+        """把带 properties 的 object schema 编译为模型."""
+        required = set(schema.get("required", []))
+        fields: dict[str, Any] = {}
+        for prop_name, prop_schema in schema.get("properties", {}).items():
+            field_name = f"field{prop_name}" if prop_name.startswith("_") else prop_name
+            fields[field_name] = self._field(prop_name, prop_schema, prop_name in required, path)
+        # additionalProperties 为 false 时拒绝多余参数，否则原样透传给 server
+        extra: Literal["forbid", "allow"] = "forbid" if schema.get("additionalProperties") is False else "allow"
+        return create_model(
+            f"{path}Input",
+            __config__=ConfigDict(extra=extra, populate_by_name=True),
+            **fields,
+        )
+
+
+class CompiledToolSchema:
+    """编译后的工具参数模型及其校验器."""
+
+    def __init__(self, model: type[BaseModel]):
+        self.model = model
+
+    def validate(self, arguments: dict[str, Any]) -> dict[str, Any]:
+        """校验并规范化参数，返回可直接发送给 server 的 JSON 参数；校验失败时抛出 ValidationError."""
+        instance = self.model.__pydantic_validator__.validate_python(arguments)
+        return instance.model_dump(mode="json", by_alias=True, exclude_unset=True)
+
+
+def format_errors(error: ValidationError) -> str:
+    """把校验错误压缩为一行文本，返回给 LLM."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or '参数'}: {detail['msg']}" for detail in error.errors()
+    )
+
+
+# 编译结果按 (工具名, schema 哈希) 缓存：工具列表刷新或重复构建 graph 时不再重新编译
+_compiled: dict[tuple[str, str], CompiledToolSchema] = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_tool_schema(name: str, schema: Optional[dict[str, Any]]) -> CompiledToolSchema:
+    """获取工具参数模型，相同名称与 schema 只编译一次."""
+    schema = schema or {"type": "object"}
+    key = (name, schema_hash(schema))
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+    if compiled is not None:
+        return compiled
+    compiler = SchemaCompiler(schema)
+    if schema.get("properties"):
+        model = compiler.model(schema, _model_name(name))
+    else:
+        # 无参数或无法描述的参数：接受任意键值，由 server 校验
+        model = create_model(f"{_model_name(name)}Input", __config__=ConfigDict(extra="allow"))
+    compiled = CompiledToolSchema(model)
+    with _compiled_lock:
+        return _compiled.setdefault(key, compiled)
@@ -1,12 +1,220 @@
-"""MCP Server implementation with addition tool."""
+"""MCP Server implementation with a tool registry and batched tool calls.
 
+默认通过 stdio 运行（由客户端启动为子进程）；``--transport http`` 或 ``--transport unix``
+以 streamable HTTP 常驻运行，多个 agent 进程可以共用同一个 server::
+
+    python -m agent.mcp.server --transport unix --socket /tmp/agent-mcp.sock
+    MCP_SERVERS="tools=unix:/tmp/agent-mcp.sock" python main.py
+"""
+
+import argparse
 import asyncio
-import sys
-from typing import Any
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
+from mcp.types import CallToolResult, Tool, TextContent, ToolAnnotations
+
+from agent.config import get_mcp_server_process_workers, get_mcp_server_thread_workers
+from agent.mcp.client import BATCH_TOOL_NAME
+
+# 工具的执行方式：inline 直接在事件循环中执行（只适合极快的工具），
+# thread 在线程池中执行（阻塞 IO），process 在进程池中执行（CPU 密集）
+EXECUTORS = ("inline", "thread", "process")
+
+
+class ToolInputError(ValueError):
+    """工具参数错误：单次调用以 isError 结果返回，批量调用中以错误文本作为该组参数的结果."""
+
+
+@dataclass
+class RegisteredTool:
+    """注册表中的工具.
+
+    func 接收参数字典并返回结果文本；batch_func（可选）一次处理多组参数，返回等长的结果列表。
+    executor 为 process 时，func 与 batch_func 必须是模块级函数（可被 pickle）。
+    """
+
+    name: str
+    description: str
+    input_schema: dict[str, Any]
+    func: Callable[[dict[str, Any]], str]
+    executor: str = "inline"
+    batch_func: Optional[Callable[[list[dict[str, Any]]], list[str]]] = None
+    cacheable: bool = False
+
+    def to_tool(self) -> Tool:
+        meta: dict[str, Any] = {"batchable": True}
+        if self.cacheable:
+            # 纯函数：相同参数总是得到相同结果，客户端可以缓存
+            meta["cacheable"] = True
+        return Tool(
+            name=self.name,
+            description=self.description,
+            inputSchema=self.input_schema,
+            annotations=ToolAnnotations(readOnlyHint=self.cacheable, idempotentHint=self.cacheable),
+            _meta=meta,
+        )
+
+
+class ToolRegistry:
+    """按名称分发工具调用，并按工具声明的 executor 执行."""
+
+    def __init__(self):
+        self._tools: dict[str, RegisteredTool] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    def register(
+        self,
+        name: str,
+        description: str,
+        input_schema: dict[str, Any],
+        executor: str = "inline",
+        batch_func: Optional[Callable[[list[dict[str, Any]]], list[str]]] = None,
+        cacheable: bool = False,
+    ) -> Callable:
+        """注册工具的装饰器."""
+        if executor not in EXECUTORS:
+            raise ValueError(f"未知的 executor: {executor}，可选值: {', '.join(EXECUTORS)}")
+
+        def decorator(func: Callable[[dict[str, Any]], str]) -> Callable[[dict[str, Any]], str]:
+            self._tools[name] = RegisteredTool(name, description, input_schema, func, executor, batch_func, cacheable)
+            return func
+
+        return decorator
+
+    def tools(self) -> list[Tool]:
+        return [tool.to_tool() for tool in self._tools.values()] + [_batch_tool()]
+
+    def _executor(self, kind: str) -> Executor:
+        if kind == "thread":
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=get_mcp_server_thread_workers(), thread_name_prefix="mcp-tool"
+                )
+            return self._thread_pool
+        if self._process_pool is None:
+            # spawn：避免在已有线程的进程中 fork
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=get_mcp_server_process_workers() or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._process_pool
+
+    async def _execute(self, tool: RegisteredTool, func: Callable[[Any], Any], payload: Any) -> Any:
+        if tool.executor == "inline":
+            return func(payload)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(tool.executor), functools.partial(func, payload))
+
+    async def call(self, name: str, arguments: dict[str, Any]) -> str:
+        """执行一次工具调用；未知工具与参数错误抛出 ToolInputError."""
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolInputError(f"未知的工具 '{name}'")
+        return await self._execute(tool, tool.func, arguments)
+
+    async def _call_or_error(self, name: str, arguments: dict[str, Any]) -> str:
+        try:
+            return await self.call(name, arguments)
+        except ToolInputError as e:
+            return f"错误: {e}"
+
+    async def call_batch(self, name: str, calls: list[dict[str, Any]]) -> list[str]:
+        """对同一工具执行多组参数，结果顺序与 calls 一致.
+
+        工具提供了 batch_func 时一次性交给它处理（只占用一次线程/进程切换），
+        否则并发执行各个调用。
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            return [f"错误: 未知的工具 '{name}'"] * len(calls)
+        if tool.batch_func is not None:
+            return await self._execute(tool, tool.batch_func, calls)
+        return list(await asyncio.gather(*(self._call_or_error(name, arguments) for arguments in calls)))
+
+    def shutdown(self) -> None:
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _batch_tool() -> Tool:
+    # 批量调用入口：一次 JSON-RPC 往返执行同一工具的多组参数；
+    # _meta.batch 标记它不是面向 LLM 的工具，客户端转换工具列表时会跳过
+    return Tool(
+        name=BATCH_TOOL_NAME,
+        description="对同一工具批量执行多组参数，返回 JSON 数组形式的结果文本",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "description": "工具名称"},
+                "calls": {
+                    "type": "array",
+                    "items": {"type": "object"},
+                    "description": "每个元素是一次调用的参数",
+                },
+            },
+            "required": ["tool", "calls"],
+        },
+        _meta={"batch": True},
+    )
+
+
+# 工具注册表
+registry = ToolRegistry()
+
+
+def _add(arguments: dict[str, Any]) -> str:
+    a = arguments.get("a")
+    b = arguments.get("b")
+    if a is None or b is None:
+        raise ToolInputError("参数 'a' 和 'b' 是必需的")
+    try:
+        return f"结果: {float(a) + float(b)}"
+    except (ValueError, TypeError) as e:
+        raise ToolInputError(f"无效的输入 - {str(e)}") from e
+
+
+def _add_batch(calls: list[dict[str, Any]]) -> list[str]:
+    """向量化的 add：一次处理多组参数，单组参数错误不影响其他组."""
+    results = []
+    for arguments in calls:
+        try:
+            results.append(_add(arguments))
+        except ToolInputError as e:
+            results.append(f"错误: {e}")
+    return results
+
+
+registry.register(
+    name="add",
+    description="计算两个数字 a 和 b 的和",
+    input_schema={
+        "type": "object",
+        "properties": {
+            "a": {
+                "type": "number",
+                "description": "第一个数字",
+            },
+            "b": {
+                "type": "number",
+                "description": "第二个数字",
+            },
+        },
+        "required": ["a", "b"],
+    },
+    batch_func=_add_batch,
+    cacheable=True,
+)(_add)
 
 
 # 创建 MCP 服务器实例
@@ -16,69 +224,32 @@ server = Server("addition-server")
 @server.list_tools()
 async def list_tools() -> list[Tool]:
     """列出所有可用的工具."""
-    return [
-        Tool(
-            name="add",
-            description="计算两个数字 a 和 b 的和",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "a": {
-                        "type": "number",
-                        "description": "第一个数字",
-                    },
-                    "b": {
-                        "type": "number",
-                        "description": "第二个数字",
-                    },
-                },
-                "required": ["a", "b"],
-            },
-        )
-    ]
+    return registry.tools()
 
 
-@server.call_tool()
-async def call_tool(name: str, arguments: dict[str, Any]) -> list[TextContent]:
-    """处理工具调用."""
-    if name == "add":
-        a = arguments.get("a")
-        b = arguments.get("b")
-
-        if a is None or b is None:
-            return [
-                TextContent(
-                    type="text",
-                    text="错误: 参数 'a' 和 'b' 是必需的",
-                )
-            ]
+def _error_result(message: str) -> CallToolResult:
+    # isError 告知客户端调用失败：客户端不缓存该结果，并把它作为失败的工具调用交给 LLM
+    return CallToolResult(content=[TextContent(type="text", text=f"错误: {message}")], isError=True)
 
-        try:
-            result = float(a) + float(b)
-            return [
-                TextContent(
-                    type="text",
-                    text=f"结果: {result}",
-                )
-            ]
-        except (ValueError, TypeError) as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"错误: 无效的输入 - {str(e)}",
-                )
-            ]
-    else:
-        return [
-            TextContent(
-                type="text",
-                text=f"错误: 未知的工具 '{name}'",
-            )
-        ]
 
+@server.call_tool()
+async def call_tool(name: str, arguments: dict[str, Any]) -> list[TextContent] | CallToolResult:
+    """处理工具调用（server 为每个请求创建独立的任务，慢调用不会阻塞其他请求）."""
+    if name == BATCH_TOOL_NAME:
+        calls = arguments.get("calls")
+        if not isinstance(arguments.get("tool"), str) or not isinstance(calls, list):
+            return _error_result("参数 'tool' 和 'calls' 是必需的")
+        results = await registry.call_batch(arguments["tool"], calls)
+        return [TextContent(type="text", text=json.dumps(results, ensure_ascii=False))]
+    try:
+        text = await registry.call(name, arguments)
+    except ToolInputError as e:
+        return _error_result(str(e))
+    return [TextContent(type="text", text=text)]
 
-async def main():
-    """运行 MCP 服务器."""
+
+async def run_stdio():
+    """通过 stdio 运行 MCP 服务器."""
     async with stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -87,5 +258,52 @@ async def main():
         )
 
 
+async def run_http(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None):
+    """以 streamable HTTP 运行 MCP 服务器，端点为 /mcp/；指定 socket_path 时监听 Unix domain socket."""
+    import uvicorn
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+
+    session_manager = StreamableHTTPSessionManager(app=server)
+
+    async def handle_streamable_http(scope, receive, send):
+        await session_manager.handle_request(scope, receive, send)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with session_manager.run():
+            yield
+
+    app = Starlette(routes=[Mount("/mcp", app=handle_streamable_http)], lifespan=lifespan)
+    if socket_path is not None:
+        config = uvicorn.Config(app, uds=socket_path, log_level="warning")
+    else:
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+    await uvicorn.Server(config).serve()
+
+
+async def main(argv: Optional[list[str]] = None):
+    """运行 MCP 服务器."""
+    parser = argparse.ArgumentParser(description="MCP tool server")
+    parser.add_argument("--transport", choices=("stdio", "http", "unix"), default="stdio")
+    parser.add_argument("--host", default="127.0.0.1", help="http 监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="http 监听端口")
+    parser.add_argument("--socket", default="/tmp/agent-mcp.sock", help="unix socket 路径")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.transport == "stdio":
+            await run_stdio()
+        elif args.transport == "http":
+            await run_http(args.host, args.port)
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(args.socket)
+            await run_http(socket_path=args.socket)
+    finally:
+        registry.shutdown()
+
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,83 +1,276 @@
 """将 MCP 工具转换为 LangChain 工具."""
 
 import asyncio
-from typing import Any, Optional
+import json
+import math
+import threading
+from typing import Any, Optional, Union
 
 from langchain_core.tools import StructuredTool
-from pydantic import BaseModel, Field
+from pydantic import ValidationError
 
-from agent.mcp.client import call_mcp_tool_sync
+from agent.blobs import offload_text
+from agent.cache import CacheStats, TTLCache
+from agent.config import get_tool_cache_max_entries, get_tool_cache_ttl
+from agent.metrics import get_metrics
+from agent.mcp.discovery import (
+    afetch_tool_specs,
+    fetch_tool_specs,
+    load_cached_tool_specs,
+    refresh_in_background,
+)
+from agent.mcp.schema import CompiledToolSchema, compile_tool_schema, format_errors
 
+# 批量调用中单组参数失败时，server 以该前缀的错误文本作为这组参数的结果（见 agent.mcp.server）
+ERROR_PREFIX = "错误: "
 
-async def load_mcp_tools():
-    """从 MCP server 加载工具并转换为 LangChain 工具."""
-    from agent.mcp.client import MCPClient
 
+def _canonical(value: Any) -> Any:
+    """规范化参数：字典按键排序，整数值的浮点数统一为整数（1.0 与 1 视为相同）."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer():
+        return int(value)
+    return value
+
+
+class ToolResultCache:
+    """确定性 MCP 工具的结果缓存.
+
+    只有 server 在 Tool 的 ``_meta`` 中声明 ``cacheable: true`` 的工具才会被缓存，
+    可选的 ``cache_ttl``（秒）覆盖默认有效期。
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache: TTLCache[str, str] = TTLCache(max_entries, ttl)
+        self.stats = CacheStats()
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: dict[str, Any]) -> str:
+        encoded = json.dumps(_canonical(arguments), ensure_ascii=False, separators=(",", ":"), default=str)
+        return f"{tool_name}:{encoded}"
+
+    def get(self, tool_name: str, arguments: dict[str, Any]) -> Optional[str]:
+        result = self._cache.get(self.make_key(tool_name, arguments))
+        self.stats.record(result is not None)
+        return result
+
+    def set(self, tool_name: str, arguments: dict[str, Any], result: str, ttl: Optional[float] = None) -> None:
+        self._cache.set(self.make_key(tool_name, arguments), result, ttl)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+_tool_result_cache: Optional[ToolResultCache] = None
+_tool_result_cache_lock = threading.Lock()
+
+
+def get_tool_result_cache() -> Optional[ToolResultCache]:
+    """获取全局工具结果缓存；AGENT_TOOL_CACHE_MAX_ENTRIES 为 0 时返回 None."""
+    global _tool_result_cache
+    with _tool_result_cache_lock:
+        if _tool_result_cache is None and get_tool_cache_max_entries() > 0:
+            _tool_result_cache = ToolResultCache(get_tool_cache_max_entries(), get_tool_cache_ttl())
+            get_metrics().register_cache("tool_result", _tool_result_cache.stats)
+        return _tool_result_cache
+
+
+def _cache_policy(spec: dict[str, Any]) -> tuple[bool, Optional[float]]:
+    """读取 server 声明的缓存策略：(是否可缓存, ttl)."""
+    meta = spec.get("_meta") or {}
+    ttl = meta.get("cache_ttl")
+    return bool(meta.get("cacheable")), float(ttl) if ttl is not None else None
+
+
+# 已加载工具的调用策略：工具名 -> (结果缓存, 缓存 ttl, 是否支持批量调用)
+_tool_policies: dict[str, tuple[Optional[ToolResultCache], Optional[float], bool]] = {}
+
+# 已加载工具的参数模型：批量调用在本地校验参数，非法参数不发送给 server
+_tool_schemas: dict[str, CompiledToolSchema] = {}
+
+
+def _split_cached(
+    name: str, arguments_list: list[dict[str, Any]]
+) -> tuple[list[Optional[str]], list[int], Optional[ToolResultCache], Optional[float], bool]:
+    """先校验参数并查结果缓存，返回 (已有结果, 需要调用的下标, 缓存, ttl, 是否支持批量调用).
+
+    arguments_list 中的参数会被替换为校验后规范化的参数；校验失败的参数直接得到错误文本。
+    """
+    cache, cache_ttl, batchable = _tool_policies.get(name, (None, None, False))
+    schema = _tool_schemas.get(name)
+    results: list[Optional[str]] = []
+    for i, arguments in enumerate(arguments_list):
+        if schema is not None:
+            try:
+                arguments_list[i] = arguments = schema.validate(arguments)
+            except ValidationError as e:
+                results.append(f"{ERROR_PREFIX}参数无效 - {format_errors(e)}")
+                continue
+        results.append(cache.get(name, arguments) if cache is not None else None)
+    missing = [i for i, result in enumerate(results) if result is None]
+    return results, missing, cache, cache_ttl, batchable
+
+
+def _fill(
+    name: str,
+    arguments_list: list[dict[str, Any]],
+    results: list[Optional[str]],
+    missing: list[int],
+    fetched: list[str],
+    cache: Optional[ToolResultCache],
+    cache_ttl: Optional[float],
+) -> list[str]:
+    fetched_by_index = dict(zip(missing, fetched))
+    if cache is not None:
+        for i, result in fetched_by_index.items():
+            # 失败的调用不缓存，相同参数下次仍会重新执行
+            if not result.startswith(ERROR_PREFIX):
+                cache.set(name, arguments_list[i], result, cache_ttl)
+    return [fetched_by_index[i] if result is None else result for i, result in enumerate(results)]
+
+
+async def batch_call_mcp_tool(name: str, arguments_list: list[dict[str, Any]]) -> list[str]:
+    """对同一工具执行多组参数，结果顺序与 arguments_list 一致.
+
+    命中结果缓存的参数不再调用；其余参数在 server 支持时通过一次批量请求执行，
+    否则并发地逐个调用。
+    """
+    from agent.mcp.client import call_mcp_tool, call_mcp_tool_batch
+
+    arguments_list = list(arguments_list)
+    results, missing, cache, cache_ttl, batchable = _split_cached(name, arguments_list)
+    pending = [arguments_list[i] for i in missing]
+    if not pending:
+        fetched = []
+    elif batchable:
+        fetched = await call_mcp_tool_batch(name, pending)
+    else:
+        fetched = list(await asyncio.gather(*(call_mcp_tool(name, arguments) for arguments in pending)))
+    return _fill(name, arguments_list, results, missing, fetched, cache, cache_ttl)
+
+
+def batch_call_mcp_tool_sync(name: str, arguments_list: list[dict[str, Any]]) -> list[str]:
+    """batch_call_mcp_tool 的同步版本."""
+    from agent.mcp.client import call_mcp_tool_batch_sync, call_mcp_tool_sync
+
+    arguments_list = list(arguments_list)
+    results, missing, cache, cache_ttl, batchable = _split_cached(name, arguments_list)
+    pending = [arguments_list[i] for i in missing]
+    if not pending:
+        fetched = []
+    elif batchable:
+        fetched = call_mcp_tool_batch_sync(name, pending)
+    else:
+        fetched = [call_mcp_tool_sync(name, arguments) for arguments in pending]
+    return _fill(name, arguments_list, results, missing, fetched, cache, cache_ttl)
+
+
+async def load_mcp_tools(refresh: bool = True):
+    """从 MCP server 加载工具并转换为 LangChain 工具.
+
+    工具来自 MCP_SERVERS 配置的全部 server（并发获取，多个 server 时工具名带 server 前缀），
+    工具发现与后续的工具调用共用全局会话池中的常驻会话；
+    命中磁盘上的工具 schema 缓存时不等待 server 启动。
+
+    Args:
+        refresh: 命中缓存时是否立即在后台刷新缓存；为 False 时由调用方
+            在合适的时机调用 refresh_in_background
+    """
+    specs = load_cached_tool_specs()
+    if specs is None:
+        specs = await afetch_tool_specs()
+    elif refresh:
+        refresh_in_background()
+    return _convert_mcp_tools(specs)
+
+
+class MCPTool(StructuredTool):
+    """MCP 工具对应的 LangChain 工具.
+
+    StructuredTool 默认把参数模型的每个字段（包括未提供的可选参数）按字段名传给函数，
+    这里改为传入编译后的参数模型校验并导出的 JSON 参数：只包含调用方提供的参数，键为 schema 中的参数名。
+    """
+
+    compiled: CompiledToolSchema
+
+    def _parse_input(self, tool_input: Union[str, dict], tool_call_id: Optional[str]) -> Union[str, dict[str, Any]]:
+        if isinstance(tool_input, dict):
+            return self.compiled.validate(tool_input)
+        return super()._parse_input(tool_input, tool_call_id)
+
+
+def _convert_mcp_tools(specs: list[dict[str, Any]]) -> list[StructuredTool]:
+    """将 MCP 工具 schema 转换为 LangChain 工具."""
     tools = []
-    async with MCPClient() as client:
-        mcp_tools = await client.list_tools()
-
-        for mcp_tool in mcp_tools.tools:
-            # 从 inputSchema 提取参数信息
-            schema = mcp_tool.inputSchema
-            properties = schema.get("properties", {})
-            required = schema.get("required", [])
-
-            # 创建 Pydantic 模型用于参数验证
-            fields = {}
-            for prop_name, prop_info in properties.items():
-                prop_type = prop_info.get("type", "string")
-                prop_desc = prop_info.get("description", "")
-
-                # 映射 JSON Schema 类型到 Python 类型
-                if prop_type == "number":
-                    python_type = float
-                elif prop_type == "integer":
-                    python_type = int
-                elif prop_type == "boolean":
-                    python_type = bool
-                else:
-                    python_type = str
-
-                # 创建字段
-                field_kwargs = {"description": prop_desc}
-                if prop_name in required:
-                    field_kwargs["..."] = ...  # 必需字段
-                else:
-                    field_kwargs["default"] = None
-
-                fields[prop_name] = (python_type, Field(**field_kwargs))
-
-            # 动态创建 Pydantic 模型
-            ToolInput = type(
-                f"{mcp_tool.name.capitalize()}Input",
-                (BaseModel,),
-                {
-                    "__annotations__": {k: v[0] for k, v in fields.items()},
-                    **{k: v[1] for k, v in fields.items()},
-                }
-            )
-
-            # 创建工具调用函数
-            def make_tool_func(tool_name: str):
-                def tool_func(**kwargs: Any) -> str:
-                    """调用 MCP 工具."""
-                    return call_mcp_tool_sync(tool_name, kwargs)
-                return tool_func
-
-            # 创建 LangChain 工具
-            langchain_tool = StructuredTool.from_function(
-                func=make_tool_func(mcp_tool.name),
-                name=mcp_tool.name,
-                description=mcp_tool.description,
-                args_schema=ToolInput,
-            )
-
-            tools.append(langchain_tool)
+    for spec in specs:
+        # 批量调用入口不是面向 LLM 的工具
+        if (spec.get("_meta") or {}).get("batch"):
+            continue
+
+        # 参数模型按 schema 哈希缓存，支持嵌套对象、数组、enum 等完整的 JSON Schema；
+        # LangChain 调用工具前用它校验参数，非法参数不会发送给 server
+        compiled = compile_tool_schema(spec["name"], spec.get("inputSchema"))
+        _tool_schemas[spec["name"]] = compiled
+
+        # 可缓存的工具先查结果缓存，命中时不再跨进程调用
+        cacheable, cache_ttl = _cache_policy(spec)
+        cache = get_tool_result_cache() if cacheable else None
+        _tool_policies[spec["name"]] = (cache, cache_ttl, bool((spec.get("_meta") or {}).get("batchable")))
+
+        # 创建工具调用函数（同步与异步版本共用同一个会话池）
+        def make_tool_func(tool_name: str, cache: Optional[ToolResultCache], cache_ttl: Optional[float]):
+            def tool_func(**arguments: Any) -> tuple[str, Optional[dict[str, Any]]]:
+                """调用 MCP 工具."""
+                if cache is not None and (cached := cache.get(tool_name, arguments)) is not None:
+                    return offload_text(cached)
+                # 延迟导入：从缓存构建 graph 时无需加载 mcp SDK
+                from agent.mcp.client import call_mcp_tool_sync
+
+                result = call_mcp_tool_sync(tool_name, arguments)
+                if cache is not None:
+                    cache.set(tool_name, arguments, result, cache_ttl)
+                return offload_text(result)
+            return tool_func
+
+        def make_tool_coroutine(tool_name: str, cache: Optional[ToolResultCache], cache_ttl: Optional[float]):
+            async def tool_coroutine(**arguments: Any) -> tuple[str, Optional[dict[str, Any]]]:
+                """异步调用 MCP 工具."""
+                if cache is not None and (cached := cache.get(tool_name, arguments)) is not None:
+                    return offload_text(cached)
+                from agent.mcp.client import call_mcp_tool
+
+                result = await call_mcp_tool(tool_name, arguments)
+                if cache is not None:
+                    cache.set(tool_name, arguments, result, cache_ttl)
+                return offload_text(result)
+            return tool_coroutine
+
+        # 创建 LangChain 工具：过长的结果写入 blob 存储，ToolMessage 的 content 是截断视图，artifact 是 blob 引用；
+        # server 报告失败（isError）时客户端抛出 ToolException，得到 status="error" 的 ToolMessage，结果也不会写入缓存
+        langchain_tool = MCPTool.from_function(
+            func=make_tool_func(spec["name"], cache, cache_ttl),
+            coroutine=make_tool_coroutine(spec["name"], cache, cache_ttl),
+            name=spec["name"],
+            description=spec.get("description", ""),
+            args_schema=compiled.model,
+            response_format="content_and_artifact",
+            handle_tool_error=True,
+            compiled=compiled,
+        )
+
+        tools.append(langchain_tool)
 
     return tools
 
 
-def get_mcp_tools_sync():
-    """同步获取 MCP 工具."""
-    return asyncio.run(load_mcp_tools())
+def get_mcp_tools_sync(refresh: bool = True):
+    """同步获取 MCP 工具；优先使用磁盘上的工具 schema 缓存（参数同 load_mcp_tools）."""
+    specs = load_cached_tool_specs()
+    if specs is None:
+        specs = fetch_tool_specs()
+    elif refresh:
+        refresh_in_background()
+    return _convert_mcp_tools(specs)
@@ -0,0 +1,440 @@
+"""In-process metrics for the agent loop, exposed as a snapshot and in Prometheus text format.
+
+指标在热路径上只做一次加锁的计数（直方图用二分查找定位桶），不分配对象；
+队列深度、缓存命中率这类状态量在采集时通过回调读取，不在热路径上维护::
+
+    from agent.metrics import get_metrics
+
+    get_metrics().snapshot()            # 进程内快照（dict）
+    get_metrics().render_prometheus()   # Prometheus text exposition format
+
+HTTP 服务在 ``GET /metrics`` 暴露 Prometheus 格式；其他进程可以设置 AGENT_METRICS_PORT
+在后台线程中启动一个只提供 /metrics 的 HTTP 服务。
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator, Optional
+
+from agent.config import get_metrics_enabled, get_metrics_port
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶（秒）：覆盖本地工具调用的毫秒级到 LLM 长回复的分钟级
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# token 数直方图的桶
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...], enabled: bool):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def _key(self, labels: tuple[str, ...]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {labels}")
+        return tuple(str(label) for label in labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """Prometheus 文本格式的样本行."""
+
+    @abstractmethod
+    def snapshot(self) -> dict[str, Any]:
+        """进程内快照."""
+
+
+class Counter(_Metric):
+    """单调递增的计数."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), enabled: bool = True):
+        super().__init__(name, help_text, labelnames, enabled)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self.samples().items()
+        ]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {",".join(key): value for key, value in self.samples().items()}
+
+
+class Histogram(_Metric):
+    """固定桶的直方图，快照中附带按桶估算的分位数."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        enabled: bool = True,
+    ):
+        super().__init__(name, help_text, labelnames, enabled)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf 桶计数, 总和]
+        self._series: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """记录代码块的耗时（秒）."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> dict[LabelValues, list[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def _quantile(self, counts: list[float], total: float, q: float) -> float:
+        """在桶内线性插值估算分位数."""
+        rank = q * total
+        cumulative = 0.0
+        lower = 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1] if self.buckets else 0.0
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, series in self.samples().items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, math.inf), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+    def snapshot(self) -> dict[str, Any]:
+        result = {}
+        for key, series in self.samples().items():
+            counts = series[:-1]
+            total = sum(counts)
+            result[",".join(key)] = {
+                "count": int(total),
+                "sum": series[-1],
+                "mean": series[-1] / total if total else 0.0,
+                "p50": self._quantile(counts, total, 0.50),
+                "p90": self._quantile(counts, total, 0.90),
+                "p99": self._quantile(counts, total, 0.99),
+            }
+        return result
+
+
+# 采集时读取的状态量：返回 {标签值元组: 数值}
+GaugeCallback = Callable[[], dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """采集时通过回调读取的状态量（队列深度、缓存命中率等）.
+
+    同一个 gauge 可以有多个来源（例如每个 HTTP 服务实例、每个 MCP server），按 source 名称注册，
+    重复注册同名来源会替换旧的回调。
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), enabled: bool = True):
+        super().__init__(name, help_text, labelnames, enabled)
+        self._callbacks: dict[str, GaugeCallback] = {}
+
+    def register(self, source: str, callback: GaugeCallback) -> None:
+        with self._lock:
+            self._callbacks[source] = callback
+
+    def unregister(self, source: str) -> None:
+        with self._lock:
+            self._callbacks.pop(source, None)
+
+    def samples(self) -> dict[LabelValues, float]:
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        values: dict[LabelValues, float] = {}
+        for source, callback in callbacks:
+            try:
+                for key, value in callback().items():
+                    values[self._key(key)] = float(value)
+            except Exception as e:
+                logger.warning(f"读取指标 {self.name}（{source}）失败: {e}")
+        return values
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self.samples().items()
+        ]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {",".join(key): value for key, value in self.samples().items()}
+
+
+class MetricsRegistry:
+    """agent 的全部指标."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: dict[str, _Metric] = {}
+
+        self.llm_latency = self._add(Histogram(
+            "agent_llm_latency_seconds", "LLM call latency (cache misses only)", ("model",), enabled=enabled,
+        ))
+        self.llm_ttft = self._add(Histogram(
+            "agent_llm_time_to_first_token_seconds", "Time until the first streamed chunk", ("model",),
+            enabled=enabled,
+        ))
+        self.llm_tokens = self._add(Histogram(
+            "agent_llm_tokens", "Tokens per LLM call", ("model", "kind"), buckets=TOKEN_BUCKETS, enabled=enabled,
+        ))
+        self.llm_prompt_cache_tokens = self._add(Counter(
+            "agent_llm_prompt_cache_tokens_total",
+            "Prompt tokens served from / missing the provider's context cache",
+            ("model", "result"),
+            enabled=enabled,
+        ))
+        self.route_decisions = self._add(Counter(
+            "agent_model_route_decisions_total",
+            "Model routing decisions by route and reason (heuristic / classifier / low_confidence / tool_error / llm_error)",
+            ("route", "reason"),
+            enabled=enabled,
+        ))
+        self.route_latency = self._add(Histogram(
+            "agent_model_route_latency_seconds", "LLM call latency by model route (cache misses only)", ("route",),
+            enabled=enabled,
+        ))
+        self.route_tokens = self._add(Counter(
+            "agent_model_route_tokens_total", "Tokens billed per model route", ("route", "kind"), enabled=enabled,
+        ))
+        self.node_latency = self._add(Histogram(
+            "agent_node_seconds", "Graph node execution time", ("node",), enabled=enabled,
+        ))
+        self.tool_call_latency = self._add(Histogram(
+            "agent_tool_call_seconds",
+            "MCP tool call time by phase (acquire: waiting for a session, execute: JSON-RPC round trip)",
+            ("tool", "phase"),
+            enabled=enabled,
+        ))
+        self.tool_speculation = self._add(Counter(
+            "agent_tool_speculation_total",
+            "Tool calls started while the LLM was still streaming (started / used / discarded)",
+            ("outcome",),
+            enabled=enabled,
+        ))
+        self.blob_operations = self._add(Counter(
+            "agent_blob_operations_total",
+            "Blob store operations (put / dedup / read / miss / evict)",
+            ("op",),
+            enabled=enabled,
+        ))
+        self.blob_store_bytes = self._add(Gauge(
+            "agent_blob_store_bytes", "Size of the blob store (total / referenced by live messages)", ("kind",),
+            enabled=enabled,
+        ))
+        self.mcp_connect_latency = self._add(Histogram(
+            "agent_mcp_connect_seconds",
+            "MCP session setup time by phase (spawn: transport/process start, handshake: initialize)",
+            ("server", "phase"),
+            enabled=enabled,
+        ))
+        self.turn_latency = self._add(Histogram(
+            "agent_turn_seconds", "End-to-end agent turn time", ("entrypoint",), enabled=enabled,
+        ))
+        self.turns_incomplete = self._add(Counter(
+            "agent_turns_incomplete_total",
+            "Turns answered with a partial answer, by reason (deadline / max_tool_rounds)",
+            ("reason",),
+            enabled=enabled,
+        ))
+        self.worker_restarts = self._add(Counter(
+            "agent_worker_restarts_total", "Restarts of supervised worker processes", ("worker",), enabled=enabled,
+        ))
+        self.worker_up = self._add(Gauge(
+            "agent_worker_up", "Whether a supervised worker passes its health check", ("worker",), enabled=enabled,
+        ))
+        self.cache_hit_ratio = self._add(Gauge(
+            "agent_cache_hit_ratio", "Hit ratio of in-process caches", ("cache",), enabled=enabled,
+        ))
+        self.cache_requests = self._add(Gauge(
+            "agent_cache_requests", "Lookups of in-process caches", ("cache", "result"), enabled=enabled,
+        ))
+        self.queue_depth = self._add(Gauge(
+            "agent_queue_depth", "Depth of internal queues and pools", ("queue",), enabled=enabled,
+        ))
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_cache(self, name: str, stats) -> None:
+        """把 CacheStats 注册为命中率与请求数 gauge."""
+        self.cache_hit_ratio.register(name, lambda: {(name,): stats.hit_ratio})
+        self.cache_requests.register(name, lambda: {(name, "hit"): stats.hits, (name, "miss"): stats.misses})
+
+    def register_queue(self, source: str, callback: Callable[[], dict[str, float]]) -> None:
+        """注册队列深度来源：callback 返回 {队列名: 深度}."""
+        self.queue_depth.register(source, lambda: {(queue,): depth for queue, depth in callback().items()})
+
+    def snapshot(self) -> dict[str, Any]:
+        """进程内快照：直方图给出 count/sum/mean 与估算的 p50/p90/p99."""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _with_label(sample: str, label: str, value: str) -> str:
+    pair = f'{label}="{_escape(value)}"'
+    name, brace, rest = sample.partition("{")
+    if brace:
+        # 已带有该标签的样本（例如 supervisor 按 worker 记录的指标）保持不变
+        if f'{label}="' in rest.partition("}")[0]:
+            return sample
+        return f"{name}{{{pair},{rest}"
+    name, _, number = sample.partition(" ")
+    return f"{name}{{{pair}}} {number}"
+
+
+def merge_prometheus(sources: dict[str, str], label: str = "worker") -> str:
+    """合并多个进程的 Prometheus 文本：每个样本附加 {label="来源"}，同一指标族的样本归并在一起."""
+    families: dict[str, tuple[list[str], list[str]]] = {}
+    for source, text in sources.items():
+        family: Optional[str] = None
+        for line in text.splitlines():
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    header, _ = families.setdefault(family, ([], []))
+                    if line not in header:
+                        header.append(line)
+            elif line and family is not None:
+                families[family][1].append(_with_label(line, label, source))
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """获取全局指标；AGENT_METRICS_ENABLED=false 时所有记录操作都是空操作."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(get_metrics_enabled())
+    return _metrics
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """在后台线程中提供 /metrics；port 默认读取 AGENT_METRICS_PORT（0 表示不启动）."""
+    global _metrics_server
+    port = get_metrics_port() if port is None else port
+    with _metrics_lock:
+        if _metrics_server is not None or not port:
+            return _metrics_server
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _metrics_server.daemon_threads = True
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"指标服务已启动: http://{host}:{port}/metrics")
+    return _metrics_server
@@ -0,0 +1,144 @@
+"""Opt-in per-turn profiler that can be switched on and off at runtime.
+
+开启后按采样率为每轮对话生成一份 profile：
+
+- ``cprofile``：标准库 cProfile，写出 ``.prof`` 文件（``python -m pstats`` 或 snakeviz 查看）
+- ``pyinstrument``：采样 profiler，支持 asyncio，写出 ``.html`` 火焰图（需要安装 pyinstrument）
+
+Python 的 profiler 是进程级的，因此同一时刻只 profile 一轮对话，其他并发的轮次直接跳过；
+HTTP 服务中并发执行的其他轮次也会出现在这份 profile 里。
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional
+from uuid import uuid4
+
+from agent.config import get_profile_dir, get_profile_mode, get_profile_sample_rate
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("off", "cprofile", "pyinstrument")
+
+
+class TurnProfiler:
+    """按轮次采样的 profiler."""
+
+    def __init__(self, mode: str = "off", directory: str = "profiles", sample_rate: float = 1.0):
+        self.mode = "off"
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.last_profile: Optional[str] = None
+        self._busy = threading.Lock()
+        self.configure(mode)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def configure(
+        self, mode: Optional[str] = None, sample_rate: Optional[float] = None, directory: Optional[str] = None
+    ) -> dict[str, Any]:
+        """运行时切换 profiler，返回当前状态."""
+        if mode is not None:
+            mode = mode.lower()
+            if mode not in PROFILE_MODES:
+                raise ValueError(f"未知的 profiler: {mode}，可选值: {', '.join(PROFILE_MODES)}")
+            if mode == "pyinstrument":
+                try:
+                    import pyinstrument  # noqa: F401
+                except ImportError:
+                    raise ValueError("pyinstrument 未安装，请先安装: uv pip install pyinstrument") from None
+            self.mode = mode
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if directory is not None:
+            self.directory = directory
+        return self.status()
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "directory": self.directory,
+            "last_profile": self.last_profile,
+        }
+
+    def _path(self, name: str, suffix: str) -> Path:
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)[:64]
+        return directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:6]}-{safe_name}{suffix}"
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[Optional[Path]]:
+        """profile 代码块；未开启、未被采样或已有轮次在 profile 时 yield None."""
+        mode = self.mode
+        if mode == "off" or random.random() >= self.sample_rate:
+            yield None
+            return
+        if not self._busy.acquire(blocking=False):
+            yield None
+            return
+        try:
+            if mode == "cprofile":
+                with self._cprofile(name) as path:
+                    yield path
+            else:
+                with self._pyinstrument(name) as path:
+                    yield path
+        finally:
+            self._busy.release()
+
+    @contextmanager
+    def _cprofile(self, name: str) -> Iterator[Path]:
+        import cProfile
+
+        path = self._path(name, ".prof")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            self._save(path, lambda: profiler.dump_stats(path))
+
+    @contextmanager
+    def _pyinstrument(self, name: str) -> Iterator[Path]:
+        from pyinstrument import Profiler
+
+        path = self._path(name, ".html")
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield path
+        finally:
+            profiler.stop()
+            self._save(path, lambda: path.write_text(profiler.output_html(), encoding="utf-8"))
+
+    def _save(self, path: Path, write) -> None:
+        try:
+            write()
+        except OSError as e:
+            logger.warning(f"写入 profile 失败: {e}")
+            return
+        self.last_profile = str(path)
+        logger.info(f"profile 已写入 {path}")
+
+
+_profiler: Optional[TurnProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> TurnProfiler:
+    """获取全局 profiler（初始状态读取 AGENT_PROFILE 等配置）."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = TurnProfiler(get_profile_mode(), get_profile_dir(), get_profile_sample_rate())
+        return _profiler
@@ -0,0 +1,115 @@
+"""Prefix-stable prompt assembly and DeepSeek context-cache accounting.
+
+DeepSeek 会缓存请求的前缀：与此前请求逐字节相同的前缀部分命中缓存，计费更低、首 token 更快。
+因此发送给 LLM 的 prompt 按以下顺序组装，多轮之间只在末尾追加：
+
+1. 固定的 system prompt（AGENT_SYSTEM_PROMPT，不含日期等易变内容，不写入会话状态）
+2. 工具 schema（绑定前按名称排序，不受 MCP server 返回顺序影响）
+3. 较早的历史（HistoryCompactor 只在超出预算时批量改写，平时保持不变）
+4. 本轮的新消息
+
+每次 LLM 调用返回的 ``prompt_cache_hit_tokens`` / ``prompt_cache_miss_tokens`` 写入日志、
+generation span 的 usage 与指标，并按 thread_id 累计会话级的命中率。
+"""
+
+import logging
+import threading
+from typing import Any, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from agent.cache import TTLCache
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT_ID = "system-prompt"
+
+
+class PromptAssembler:
+    """组装发送给 LLM 的消息：固定的 system prompt 在前，会话消息保持原样追加在后."""
+
+    def __init__(self, system_prompt: Optional[str] = None):
+        # 每次调用复用同一个消息对象，序列化结果逐字节相同
+        self.system_message = SystemMessage(content=system_prompt, id=SYSTEM_PROMPT_ID) if system_prompt else None
+
+    def build(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        if self.system_message is None:
+            return messages
+        return [self.system_message, *messages]
+
+
+def prompt_cache_usage(response: BaseMessage) -> Optional[tuple[int, int]]:
+    """从响应中提取 (命中, 未命中) 的 prompt token 数；服务端未报告时返回 None."""
+    token_usage = getattr(response, "response_metadata", {}).get("token_usage") or {}
+    hit = token_usage.get("prompt_cache_hit_tokens")
+    miss = token_usage.get("prompt_cache_miss_tokens")
+    if isinstance(hit, int) and isinstance(miss, int):
+        return hit, miss
+    # OpenAI 格式（prompt_tokens_details.cached_tokens），langchain 转换为 input_token_details.cache_read
+    usage_metadata = getattr(response, "usage_metadata", None) or {}
+    cache_read = (usage_metadata.get("input_token_details") or {}).get("cache_read")
+    if cache_read is None:
+        return None
+    return cache_read, usage_metadata.get("input_tokens", 0) - cache_read
+
+
+def _ratio(hit: int, miss: int) -> float:
+    return hit / (hit + miss) if hit + miss else 0.0
+
+
+class PromptCacheTracker:
+    """按会话与进程累计 DeepSeek 上下文缓存的命中 token 数."""
+
+    def __init__(self, max_sessions: int = 10000, session_ttl: float = 24 * 3600):
+        self._sessions: TTLCache[str, tuple[int, int]] = TTLCache(max_sessions, session_ttl)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_ratio(self) -> float:
+        return _ratio(self.hits, self.misses)
+
+    def record(self, response: BaseMessage, model: str, thread_id: Optional[str], generation: Any) -> None:
+        """记录一次实际发出的 LLM 调用的缓存命中情况."""
+        usage = prompt_cache_usage(response)
+        if usage is None:
+            return
+        hit, miss = usage
+        with self._lock:
+            self.hits += hit
+            self.misses += miss
+            session_hit, session_miss = hit, miss
+            if thread_id is not None:
+                previous_hit, previous_miss = self._sessions.get(thread_id) or (0, 0)
+                session_hit, session_miss = previous_hit + hit, previous_miss + miss
+                self._sessions.set(thread_id, (session_hit, session_miss))
+
+        metrics = get_metrics()
+        metrics.llm_prompt_cache_tokens.inc(model, "hit", amount=hit)
+        metrics.llm_prompt_cache_tokens.inc(model, "miss", amount=miss)
+        details = {
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": miss,
+            "prompt_cache_hit_ratio": round(_ratio(hit, miss), 4),
+            "session_prompt_cache_hit_ratio": round(_ratio(session_hit, session_miss), 4),
+        }
+        logger.info(
+            f"prompt 缓存命中 {hit}/{hit + miss} tokens（本次 {details['prompt_cache_hit_ratio']:.1%}，"
+            f"会话累计 {details['session_prompt_cache_hit_ratio']:.1%}）",
+            extra=details,
+        )
+        if generation is not None:
+            generation.update(metadata={"prompt_cache": details})
+
+    def session(self, thread_id: str) -> Optional[dict[str, Any]]:
+        """会话累计的命中情况；没有记录时返回 None."""
+        totals = self._sessions.get(thread_id)
+        if totals is None:
+            return None
+        hit, miss = totals
+        return {"hit_tokens": hit, "miss_tokens": miss, "hit_ratio": round(_ratio(hit, miss), 4)}
+
+    def stats(self) -> dict[str, Any]:
+        return {"hit_tokens": self.hits, "miss_tokens": self.misses, "hit_ratio": round(self.hit_ratio, 4)}
@@ -0,0 +1,284 @@
+"""Model cascade: send simple turns to a cheaper, faster model and escalate the rest.
+
+AGENT_MODEL_ROUTES 按从便宜到强的顺序配置若干模型，例如 ``fast=deepseek-chat,strong=deepseek-reasoner``。
+每轮对话开始时 ``route`` 节点为本轮选择模型：
+
+1. 启发式：用户消息长度、是否需要调用工具、历史轮数、是否包含代码或多个问题，合成 0~1 的复杂度，
+   映射到对应档位；复杂度离档位边界越远，置信度越高
+2. 置信度低于 AGENT_ROUTER_MIN_CONFIDENCE 时，可选地让最便宜的模型判断难度（AGENT_ROUTER_CLASSIFIER）
+3. 仍不确定时直接使用最强的模型
+
+本轮内工具调用失败、或较便宜的模型调用出错时升级到最强的模型，之后本轮不再降级。
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agent.config import (
+    get_model_routes,
+    get_router_classifier_enabled,
+    get_router_max_history_turns,
+    get_router_max_simple_chars,
+    get_router_min_confidence,
+)
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 需要调用工具的迹象：算式、数字运算或查询类动词
+TOOL_HINT = re.compile(r"\d\s*[-+*/×÷^%]\s*\d|计算|算一下|等于多少|查询|搜索|查找|调用|calculate|compute|search|look up", re.I)
+
+# 未配置 AGENT_MODEL_ROUTES 时唯一一档（DEEPSEEK_MODEL）的名称
+DEFAULT_ROUTE = "default"
+
+CLASSIFIER_PROMPT = (
+    "判断下面的用户请求对一个 AI 助手来说是否简单。简单指闲聊、事实性的短问答或一步就能完成的计算；"
+    "需要多步推理、写代码、长文分析或综合多轮上下文的属于复杂。只回答 simple 或 complex。"
+)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """级联中的一档模型."""
+
+    name: str
+    model: str
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """一次路由决策."""
+
+    route: str
+    reason: str
+    confidence: float
+
+
+def parse_model_routes(spec: str) -> list[ModelRoute]:
+    """解析 ``name=model[,name=model...]``（从便宜到强）；省略 ``name=`` 时以模型名作为路由名."""
+    routes = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        name, sep, model = entry.partition("=")
+        if not sep:
+            name, model = entry, entry
+        name, model = name.strip(), model.strip()
+        if not name or not model:
+            raise ValueError(f"无法解析模型路由: {entry!r}（格式为 name=model）")
+        routes.append(ModelRoute(name, model))
+    names = [route.name for route in routes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"模型路由名称重复: {names}")
+    return routes
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+def _tool_failed(messages: list[BaseMessage]) -> bool:
+    """最近一次工具调用的结果中是否有失败的调用."""
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            return False
+        if message.status == "error":
+            return True
+    return False
+
+
+class ModelRouter:
+    """为每轮对话在级联的模型之间选择."""
+
+    def __init__(
+        self,
+        routes: list[ModelRoute],
+        max_simple_chars: int = 400,
+        max_history_turns: int = 8,
+        min_confidence: float = 0.5,
+        classifier: Optional[BaseChatModel] = None,
+    ):
+        """初始化路由.
+
+        Args:
+            routes: 从便宜到强排列的模型
+            max_simple_chars: 用户消息达到该长度时，长度一项的复杂度记满
+            max_history_turns: 此前的对话轮数达到该值时，历史一项的复杂度记满
+            min_confidence: 启发式的置信度低于该值时交给分类器，没有分类器时使用最强的模型
+            classifier: 判断难度的小模型（通常是最便宜的一档），None 表示不使用
+        """
+        if not routes:
+            raise ValueError("至少需要一个模型路由")
+        self.routes = routes
+        self.max_simple_chars = max(1, max_simple_chars)
+        self.max_history_turns = max(1, max_history_turns)
+        self.min_confidence = min_confidence
+        self.classifier = classifier
+
+    @classmethod
+    def from_config(
+        cls, make_classifier: Optional[Callable[[str], BaseChatModel]] = None
+    ) -> Optional["ModelRouter"]:
+        """按环境变量创建路由；未配置 AGENT_MODEL_ROUTES 时返回 None（只使用 DEEPSEEK_MODEL）.
+
+        Args:
+            make_classifier: 开启 AGENT_ROUTER_CLASSIFIER 时，用最便宜一档的模型名创建分类模型
+        """
+        spec = get_model_routes()
+        if not spec:
+            return None
+        routes = parse_model_routes(spec)
+        classifier = None
+        if make_classifier is not None and get_router_classifier_enabled():
+            classifier = make_classifier(routes[0].model)
+        return cls(
+            routes,
+            max_simple_chars=get_router_max_simple_chars(),
+            max_history_turns=get_router_max_history_turns(),
+            min_confidence=get_router_min_confidence(),
+            classifier=classifier,
+        )
+
+    @property
+    def cheapest(self) -> ModelRoute:
+        return self.routes[0]
+
+    @property
+    def strongest(self) -> ModelRoute:
+        return self.routes[-1]
+
+    def complexity(self, messages: list[BaseMessage]) -> float:
+        """按启发式特征估计本轮的复杂度（0~1）."""
+        question = next((message for message in reversed(messages) if isinstance(message, HumanMessage)), None)
+        text = _text(question) if question is not None else ""
+        earlier_turns = sum(isinstance(message, HumanMessage) for message in messages) - 1
+        score = 0.5 * min(1.0, len(text) / self.max_simple_chars)
+        score += 0.3 * min(1.0, max(0, earlier_turns) / self.max_history_turns)
+        if TOOL_HINT.search(text):
+            score += 0.2
+        if "```" in text or len(re.findall(r"[?？]", text)) > 1 or text.count("\n") > 3:
+            score += 0.3
+        return min(1.0, score)
+
+    def classify(self, messages: list[BaseMessage]) -> RouteDecision:
+        """按启发式选择档位；置信度是复杂度到最近档位边界的距离（按档位宽度归一化）."""
+        score = self.complexity(messages)
+        count = len(self.routes)
+        if count == 1:
+            return RouteDecision(self.cheapest.name, "heuristic", 1.0)
+        index = min(count - 1, int(score * count))
+        distance = min(abs(score - boundary / count) for boundary in range(1, count))
+        return RouteDecision(self.routes[index].name, "heuristic", round(min(1.0, 2 * count * distance), 3))
+
+    def _classifier_request(self, messages: list[BaseMessage]) -> Optional[list[BaseMessage]]:
+        question = next((message for message in reversed(messages) if isinstance(message, HumanMessage)), None)
+        if question is None:
+            return None
+        return [SystemMessage(content=CLASSIFIER_PROMPT), HumanMessage(content=_text(question))]
+
+    def _from_classifier(self, answer: Any) -> RouteDecision:
+        label = str(answer).strip().lower()
+        if label.startswith("simple"):
+            return RouteDecision(self.cheapest.name, "classifier", 1.0)
+        if label.startswith("complex"):
+            return RouteDecision(self.strongest.name, "classifier", 1.0)
+        return RouteDecision(self.strongest.name, "low_confidence", 0.0)
+
+    def _uncertain(self, decision: RouteDecision) -> bool:
+        return decision.confidence < self.min_confidence and decision.route != self.strongest.name
+
+    def decide(self, messages: list[BaseMessage]) -> RouteDecision:
+        decision = self.classify(messages)
+        if not self._uncertain(decision):
+            return decision
+        classifier = self.classifier
+        request = self._classifier_request(messages) if classifier is not None else None
+        if classifier is None or request is None:
+            return RouteDecision(self.strongest.name, "low_confidence", decision.confidence)
+        try:
+            return self._from_classifier(classifier.invoke(request).content)
+        except Exception as e:
+            logger.warning(f"路由分类失败，使用最强的模型: {e}")
+            return RouteDecision(self.strongest.name, "low_confidence", decision.confidence)
+
+    async def adecide(self, messages: list[BaseMessage]) -> RouteDecision:
+        """decide 的异步版本."""
+        decision = self.classify(messages)
+        if not self._uncertain(decision):
+            return decision
+        classifier = self.classifier
+        request = self._classifier_request(messages) if classifier is not None else None
+        if classifier is None or request is None:
+            return RouteDecision(self.strongest.name, "low_confidence", decision.confidence)
+        try:
+            return self._from_classifier((await classifier.ainvoke(request)).content)
+        except Exception as e:
+            logger.warning(f"路由分类失败，使用最强的模型: {e}")
+            return RouteDecision(self.strongest.name, "low_confidence", decision.confidence)
+
+    def escalate(self, reason: str) -> RouteDecision:
+        """升级到最强的模型（工具调用失败或较便宜的模型出错时）."""
+        decision = RouteDecision(self.strongest.name, reason, 1.0)
+        self.record(decision)
+        return decision
+
+    def record(self, decision: RouteDecision) -> None:
+        get_metrics().route_decisions.inc(decision.route, decision.reason)
+        logger.info(
+            f"模型路由: {decision.route}（{decision.reason}，置信度 {decision.confidence:.2f}）",
+            extra={"model_route": decision.route, "route_reason": decision.reason},
+        )
+
+    def _pending(self, state: dict[str, Any]) -> Optional[str]:
+        """本次经过 route 节点时需要做的事：'classify'、'escalate' 或 None（沿用当前路由）."""
+        messages = state["messages"]
+        current = state.get("model_route")
+        if not messages:
+            return None
+        if isinstance(messages[-1], HumanMessage) or current not in {route.name for route in self.routes}:
+            return "classify"
+        if current != self.strongest.name and _tool_failed(messages):
+            return "escalate"
+        return None
+
+    def node(self, state: dict[str, Any]) -> dict[str, Any]:
+        """LangGraph 节点：新一轮开始时选择模型，本轮工具调用失败时升级."""
+        pending = self._pending(state)
+        if pending == "escalate":
+            return {"model_route": self.escalate("tool_error").route}
+        if pending == "classify":
+            decision = self.decide(state["messages"])
+            self.record(decision)
+            return {"model_route": decision.route}
+        return {}
+
+    async def anode(self, state: dict[str, Any]) -> dict[str, Any]:
+        """LangGraph 节点（异步）."""
+        pending = self._pending(state)
+        if pending == "escalate":
+            return {"model_route": self.escalate("tool_error").route}
+        if pending == "classify":
+            decision = await self.adecide(state["messages"])
+            self.record(decision)
+            return {"model_route": decision.route}
+        return {}
+
+
+def record_route_usage(route: str, usage: dict[str, int], elapsed: float) -> None:
+    """记录一次实际发出的 LLM 调用按路由统计的耗时与 token 数."""
+    metrics = get_metrics()
+    metrics.route_latency.observe(elapsed, route)
+    prompt_tokens = usage.get("input", usage.get("prompt_tokens"))
+    completion_tokens = usage.get("output", usage.get("completion_tokens"))
+    if prompt_tokens is not None:
+        metrics.route_tokens.inc(route, "prompt", amount=prompt_tokens)
+    if completion_tokens is not None:
+        metrics.route_tokens.inc(route, "completion", amount=completion_tokens)
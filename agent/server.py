@@ -0,0 +1,574 @@
+"""HTTP/SSE front end that serves many concurrent sessions from one compiled graph.
+
+所有会话共享同一个 graph（因此共享同一个 LLM 客户端与 MCP 会话池），按请求中的 thread_id
+区分会话状态。只依赖标准库的 asyncio，接口如下::
+
+    POST   /threads/{thread_id}/turns   {"message": "...", "stream": true}
+    POST   /turns                       同上，由服务端生成 thread_id
+    GET    /threads/{thread_id}         读取会话历史
+    DELETE /threads/{thread_id}         删除会话
+    GET    /health                      运行状态与排队情况
+    GET    /metrics                     Prometheus 格式的指标
+    GET    /debug/metrics               指标快照（JSON，直方图附带估算的分位数）
+    GET    /debug/profile               per-turn profiler 的状态
+    POST   /debug/profile               {"mode": "cprofile", "sample_rate": 0.1} 运行时开关 profiler
+
+流式响应使用 SSE，事件依次为 token / tool_call / tool_result / message，最后是 done 或 error。
+
+    python -m agent.server --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Optional
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage, message_to_dict
+
+from agent.config import (
+    get_server_host,
+    get_server_max_body_bytes,
+    get_server_max_in_flight,
+    get_server_max_queue,
+    get_server_port,
+    get_server_queue_timeout,
+    get_server_shutdown_timeout,
+)
+from agent.deadline import turn_deadline, unstreamed_text
+from agent.logs import dropped_records, log_context
+from agent.metrics import PROMETHEUS_CONTENT_TYPE, get_metrics
+from agent.profiling import get_profiler
+from agent.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """以指定状态码返回给客户端的错误."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """限制同时执行的对话轮数：超出的请求排队等待，队列满或等待超时即拒绝.
+
+    - 最多同时执行 ``max_in_flight`` 轮
+    - 最多 ``max_queue`` 轮排队等待，超出时立即返回 503（背压）
+    - 排队超过 ``queue_timeout`` 秒返回 503
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.closed = False
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _reject(self, message: str, retry_after: Optional[float] = None) -> HTTPError:
+        self.rejected += 1
+        return HTTPError(503, message, retry_after)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self.closed:
+            raise self._reject("服务正在关闭")
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise self._reject("服务繁忙，排队已满", retry_after=1)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except TimeoutError:
+            raise self._reject(f"排队超过 {self.queue_timeout:g} 秒", retry_after=1) from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            if self.in_flight == 0:
+                self._idle.set()
+
+    def close(self) -> None:
+        """不再接受新的对话轮."""
+        self.closed = True
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """等待进行中的对话轮全部结束；超时返回 False."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.waiting,
+            "rejected": self.rejected,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+
+class Request:
+    """解析后的 HTTP 请求."""
+
+    def __init__(self, method: str, path: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "请求体不是合法的 JSON") from None
+        if not isinstance(data, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象")
+        return data
+
+
+async def read_request(reader: asyncio.StreamReader, max_body_bytes: int) -> Optional[Request]:
+    """读取一个请求；连接已关闭时返回 None."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "无法解析请求行") from None
+
+    headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > max_body_bytes:
+        raise HTTPError(413, f"请求体超过 {max_body_bytes} 字节")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), urlsplit(target).path, headers, body)
+
+
+def _head(status: int, headers: dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_body(
+    writer: asyncio.StreamWriter,
+    status: int,
+    body: bytes,
+    content_type: str,
+    keep_alive: bool = True,
+    headers: Optional[dict[str, str]] = None,
+) -> None:
+    writer.write(_head(status, {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **(headers or {}),
+    }) + body)
+    await writer.drain()
+
+
+async def send_json(
+    writer: asyncio.StreamWriter,
+    status: int,
+    payload: Any,
+    keep_alive: bool = True,
+    headers: Optional[dict[str, str]] = None,
+) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send_body(writer, status, body, "application/json; charset=utf-8", keep_alive, headers)
+
+
+def _sse(event: str, data: dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def turn_events(app, thread_id: str, message: str) -> AsyncGenerator[tuple[str, dict[str, Any]], None]:
+    """执行一轮对话，按到达顺序产出 (事件名, 数据)."""
+    state = {"messages": [HumanMessage(content=message, id=str(uuid4()))]}
+    config = {"configurable": {"thread_id": thread_id}}
+    # 已流式输出的文本，按消息 id 累计
+    streamed: dict[str, str] = {}
+    final: Optional[AIMessage] = None
+
+    async for mode, payload in app.astream(state, config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            if not isinstance(chunk, AIMessageChunk) or metadata.get("langgraph_node") != "agent":
+                continue
+            for tool_call_chunk in chunk.tool_call_chunks:
+                if tool_call_chunk.get("name"):
+                    yield "tool_call", {"name": tool_call_chunk["name"]}
+            if chunk.content:
+                if chunk.id is not None:
+                    streamed[chunk.id] = streamed.get(chunk.id, "") + chunk.text
+                yield "token", {"content": chunk.content}
+            continue
+
+        # updates 模式：agent/tools 节点执行完毕
+        for node, update in payload.items():
+            if node not in ("agent", "tools"):
+                continue
+            for new_message in (update or {}).get("messages", []):
+                if isinstance(new_message, ToolMessage):
+                    yield "tool_result", {
+                        "name": new_message.name,
+                        "content": new_message.content,
+                        "status": new_message.status,
+                    }
+                elif isinstance(new_message, AIMessage):
+                    final = new_message
+                    text = unstreamed_text(new_message, streamed)
+                    if not text:
+                        continue
+                    if new_message.id in streamed:
+                        # 截断的部分回答：以 token 事件补上未完成的原因
+                        yield "token", {"content": text}
+                    else:
+                        # 未经流式输出的响应（例如关闭了流式调用）整体发送
+                        yield "message", {"content": text}
+
+    # finish_reason 为 deadline / max_tool_rounds 时 response 是未完成的部分回答
+    yield "done", {
+        "thread_id": thread_id,
+        "response": final.content if final else "",
+        "finish_reason": final.response_metadata.get("finish_reason") if final else None,
+    }
+
+
+class AgentServer:
+    """在一个进程内并发服务多个会话的 HTTP/SSE 服务."""
+
+    def __init__(
+        self,
+        app,
+        admission: Optional[AdmissionController] = None,
+        max_body_bytes: Optional[int] = None,
+    ):
+        """初始化服务.
+
+        Args:
+            app: 编译后的 agent graph（需配置 checkpointer，以按 thread_id 保存会话）
+            admission: 准入控制；默认按环境变量创建
+            max_body_bytes: 请求体大小上限
+        """
+        self.app = app
+        self.admission = admission or AdmissionController(
+            get_server_max_in_flight(), get_server_max_queue(), get_server_queue_timeout()
+        )
+        self.max_body_bytes = max_body_bytes if max_body_bytes is not None else get_server_max_body_bytes()
+        self.tracer = get_tracer()
+        self.metrics = get_metrics()
+        self.profiler = get_profiler()
+        self._active_threads: set[str] = set()
+        self._connections: set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.metrics.register_queue("server", lambda: {
+            "server_in_flight": self.admission.in_flight,
+            "server_waiting": self.admission.waiting,
+        })
+
+    # ---- 连接处理 ----
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self.admission.closed:
+                try:
+                    request = await read_request(reader, self.max_body_bytes)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._dispatch(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # 关闭服务时取消空闲或超时未完成的连接
+            pass
+        finally:
+            if task is not None:
+                self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """处理一个请求，返回连接是否可以继续复用."""
+        keep_alive = request.keep_alive
+        try:
+            parts = [part for part in request.path.split("/") if part]
+            if parts == ["health"] and request.method == "GET":
+                await send_json(writer, 200, self.health(), keep_alive)
+            elif parts == ["metrics"] and request.method == "GET":
+                body = self.metrics.render_prometheus().encode("utf-8")
+                await send_body(writer, 200, body, PROMETHEUS_CONTENT_TYPE, keep_alive)
+            elif parts == ["debug", "metrics"] and request.method == "GET":
+                await send_json(writer, 200, self.metrics.snapshot(), keep_alive)
+            elif parts == ["debug", "profile"] and request.method == "GET":
+                await send_json(writer, 200, self.profiler.status(), keep_alive)
+            elif parts == ["debug", "profile"] and request.method == "POST":
+                await send_json(writer, 200, self._configure_profiler(request.json()), keep_alive)
+            elif parts == ["turns"] and request.method == "POST":
+                return await self._turn(request, writer, str(uuid4()))
+            elif len(parts) == 3 and parts[0] == "threads" and parts[2] == "turns" and request.method == "POST":
+                return await self._turn(request, writer, parts[1])
+            elif len(parts) == 2 and parts[0] == "threads" and request.method == "GET":
+                await send_json(writer, 200, await self._history(parts[1]), keep_alive)
+            elif len(parts) == 2 and parts[0] == "threads" and request.method == "DELETE":
+                await self._delete(parts[1])
+                await send_json(writer, 200, {"thread_id": parts[1], "deleted": True}, keep_alive)
+            else:
+                raise HTTPError(404, f"未知的接口: {request.method} {request.path}")
+        except HTTPError as e:
+            headers = {"Retry-After": f"{e.retry_after:g}"} if e.retry_after else None
+            await send_json(writer, e.status, {"error": e.message}, keep_alive, headers)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            logger.exception(f"处理请求失败: {request.method} {request.path}")
+            await send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+            return False
+        return keep_alive
+
+    # ---- 接口实现 ----
+
+    def health(self) -> dict[str, Any]:
+        return {
+            "status": "closing" if self.admission.closed else "ok",
+            "sessions_active": len(self._active_threads),
+            "connections": len(self._connections),
+            **self.admission.stats(),
+            "tracing": self.tracer.stats(),
+            "log_records_dropped": dropped_records(),
+        }
+
+    def _configure_profiler(self, body: dict[str, Any]) -> dict[str, Any]:
+        try:
+            sample_rate = body.get("sample_rate")
+            return self.profiler.configure(
+                mode=body.get("mode"),
+                sample_rate=float(sample_rate) if sample_rate is not None else None,
+            )
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, str(e)) from e
+
+    @asynccontextmanager
+    async def _thread_turn(self, thread_id: str) -> AsyncIterator[None]:
+        """同一会话同时只允许一轮对话，否则两轮会基于同一份状态并发写入."""
+        if thread_id in self._active_threads:
+            raise HTTPError(409, f"会话 {thread_id} 已有进行中的对话")
+        self._active_threads.add(thread_id)
+        try:
+            yield
+        finally:
+            self._active_threads.discard(thread_id)
+
+    async def _turn(self, request: Request, writer: asyncio.StreamWriter, thread_id: str) -> bool:
+        body = request.json()
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "缺少 message 字段")
+        stream = body.get("stream", "text/event-stream" in request.headers.get("accept", ""))
+        # 可选的 timeout 字段覆盖 AGENT_TURN_TIMEOUT（秒，从获得执行名额时开始计算）
+        timeout = body.get("timeout")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise HTTPError(400, "timeout 必须是正数（秒）")
+
+        async with self._thread_turn(thread_id), self.admission.slot():
+            with (
+                turn_deadline(timeout),
+                log_context(thread_id=thread_id, turn_id=uuid4().hex[:12]),
+                self.metrics.turn_latency.time("http"),
+                self.profiler.profile(f"turn-{thread_id}"),
+                self.tracer.span("user_query_to_response", input={"user_input": message}) as root_span,
+            ):
+                if root_span is not None:
+                    root_span.update_trace(user_id="http_user", session_id=thread_id, input={"user_input": message})
+                if stream:
+                    response = await self._stream_turn(writer, thread_id, message)
+                    keep_alive = False
+                else:
+                    response = await self._json_turn(writer, thread_id, message, request.keep_alive)
+                    keep_alive = request.keep_alive
+                if root_span is not None:
+                    root_span.update(output={"response": response})
+                    root_span.update_trace(output={"response": response})
+        return keep_alive
+
+    async def _stream_turn(self, writer: asyncio.StreamWriter, thread_id: str, message: str) -> str:
+        """以 SSE 输出一轮对话；每个事件写出后等待缓冲区排空，慢客户端会反压 graph 的执行."""
+        writer.write(_head(200, {
+            "Content-Type": "text/event-stream; charset=utf-8",
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+            "X-Thread-Id": thread_id,
+        }))
+        response = ""
+        try:
+            # 客户端断开时 drain 抛出异常，aclosing 会关闭 astream 并取消本轮执行
+            async with aclosing(turn_events(self.app, thread_id, message)) as events:
+                async for event, data in events:
+                    if event == "done":
+                        response = data["response"]
+                    writer.write(_sse(event, data))
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            logger.exception(f"会话 {thread_id} 的对话执行失败")
+            writer.write(_sse("error", {"thread_id": thread_id, "error": str(e)}))
+            await writer.drain()
+        return response
+
+    async def _json_turn(self, writer: asyncio.StreamWriter, thread_id: str, message: str, keep_alive: bool) -> str:
+        """执行一轮对话并一次性返回结果."""
+        tool_results = []
+        response = ""
+        finish_reason = None
+        try:
+            async for event, data in turn_events(self.app, thread_id, message):
+                if event == "tool_result":
+                    tool_results.append(data)
+                elif event == "done":
+                    response, finish_reason = data["response"], data["finish_reason"]
+        except Exception as e:
+            logger.exception(f"会话 {thread_id} 的对话执行失败")
+            raise HTTPError(500, str(e)) from e
+        await send_json(
+            writer,
+            200,
+            {"thread_id": thread_id, "response": response, "finish_reason": finish_reason, "tool_results": tool_results},
+            keep_alive,
+        )
+        return response
+
+    async def _history(self, thread_id: str) -> dict[str, Any]:
+        snapshot = await self.app.aget_state({"configurable": {"thread_id": thread_id}})
+        messages = snapshot.values.get("messages", [])
+        if not messages:
+            raise HTTPError(404, f"会话 {thread_id} 不存在")
+        return {"thread_id": thread_id, "messages": [message_to_dict(message) for message in messages]}
+
+    async def _delete(self, thread_id: str) -> None:
+        if thread_id in self._active_threads:
+            raise HTTPError(409, f"会话 {thread_id} 已有进行中的对话")
+        from agent.checkpoint import adelete_thread
+
+        await adelete_thread(self.app, thread_id)
+
+    # ---- 生命周期 ----
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        """在 Unix domain socket 上监听（作为 agent.supervisor 的 worker 运行时）."""
+        self._server = await asyncio.start_unix_server(self.handle_connection, path)
+        return self._server
+
+    async def shutdown(self, timeout: float) -> None:
+        """优雅关闭：停止接受新连接与新对话，等待进行中的对话结束，超时后取消."""
+        self.admission.close()
+        if self._server is not None:
+            self._server.close()
+        if not await self.admission.wait_idle(timeout):
+            logger.warning(f"{self.admission.in_flight} 轮对话在 {timeout:g} 秒内未结束，将被取消")
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+
+async def serve(host: str, port: int, shutdown_timeout: float, socket_path: Optional[str] = None) -> None:
+    """构建 graph 并运行服务，直到收到 SIGINT/SIGTERM；指定 socket_path 时改为监听 Unix domain socket."""
+    from agent import acreate_agent_graph
+    from agent.checkpoint import aclose_checkpointer, acreate_checkpointer
+    from agent.mcp.pool import close_mcp_pool
+
+    # 服务端按 thread_id 保存会话，未配置 checkpointer 时使用内存 checkpointer
+    checkpointer = await acreate_checkpointer() or await acreate_checkpointer("memory")
+    app = await acreate_agent_graph(checkpointer=checkpointer)
+    server = AgentServer(app)
+    if socket_path:
+        await server.start_unix(socket_path)
+        print(f"Agent 服务已启动: unix:{socket_path}")
+    else:
+        await server.start(host, port)
+        print(f"Agent 服务已启动: http://{host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        print("正在关闭 Agent 服务...")
+        await server.shutdown(shutdown_timeout)
+        await aclose_checkpointer(checkpointer)
+        await asyncio.to_thread(close_mcp_pool)
+        await asyncio.to_thread(server.tracer.shutdown)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="以 HTTP/SSE 方式提供 agent 服务")
+    parser.add_argument("--host", default=get_server_host())
+    parser.add_argument("--port", type=int, default=get_server_port())
+    parser.add_argument("--shutdown-timeout", type=float, default=get_server_shutdown_timeout(),
+                        help="关闭时等待进行中对话的秒数")
+    parser.add_argument("--socket", help="改为监听该 Unix domain socket（由 agent.supervisor 启动 worker 时使用）")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.shutdown_timeout, args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""Multi-process mode: a supervisor that runs N agent.server workers and routes turns by thread_id.
+
+单个进程中的消息序列化、Pydantic 校验与 tracing 都受 GIL 限制。supervisor 启动 N 个 worker 进程
+（``python -m agent.server --socket ...``），每个 worker 拥有独立的 graph、LLM 连接池与 MCP 会话，
+supervisor 本身只负责转发::
+
+    客户端 ──HTTP──> supervisor ──Unix socket──> worker[i]，i 由 thread_id 的一致性哈希决定
+
+- 同一 thread_id 总是路由到同一个 worker，会话状态留在该 worker 的 checkpointer 中
+- 定期检查各 worker 的 /health，进程退出或连续多次检查失败时重启（指数退避）；
+  worker 不可用期间，路由到它的请求返回 503
+- ``GET /metrics`` 汇总各 worker 的指标（带 worker 标签），``GET /health`` 汇总各 worker 的状态
+
+::
+
+    python -m agent.supervisor --workers 4 --port 8000
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+from uuid import uuid4
+
+from agent.config import (
+    get_blob_dir,
+    get_log_file,
+    get_server_host,
+    get_server_max_body_bytes,
+    get_server_port,
+    get_server_shutdown_timeout,
+    get_server_workers,
+    get_worker_health_interval,
+    get_worker_startup_timeout,
+)
+from agent.logs import configure_logging
+from agent.metrics import PROMETHEUS_CONTENT_TYPE, get_metrics, merge_prometheus
+from agent.server import HTTPError, Request, _head, read_request, send_body, send_json
+
+logger = logging.getLogger(__name__)
+
+# 连续多少次健康检查失败后重启 worker
+MAX_HEALTH_FAILURES = 3
+# 转发给 worker 的请求头
+FORWARDED_HEADERS = ("content-type", "accept", "last-event-id")
+
+
+class HashRing:
+    """一致性哈希环：每个节点占若干虚拟节点，增减节点时只有少量 key 改变归属."""
+
+    def __init__(self, nodes: list[int], replicas: int = 64):
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node(self, key: str) -> int:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class WorkerResponse:
+    """worker 返回的响应：状态码、响应头以及尚未读取的响应体."""
+
+    def __init__(self, status: int, headers: dict[str, str], reader: asyncio.StreamReader, writer):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+
+    async def read(self) -> bytes:
+        length = self.headers.get("content-length")
+        return await (self.reader.readexactly(int(length)) if length is not None else self.reader.read())
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class Worker:
+    """一个 agent.server 子进程."""
+
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.healthy = False
+        self.restarts = 0
+        self.last_health: dict[str, Any] = {}
+
+    def _env(self) -> dict[str, str]:
+        env = dict(os.environ)
+        # 多个进程写同一个日志文件时轮转会互相干扰，每个 worker 使用独立的日志文件
+        log_file = get_log_file()
+        if log_file:
+            path = Path(log_file)
+            env["AGENT_LOG_FILE"] = str(path.with_name(f"{path.stem}-worker{self.index}{path.suffix}"))
+        # blob 的引用计数只在进程内有效，每个 worker 使用独立的 blob 目录（同一会话总是路由到同一个 worker）
+        env["AGENT_BLOB_DIR"] = str(Path(get_blob_dir()) / f"worker{self.index}")
+        # 指标由 supervisor 汇总，worker 不单独监听端口
+        env.pop("AGENT_METRICS_PORT", None)
+        return env
+
+    async def start(self) -> asyncio.subprocess.Process:
+        Path(self.socket_path).unlink(missing_ok=True)
+        process = self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "agent.server", "--socket", self.socket_path,
+            env=self._env(),
+            stdout=asyncio.subprocess.DEVNULL,
+        )
+        logger.info(f"worker {self.index} 已启动 (pid {process.pid})")
+        return process
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes = b"",
+        headers: Optional[dict[str, str]] = None,
+    ) -> WorkerResponse:
+        """通过 Unix socket 向 worker 发送一个请求（每个请求一个连接），返回响应头；响应体由调用方读取."""
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            lines = [f"{method} {path} HTTP/1.1", "Host: worker", "Connection: close", f"Content-Length: {len(body)}"]
+            lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError(f"worker {self.index} 关闭了连接")
+            status = int(status_line.split(b" ", 2)[1])
+            response_headers: dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        return WorkerResponse(status, response_headers, reader, writer)
+
+    async def get_json(self, path: str, timeout: float) -> Any:
+        async def fetch() -> Any:
+            response = await self.request("GET", path)
+            try:
+                return json.loads(await response.read())
+            finally:
+                response.close()
+
+        return await asyncio.wait_for(fetch(), timeout)
+
+    async def check_health(self, timeout: float) -> bool:
+        try:
+            self.last_health = await self.get_json("/health", timeout)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return False
+        return self.last_health.get("status") == "ok"
+
+    async def stop(self, timeout: float) -> None:
+        """发送 SIGTERM（worker 会等待进行中的对话结束），超时后强制结束."""
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"worker {self.index} 未在 {timeout:g} 秒内退出，强制结束")
+            process.kill()
+            await process.wait()
+
+
+class Supervisor:
+    """启动并监控 worker 进程，把请求按 thread_id 转发给对应的 worker."""
+
+    def __init__(
+        self,
+        workers: int,
+        socket_dir: Optional[str] = None,
+        health_interval: Optional[float] = None,
+        startup_timeout: Optional[float] = None,
+        shutdown_timeout: Optional[float] = None,
+    ):
+        """初始化 supervisor.
+
+        Args:
+            workers: worker 进程数
+            socket_dir: worker 的 Unix socket 所在目录；默认创建临时目录
+            health_interval: 健康检查间隔（秒）
+            startup_timeout: worker 启动超时（秒）
+            shutdown_timeout: 关闭时等待 worker 结束进行中对话的秒数
+        """
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="agent-workers-")
+        self.workers = [Worker(i, os.path.join(self.socket_dir, f"worker-{i}.sock")) for i in range(max(1, workers))]
+        self.ring = HashRing([worker.index for worker in self.workers])
+        self.health_interval = health_interval if health_interval is not None else get_worker_health_interval()
+        self.startup_timeout = startup_timeout if startup_timeout is not None else get_worker_startup_timeout()
+        self.shutdown_timeout = shutdown_timeout if shutdown_timeout is not None else get_server_shutdown_timeout()
+        self.max_body_bytes = get_server_max_body_bytes()
+        self.metrics = get_metrics()
+        self.closing = False
+        self._monitors: list[asyncio.Task] = []
+        self._connections: set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.metrics.worker_up.register(
+            "supervisor", lambda: {(str(worker.index),): float(worker.healthy) for worker in self.workers}
+        )
+
+    def worker_for(self, thread_id: str) -> Worker:
+        return self.workers[self.ring.node(thread_id)]
+
+    # ---- worker 生命周期 ----
+
+    async def _wait_ready(self, worker: Worker) -> bool:
+        deadline = time.monotonic() + self.startup_timeout
+        while worker.running and time.monotonic() < deadline:
+            if await worker.check_health(timeout=1.0):
+                return True
+            await asyncio.sleep(0.2)
+        return False
+
+    async def _watch(self, worker: Worker, process: asyncio.subprocess.Process) -> None:
+        """直到 worker 进程退出或连续多次健康检查失败（此时结束该进程）才返回."""
+        exited = asyncio.ensure_future(process.wait())
+        failures = 0
+        try:
+            while True:
+                done, _ = await asyncio.wait({exited}, timeout=self.health_interval)
+                if done:
+                    return
+                worker.healthy = await worker.check_health(timeout=min(self.health_interval, 5.0))
+                failures = 0 if worker.healthy else failures + 1
+                if failures >= MAX_HEALTH_FAILURES:
+                    logger.warning(f"worker {worker.index} 连续 {failures} 次健康检查失败，将重启")
+                    process.kill()
+                    await exited
+                    return
+        finally:
+            exited.cancel()
+
+    async def _supervise(self, worker: Worker) -> None:
+        """启动 worker，退出或失去响应后按指数退避重启."""
+        backoff = 1.0
+        while not self.closing:
+            started = time.monotonic()
+            process = await worker.start()
+            if await self._wait_ready(worker):
+                worker.healthy = True
+                await self._watch(worker, process)
+            elif worker.running:
+                logger.warning(f"worker {worker.index} 未在 {self.startup_timeout:g} 秒内就绪，将重启")
+                process.kill()
+                await process.wait()
+            worker.healthy = False
+            if self.closing:
+                return
+            worker.restarts += 1
+            self.metrics.worker_restarts.inc(str(worker.index))
+            logger.warning(f"worker {worker.index} 已退出（返回码 {process.returncode}），{backoff:g} 秒后重启")
+            # 运行了一段时间才退出的 worker 立即按最短间隔重启；反复启动失败时逐步拉长间隔
+            if time.monotonic() - started > 60:
+                backoff = 1.0
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # ---- 请求转发 ----
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self.closing:
+                try:
+                    request = await read_request(reader, self.max_body_bytes)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._dispatch(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            if task is not None:
+                self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        keep_alive = request.keep_alive
+        try:
+            parts = [part for part in request.path.split("/") if part]
+            if self.closing:
+                raise HTTPError(503, "服务正在关闭")
+            if parts == ["health"] and request.method == "GET":
+                await send_json(writer, 200, self.health(), keep_alive)
+            elif parts == ["metrics"] and request.method == "GET":
+                body = (await self.render_metrics()).encode("utf-8")
+                await send_body(writer, 200, body, PROMETHEUS_CONTENT_TYPE, keep_alive)
+            elif parts in (["debug", "metrics"], ["debug", "profile"]):
+                # 转发给每个 worker（POST /debug/profile 会在所有 worker 上切换 profiler）
+                await send_json(writer, 200, await self._broadcast(request), keep_alive)
+            elif parts == ["turns"] and request.method == "POST":
+                # 由 supervisor 生成 thread_id，才能确定路由到哪个 worker
+                thread_id = str(uuid4())
+                return await self._forward(request, writer, thread_id, f"/threads/{thread_id}/turns")
+            elif len(parts) >= 2 and parts[0] == "threads":
+                return await self._forward(request, writer, parts[1], request.path)
+            else:
+                raise HTTPError(404, f"未知的接口: {request.method} {request.path}")
+        except HTTPError as e:
+            headers = {"Retry-After": f"{e.retry_after:g}"} if e.retry_after else None
+            await send_json(writer, e.status, {"error": e.message}, keep_alive, headers)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            logger.exception(f"转发请求失败: {request.method} {request.path}")
+            await send_json(writer, 502, {"error": str(e)}, keep_alive=False)
+            return False
+        return keep_alive
+
+    async def _forward(self, request: Request, writer: asyncio.StreamWriter, thread_id: str, path: str) -> bool:
+        """把请求转发给 thread_id 对应的 worker，并把响应（包括 SSE 流）原样转发给客户端."""
+        worker = self.worker_for(thread_id)
+        if not worker.healthy:
+            raise HTTPError(503, f"会话所在的 worker {worker.index} 暂不可用", retry_after=1)
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        try:
+            response = await worker.request(request.method, path, request.body, headers)
+        except OSError as e:
+            raise HTTPError(503, f"无法连接 worker {worker.index}: {e}", retry_after=1) from e
+        try:
+            # 有 Content-Length 的响应可以保持客户端连接；SSE 流以关闭连接结束
+            length = response.headers.get("content-length")
+            keep_alive = request.keep_alive and length is not None
+            response_headers = {
+                name.title(): value for name, value in response.headers.items() if name != "connection"
+            }
+            response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+            response_headers["X-Worker"] = str(worker.index)
+            writer.write(_head(response.status, response_headers))
+            if length is not None:
+                writer.write(await response.reader.readexactly(int(length)))
+                await writer.drain()
+            else:
+                while chunk := await response.reader.read(65536):
+                    writer.write(chunk)
+                    await writer.drain()
+            return keep_alive
+        finally:
+            response.close()
+
+    async def _broadcast(self, request: Request) -> dict[str, Any]:
+        async def one(worker: Worker) -> Any:
+            try:
+                response = await worker.request(request.method, request.path, request.body)
+                try:
+                    return json.loads(await response.read())
+                finally:
+                    response.close()
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                return {"error": str(e)}
+
+        results = await asyncio.gather(*(one(worker) for worker in self.workers if worker.healthy))
+        healthy = [worker for worker in self.workers if worker.healthy]
+        return {"workers": {str(worker.index): result for worker, result in zip(healthy, results)}}
+
+    async def render_metrics(self) -> str:
+        """supervisor 自身（worker="supervisor"）与各 worker 的指标，每个样本带 worker 标签."""
+
+        async def fetch(worker: Worker) -> Optional[str]:
+            try:
+                response = await worker.request("GET", "/metrics")
+                try:
+                    return (await asyncio.wait_for(response.read(), 5.0)).decode("utf-8")
+                finally:
+                    response.close()
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return None
+
+        healthy = [worker for worker in self.workers if worker.healthy]
+        texts = await asyncio.gather(*(fetch(worker) for worker in healthy))
+        sources = {"supervisor": self.metrics.render_prometheus()}
+        sources.update((str(worker.index), text) for worker, text in zip(healthy, texts) if text is not None)
+        return merge_prometheus(sources, label="worker")
+
+    def health(self) -> dict[str, Any]:
+        workers = {
+            str(worker.index): {
+                "healthy": worker.healthy,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "restarts": worker.restarts,
+                **worker.last_health,
+            }
+            for worker in self.workers
+        }
+        healthy = sum(worker.healthy for worker in self.workers)
+        return {
+            "status": "closing" if self.closing else ("ok" if healthy == len(self.workers) else "degraded"),
+            "workers_healthy": healthy,
+            "workers_total": len(self.workers),
+            "workers": workers,
+        }
+
+    # ---- 生命周期 ----
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self._monitors = [asyncio.create_task(self._supervise(worker)) for worker in self.workers]
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server
+
+    async def shutdown(self) -> None:
+        """停止接受新请求，让 worker 完成进行中的对话后退出."""
+        self.closing = True
+        if self._server is not None:
+            self._server.close()
+        await asyncio.gather(*(worker.stop(self.shutdown_timeout) for worker in self.workers))
+        for task in [*self._monitors, *self._connections]:
+            task.cancel()
+        await asyncio.gather(*self._monitors, *self._connections, return_exceptions=True)
+        for worker in self.workers:
+            Path(worker.socket_path).unlink(missing_ok=True)
+
+
+async def supervise(host: str, port: int, workers: int) -> None:
+    """运行 supervisor，直到收到 SIGINT/SIGTERM."""
+    supervisor = Supervisor(workers)
+    await supervisor.start(host, port)
+    print(f"Agent 服务已启动: http://{host}:{port}（{len(supervisor.workers)} 个 worker）")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        print("正在关闭 Agent 服务...")
+        await supervisor.shutdown()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="以多进程方式提供 agent 服务（按 thread_id 路由到 worker）")
+    parser.add_argument("--host", default=get_server_host())
+    parser.add_argument("--port", type=int, default=get_server_port())
+    parser.add_argument("--workers", type=int, default=get_server_workers(), help="worker 进程数")
+    args = parser.parse_args(argv)
+    configure_logging()
+    asyncio.run(supervise(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""Concurrent dispatch of the tool calls emitted in a single LLM turn.
+
+开启投机执行（AGENT_SPECULATIVE_TOOLS）时，LLM 仍在流式输出时就会启动参数已经完整的工具调用，
+tools 节点直接等待这些调用的结果，工具耗时与生成耗时因此重叠::
+
+    speculation = node.speculate(config)
+    for chunk in llm.stream(messages):
+        speculation.feed(chunk)      # 某个调用的参数成为完整且合法的 JSON 对象时立即启动
+    speculation.finish(response)     # 丢弃最终消息中不存在的调用
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Optional, Union
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, ValidationError
+
+from agent.blobs import release_blobs
+from agent.config import get_tool_call_timeout, get_tool_max_concurrency
+from agent.deadline import expired, remaining
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 限制一轮工具调用并发数的信号量：同步执行用 threading.Semaphore，异步执行用 asyncio.Semaphore
+Limiter = Union[threading.Semaphore, asyncio.Semaphore]
+
+
+class ParallelToolNode:
+    """并发执行同一条 AIMessage 中的全部工具调用.
+
+    - 最多同时执行 ``max_concurrency`` 个调用
+    - 每个调用从开始执行起计时，超过 ``timeout`` 秒即返回超时错误
+    - 设置了本轮截止时间（见 agent.deadline）时，到达截止时间仍未完成的调用同样返回超时错误，
+      截止时间已过时不再启动新的调用
+    - 投机启动的调用与 tools 节点启动的调用共用同一个并发上限
+    - 返回的 ToolMessage 顺序与 ``tool_calls`` 顺序一致
+    """
+
+    def __init__(
+        self,
+        tools: list[BaseTool],
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        """初始化工具调度节点.
+
+        Args:
+            tools: 可调用的工具列表
+            max_concurrency: 单轮内的最大并发数
+            timeout: 单个工具调用的超时时间（秒）
+        """
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.max_concurrency = max(1, max_concurrency if max_concurrency is not None else get_tool_max_concurrency())
+        self.timeout = timeout if timeout is not None else get_tool_call_timeout()
+        # 投机启动的调用：tool_call_id -> (调用, 开始时间, Future 或 asyncio.Task, 限制并发的信号量)
+        self._speculative: dict[str, tuple[ToolCall, float, Union[Future, asyncio.Future], Limiter]] = {}
+        self._speculative_lock = threading.Lock()
+        self._speculative_executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _tool_calls(state: dict[str, Any]) -> list[ToolCall]:
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage):
+            return []
+        return last_message.tool_calls
+
+    def _error_message(self, call: ToolCall, content: str) -> ToolMessage:
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+    def _lookup(self, call: ToolCall) -> BaseTool | ToolMessage:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            available = ", ".join(self.tools_by_name)
+            return self._error_message(
+                call, f"Error: {call['name']} is not a valid tool, try one of [{available}]."
+            )
+        return tool
+
+    def _failure(self, call: ToolCall, error: Exception) -> ToolMessage:
+        logger.warning(f"工具 {call['name']} 调用失败: {error}")
+        return self._error_message(call, f"Error: {error!r}\n Please fix your mistakes.")
+
+    def _timed_out(self, call: ToolCall) -> ToolMessage:
+        if expired():
+            logger.warning(f"工具 {call['name']} 未能在本轮截止时间之前完成")
+            return self._error_message(call, f"Error: tool '{call['name']}' was cancelled at the turn deadline")
+        logger.warning(f"工具 {call['name']} 调用超时（{self.timeout}s）")
+        return self._error_message(call, f"Error: tool '{call['name']}' timed out after {self.timeout}s")
+
+    def _cancel_all(self, calls: list[ToolCall]) -> list[ToolMessage]:
+        # 本轮已超过截止时间：不再启动调用，丢弃已投机启动的调用
+        for call in calls:
+            self._discard_speculative(call["id"])
+        return [self._timed_out(call) for call in calls]
+
+    def _run_one(self, call: ToolCall, config: Optional[RunnableConfig]) -> ToolMessage:
+        tool = self._lookup(call)
+        if isinstance(tool, ToolMessage):
+            return tool
+        try:
+            return tool.invoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            return self._failure(call, e)
+
+    async def _arun_one(self, call: ToolCall, config: Optional[RunnableConfig]) -> ToolMessage:
+        tool = self._lookup(call)
+        if isinstance(tool, ToolMessage):
+            return tool
+        try:
+            return await tool.ainvoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            return self._failure(call, e)
+
+    def _run_limited(
+        self, call: ToolCall, config: Optional[RunnableConfig], limiter: threading.Semaphore
+    ) -> ToolMessage:
+        with limiter:
+            # 等待并发额度期间本轮可能已超过截止时间，此时不再执行
+            if expired():
+                return self._timed_out(call)
+            return self._run_one(call, config)
+
+    async def _arun_limited(
+        self, call: ToolCall, config: Optional[RunnableConfig], limiter: asyncio.Semaphore
+    ) -> ToolMessage:
+        async with limiter:
+            return await self._arun_one(call, config)
+
+    def speculate(self, config: Optional[RunnableConfig] = None, asynchronous: bool = False) -> "ToolSpeculation":
+        """为一次流式 LLM 调用创建投机执行器（asynchronous=True 时在当前事件循环中启动调用）."""
+        return ToolSpeculation(self, config, asynchronous)
+
+    def _start_speculative(self, call: ToolCall, config: Optional[RunnableConfig], limiter: Limiter) -> bool:
+        """提前启动一个参数完整的调用；工具不存在或参数未通过校验时不启动，留给 tools 节点按常规处理.
+
+        limiter 是 asyncio.Semaphore 时在当前事件循环中启动调用，否则在线程池中启动。
+        """
+        tool = self.tools_by_name.get(call["name"])
+        call_id = call["id"]
+        if tool is None or call_id is None or not _valid_arguments(tool, call["args"]):
+            return False
+        with self._speculative_lock:
+            self._expire_speculative()
+            if call_id in self._speculative:
+                return False
+            handle: Union[Future, asyncio.Future]
+            if isinstance(limiter, asyncio.Semaphore):
+                handle = asyncio.ensure_future(self._arun_limited(call, config, limiter))
+            else:
+                if self._speculative_executor is None:
+                    self._speculative_executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix="tool-speculative"
+                    )
+                # 复制当前上下文，工具线程中同样能看到本轮的截止时间
+                handle = self._speculative_executor.submit(
+                    contextvars.copy_context().run, self._run_limited, call, config, limiter
+                )
+            self._speculative[call_id] = (call, time.monotonic(), handle, limiter)
+        get_metrics().tool_speculation.inc("started")
+        logger.debug(f"投机启动工具调用 {call['name']}({call['id']})")
+        return True
+
+    def _expire_speculative(self) -> None:
+        # 没有被 tools 节点取走（例如本轮在 LLM 之后出错）且已超时的调用直接丢弃；调用方持有锁
+        now = time.monotonic()
+        for call_id, (_, started, handle, _) in list(self._speculative.items()):
+            if now - started >= self.timeout:
+                del self._speculative[call_id]
+                _abandon(handle)
+                get_metrics().tool_speculation.inc("discarded")
+
+    def _discard_speculative(self, call_id: Optional[str]) -> None:
+        if call_id is None:
+            return
+        with self._speculative_lock:
+            entry = self._speculative.pop(call_id, None)
+        if entry is not None:
+            _abandon(entry[2])
+            get_metrics().tool_speculation.inc("discarded")
+
+    def _take_speculative(
+        self, call: ToolCall, asynchronous: bool
+    ) -> Optional[tuple[float, Union[Future, asyncio.Future], Limiter]]:
+        """取走与 call 完全一致（id、名称与参数相同）的投机调用，返回 (开始时间, future, 信号量)."""
+        call_id = call["id"]
+        if call_id is None:
+            return None
+        with self._speculative_lock:
+            entry = self._speculative.pop(call_id, None)
+        if entry is None:
+            return None
+        speculative_call, started, handle, limiter = entry
+        if not _same_call(speculative_call, call) or isinstance(handle, asyncio.Future) != asynchronous:
+            _abandon(handle)
+            get_metrics().tool_speculation.inc("discarded")
+            return None
+        get_metrics().tool_speculation.inc("used")
+        return started, handle, limiter
+
+    def invoke(self, state: dict[str, Any], config: Optional[RunnableConfig] = None) -> dict[str, Any]:
+        """同步执行：在线程池中并发调用工具（已投机启动的调用直接等待其结果）."""
+        calls = self._tool_calls(state)
+        if not calls:
+            return {"messages": []}
+        if expired():
+            return {"messages": self._cancel_all(calls)}
+
+        started: dict[int, float] = {}
+        futures: dict[int, Future] = {}
+        limiter: Optional[threading.Semaphore] = None
+        for i, call in enumerate(calls):
+            speculative = self._take_speculative(call, asynchronous=False)
+            if speculative is not None and isinstance(speculative[1], Future):
+                started[i], futures[i] = speculative[0], speculative[1]
+                if isinstance(speculative[2], threading.Semaphore):
+                    limiter = speculative[2]
+        # 与仍在执行的投机调用共用同一个信号量，本轮同时执行的调用不超过 max_concurrency
+        turn_limiter = limiter if limiter is not None else threading.Semaphore(self.max_concurrency)
+
+        def run(index: int, call: ToolCall) -> ToolMessage:
+            with turn_limiter:
+                started[index] = time.monotonic()
+                if expired():
+                    return self._timed_out(call)
+                return self._run_one(call, config)
+
+        not_started = [i for i in range(len(calls)) if i not in futures]
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_concurrency, len(not_started))),
+            thread_name_prefix="tool-call",
+        )
+        try:
+            for i in not_started:
+                futures[i] = executor.submit(contextvars.copy_context().run, run, i, calls[i])
+            results: list[Optional[ToolMessage]] = [None] * len(calls)
+            pending = set(range(len(calls)))
+            while pending:
+                now = time.monotonic()
+                out_of_time = expired()
+                for i in list(pending):
+                    if futures[i].done():
+                        results[i] = futures[i].result()
+                        pending.discard(i)
+                    elif out_of_time or (i in started and now - started[i] >= self.timeout):
+                        # 线程无法被强制终止，超时的调用在后台自行结束
+                        _abandon(futures[i])
+                        results[i] = self._timed_out(calls[i])
+                        pending.discard(i)
+                if not pending:
+                    break
+                # 尚未开始执行的调用最早也要在 now + timeout 才会超时
+                next_deadline = min(started.get(i, now) + self.timeout for i in pending)
+                left = remaining()
+                if left is not None:
+                    next_deadline = min(next_deadline, now + left)
+                wait(
+                    [futures[i] for i in pending],
+                    timeout=max(0.0, next_deadline - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return {"messages": results}
+
+    async def ainvoke(self, state: dict[str, Any], config: Optional[RunnableConfig] = None) -> dict[str, Any]:
+        """异步执行：用信号量限制并发，asyncio.gather 保证结果顺序."""
+        calls = self._tool_calls(state)
+        if expired():
+            return {"messages": self._cancel_all(calls)}
+        speculative_tasks: dict[int, tuple[float, asyncio.Future]] = {}
+        semaphore: Optional[asyncio.Semaphore] = None
+        for i, call in enumerate(calls):
+            speculative = self._take_speculative(call, asynchronous=True)
+            if speculative is not None and isinstance(speculative[1], asyncio.Future):
+                speculative_tasks[i] = (speculative[0], speculative[1])
+                if isinstance(speculative[2], asyncio.Semaphore):
+                    semaphore = speculative[2]
+        # 与仍在执行的投机调用共用同一个信号量，本轮同时执行的调用不超过 max_concurrency
+        turn_semaphore = semaphore if semaphore is not None else asyncio.Semaphore(self.max_concurrency)
+
+        async def run(index: int, call: ToolCall) -> ToolMessage:
+            if index in speculative_tasks:
+                # 超时从投机启动时开始计算
+                started, task = speculative_tasks[index]
+                try:
+                    return await asyncio.wait_for(task, timeout=_budget(self.timeout - (time.monotonic() - started)))
+                except asyncio.TimeoutError:
+                    return self._timed_out(call)
+            async with turn_semaphore:
+                try:
+                    return await asyncio.wait_for(self._arun_one(call, config), timeout=_budget(self.timeout))
+                except asyncio.TimeoutError:
+                    return self._timed_out(call)
+
+        results = await asyncio.gather(*(run(i, call) for i, call in enumerate(calls)))
+        return {"messages": list(results)}
+
+
+def _budget(timeout: float) -> float:
+    """单个调用可以等待的秒数：不超过本轮剩余的时间."""
+    left = remaining()
+    return max(0.0, timeout if left is None else min(timeout, left))
+
+
+def _abandon(handle: Union[Future, asyncio.Future]) -> None:
+    """取消不再需要的调用；已在执行、无法取消的调用结束后释放其结果引用的 blob（结果不会写入会话状态）."""
+    handle.cancel()
+
+    def release(future: Union[Future, asyncio.Future]) -> None:
+        if not future.cancelled() and future.exception() is None:
+            release_blobs([future.result()])
+
+    handle.add_done_callback(release)
+
+
+def _valid_arguments(tool: BaseTool, arguments: dict[str, Any]) -> bool:
+    schema = tool.args_schema
+    if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+        return True
+    try:
+        schema.model_validate(arguments)
+    except ValidationError:
+        return False
+    return True
+
+
+def _same_call(speculative: ToolCall, call: ToolCall) -> bool:
+    return speculative["name"] == call["name"] and speculative["args"] == call["args"]
+
+
+class ToolSpeculation:
+    """一次流式 LLM 调用中的投机工具执行.
+
+    按 index 增量拼接 ``tool_call_chunks``，某个调用的 id、名称齐全且参数已是完整的 JSON 对象
+    （并通过工具参数模型校验）时立即交给 ``ParallelToolNode`` 执行；每条消息最多提前启动
+    ``max_concurrency`` 个调用。提前启动的调用持有 ``limiter`` 的额度，tools 节点执行同一条消息中的
+    其余调用时使用同一个信号量。
+    """
+
+    def __init__(self, node: ParallelToolNode, config: Optional[RunnableConfig], asynchronous: bool):
+        self.node = node
+        self.config = config
+        self.asynchronous = asynchronous
+        self.limiter: Limiter = (
+            asyncio.Semaphore(node.max_concurrency) if asynchronous else threading.Semaphore(node.max_concurrency)
+        )
+        self._parts: dict[Any, dict[str, str]] = {}
+        self._seen: set[Any] = set()
+        self.started: list[ToolCall] = []
+
+    def feed(self, chunk: AIMessageChunk) -> None:
+        """处理一个流式 chunk，启动其中参数已经完整的调用."""
+        for part in chunk.tool_call_chunks:
+            key = part.get("index") if part.get("index") is not None else part.get("id")
+            if key is None or key in self._seen:
+                continue
+            # 与 AIMessageChunk 的合并规则一致：同一 index 的字符串字段依次拼接
+            entry = self._parts.setdefault(key, {"id": "", "name": "", "args": ""})
+            for field, value in (("id", part["id"]), ("name", part["name"]), ("args", part["args"])):
+                entry[field] += value or ""
+            if not (entry["id"] and entry["name"] and entry["args"]):
+                continue
+            try:
+                arguments = json.loads(entry["args"])
+            except ValueError:
+                continue
+            # JSON 对象一旦闭合就不会再有后续参数
+            self._seen.add(key)
+            if not isinstance(arguments, dict) or len(self.started) >= self.node.max_concurrency:
+                continue
+            call = ToolCall(name=entry["name"], args=arguments, id=entry["id"])
+            if self.node._start_speculative(call, self.config, self.limiter):
+                self.started.append(call)
+
+    def finish(self, response: Optional[BaseMessage]) -> None:
+        """LLM 输出结束：丢弃最终消息中不存在或参数不同的调用（response 为 None 表示调用失败）."""
+        final = {call["id"]: call for call in getattr(response, "tool_calls", None) or []}
+        for call in self.started:
+            final_call = final.get(call["id"])
+            if final_call is None or not _same_call(call, final_call):
+                self.node._discard_speculative(call["id"])
@@ -0,0 +1,459 @@
+"""Non-blocking tracing: spans are captured cheaply and exported in batches off the request path.
+
+调用方只在 span 对象上记录引用和少量字段；截断预览、摘要与序列化都在后台导出线程中完成。
+span 结束时以 ``put_nowait`` 放入有界队列，队列满时直接丢弃并计数，
+因此后端变慢或不可用时不会给请求增加延迟。
+"""
+
+import atexit
+import base64
+import contextvars
+import hashlib
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, Optional, Protocol
+from uuid import uuid4
+
+from agent.config import (
+    get_langfuse_host,
+    get_langfuse_public_key,
+    get_langfuse_secret_key,
+    get_trace_batch_size,
+    get_trace_exporter_kind,
+    get_trace_file_path,
+    get_trace_flush_interval,
+    get_trace_preview_chars,
+    get_trace_queue_size,
+    get_trace_sample_rate,
+)
+from agent.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 序列化时列表/字典最多保留的元素数
+MAX_ITEMS = 20
+# 消息列表摘要中保留预览的末尾消息数
+TAIL_MESSAGES = 2
+
+
+class MessagesRef:
+    """对消息列表的引用：请求路径上不复制消息，摘要在导出线程中生成.
+
+    graph 的 messages 通道每次更新都会生成新列表，因此直接持有引用是安全的。
+    """
+
+    __slots__ = ("messages",)
+
+    def __init__(self, messages):
+        self.messages = messages
+
+
+@dataclass
+class SpanRecord:
+    """一个已结束（或进行中）的 span 的原始数据."""
+
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    kind: str
+    name: str
+    start_time: float
+    end_time: Optional[float] = None
+    input: Any = None
+    output: Any = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    level: Optional[str] = None
+    status_message: Optional[str] = None
+    model: Optional[str] = None
+    usage_details: Optional[dict[str, int]] = None
+    completion_start_time: Optional[float] = None
+    # 根 span 上记录的 trace 级字段（user_id、session_id、input、output）
+    trace: Optional[dict[str, Any]] = None
+
+
+class Span:
+    """请求路径上使用的 span 句柄，update 只修改内存中的记录."""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: SpanRecord):
+        self.record = record
+
+    def update(self, **fields: Any) -> None:
+        for key, value in fields.items():
+            if key == "metadata":
+                self.record.metadata.update(value)
+            elif isinstance(value, datetime):
+                setattr(self.record, key, value.timestamp())
+            else:
+                setattr(self.record, key, value)
+
+    def update_trace(self, **fields: Any) -> None:
+        if self.record.trace is None:
+            self.record.trace = {}
+        self.record.trace.update(fields)
+
+
+class TraceExporter(Protocol):
+    """把一批序列化后的 span 发送到后端；在导出线程中调用."""
+
+    def export(self, batch: list[dict[str, Any]]) -> None: ...
+
+    def shutdown(self) -> None: ...
+
+
+class NoopExporter:
+    """丢弃所有 span，用于测量 tracing 本身的开销."""
+
+    def export(self, batch: list[dict[str, Any]]) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileExporter:
+    """把 span 以 JSON Lines 追加写入本地文件，无需网络即可检查 trace."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def export(self, batch: list[dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class LangfuseExporter:
+    """通过 Langfuse 的批量 ingestion 接口上报 span（不需要导入 langfuse SDK）."""
+
+    def __init__(self, public_key: str, secret_key: str, host: str, timeout: float = 10.0):
+        self.url = f"{host.rstrip('/')}/api/public/ingestion"
+        credentials = base64.b64encode(f"{public_key}:{secret_key}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {credentials}", "Content-Type": "application/json"}
+        self.timeout = timeout
+
+    @staticmethod
+    def _events(item: dict[str, Any]) -> list[dict[str, Any]]:
+        now = _iso(time.time())
+        events = []
+        trace = item.get("trace")
+        if trace is not None:
+            events.append({
+                "id": str(uuid4()),
+                "timestamp": now,
+                "type": "trace-create",
+                "body": {
+                    "id": item["trace_id"],
+                    "timestamp": _iso(item["start_time"]),
+                    "name": item["name"],
+                    "userId": trace.get("user_id"),
+                    "sessionId": trace.get("session_id"),
+                    "input": trace.get("input"),
+                    "output": trace.get("output"),
+                },
+            })
+        body = {
+            "id": item["span_id"],
+            "traceId": item["trace_id"],
+            "parentObservationId": item["parent_id"],
+            "name": item["name"],
+            "startTime": _iso(item["start_time"]),
+            "endTime": _iso(item["end_time"]),
+            "input": item["input"],
+            "output": item["output"],
+            "metadata": item["metadata"] or None,
+            "level": item["level"],
+            "statusMessage": item["status_message"],
+        }
+        if item["kind"] == "generation":
+            body.update({
+                "model": item["model"],
+                "completionStartTime": _iso(item["completion_start_time"]),
+                "usageDetails": item["usage_details"],
+            })
+        events.append({"id": str(uuid4()), "timestamp": now, "type": f"{item['kind']}-create", "body": body})
+        return events
+
+    def export(self, batch: list[dict[str, Any]]) -> None:
+        events = [event for item in batch for event in self._events(item)]
+        payload = json.dumps({"batch": events}, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=payload, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+def _summarize_messages(messages: list, limit: int) -> dict[str, Any]:
+    """消息列表的摘要：条数、基于 id 的指纹与末尾几条消息的预览."""
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(str(getattr(message, "id", None) or id(message)).encode())
+    return {
+        "message_count": len(messages),
+        "digest": digest.hexdigest()[:16],
+        "tail": [_preview(message, limit) for message in messages[-TAIL_MESSAGES:]],
+    }
+
+
+def _preview(value: Any, limit: int) -> Any:
+    """把任意值转换为大小受限、可 JSON 序列化的预览."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return _truncate(value, limit)
+    if isinstance(value, MessagesRef):
+        return _summarize_messages(value.messages, limit)
+    if isinstance(value, dict):
+        items = list(value.items())[:MAX_ITEMS]
+        return {str(key): _preview(item, limit) for key, item in items}
+    if isinstance(value, (list, tuple)):
+        return [_preview(item, limit) for item in value[:MAX_ITEMS]]
+    content = getattr(value, "content", None)
+    if content is not None:
+        return {"type": getattr(value, "type", type(value).__name__), "content": _preview(content, limit)}
+    return _truncate(str(value), limit)
+
+
+# 当前上下文中的 span；_NOT_SAMPLED 表示所在 trace 未被采样，子 span 也不记录
+_NOT_SAMPLED = object()
+_current_span: contextvars.ContextVar[Any] = contextvars.ContextVar("agent_current_span", default=None)
+
+
+class Tracer:
+    """采样、捕获 span，并由后台线程批量导出."""
+
+    def __init__(
+        self,
+        exporter: Optional[TraceExporter],
+        sample_rate: float = 1.0,
+        queue_size: int = 2048,
+        batch_size: int = 64,
+        flush_interval: float = 2.0,
+        preview_chars: int = 500,
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.preview_chars = preview_chars
+        self._queue: queue.Queue[SpanRecord] = queue.Queue(maxsize=max(1, queue_size))
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, kind: str = "span", **fields: Any) -> Iterator[Optional[Span]]:
+        """创建 span 并设为当前 span；未启用或未被采样时返回 None.
+
+        没有父 span 时新建 trace 并按 sample_rate 采样，子 span 跟随父 span 的采样结果。
+        fields 会原样保存（例如 input=MessagesRef(messages)），在导出线程中才截断与序列化。
+        """
+        parent = _current_span.get()
+        if not self.enabled or parent is _NOT_SAMPLED:
+            yield None
+            return
+        if parent is None and random.random() >= self.sample_rate:
+            token = _current_span.set(_NOT_SAMPLED)
+            try:
+                yield None
+            finally:
+                _current_span.reset(token)
+            return
+
+        record = SpanRecord(
+            trace_id=parent.record.trace_id if parent else str(uuid4()),
+            span_id=str(uuid4()),
+            parent_id=parent.record.span_id if parent else None,
+            kind=kind,
+            name=name,
+            start_time=time.time(),
+        )
+        span = Span(record)
+        span.update(**fields)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            record.level = "ERROR"
+            record.status_message = str(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            record.end_time = time.time()
+            self._enqueue(record)
+
+    def _enqueue(self, record: SpanRecord) -> None:
+        if self._worker is None:
+            self._start_worker()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._worker.start()
+            atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+
+    def _drain(self) -> None:
+        exporter = self.exporter
+        if exporter is None:
+            return
+        while True:
+            batch: list[SpanRecord] = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                exporter.export([self.serialize(record) for record in batch])
+                with self._lock:
+                    self.exported += len(batch)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                logger.warning(f"导出 {len(batch)} 个 span 失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def serialize(self, record: SpanRecord) -> dict[str, Any]:
+        """生成大小受限、可 JSON 序列化的 span 数据."""
+        limit = self.preview_chars
+        return {
+            "trace_id": record.trace_id,
+            "span_id": record.span_id,
+            "parent_id": record.parent_id,
+            "kind": record.kind,
+            "name": record.name,
+            "start_time": record.start_time,
+            "end_time": record.end_time,
+            "input": _preview(record.input, limit),
+            "output": _preview(record.output, limit),
+            "metadata": _preview(record.metadata, limit),
+            "level": record.level,
+            "status_message": _preview(record.status_message, limit),
+            "model": record.model,
+            "usage_details": record.usage_details,
+            "completion_start_time": record.completion_start_time,
+            "trace": _preview(record.trace, limit),
+        }
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的 span 导出完毕；超时返回 False."""
+        if self._worker is None:
+            return True
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """退出前尽量导出剩余的 span."""
+        self.flush(timeout)
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+def create_trace_exporter() -> Optional[TraceExporter]:
+    """按 AGENT_TRACE_EXPORTER 创建导出器；none 时返回 None（完全关闭 tracing）."""
+    kind = get_trace_exporter_kind()
+    if kind == "none":
+        return None
+    if kind == "noop":
+        return NoopExporter()
+    if kind == "file":
+        return FileExporter(get_trace_file_path())
+    if kind == "langfuse":
+        public_key, secret_key = get_langfuse_public_key(), get_langfuse_secret_key()
+        if not (public_key and secret_key):
+            logger.warning("Langfuse 配置未设置，将不使用 tracing 功能")
+            return None
+        return LangfuseExporter(public_key, secret_key, get_langfuse_host())
+    raise ValueError(f"未知的 AGENT_TRACE_EXPORTER: {kind}（可选 langfuse、file、noop、none）")
+
+
+def create_tracer() -> Tracer:
+    """按环境变量创建 tracer."""
+    return Tracer(
+        create_trace_exporter(),
+        sample_rate=get_trace_sample_rate(),
+        queue_size=get_trace_queue_size(),
+        batch_size=get_trace_batch_size(),
+        flush_interval=get_trace_flush_interval(),
+        preview_chars=get_trace_preview_chars(),
+    )
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的 tracer."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = tracer = create_tracer()
+                get_metrics().register_queue("tracing", lambda: {"trace_export": tracer.stats()["queued"]})
+    return _tracer
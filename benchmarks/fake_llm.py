@@ -0,0 +1,291 @@
+"""本地的 OpenAI 兼容 LLM 服务，代替 DeepSeek 接口用于离线基准测试.
+
+只实现 ``POST /v1/chat/completions``（流式与非流式），行为由 FakeLLMConfig 脚本化：
+
+- 最后一条消息来自用户且请求携带了工具时，返回 ``tool_calls_per_turn`` 个工具调用
+  （优先调用 add，参数取自用户消息中的数字）
+- 其余情况返回 ``response_tokens`` 个 token 的文本回答
+- usage 中按 DeepSeek 的格式报告上下文缓存命中（与此前请求相同的最长消息前缀）
+- 首 token 前等待 ``latency`` 秒，之后按 ``tokens_per_second`` 的速率输出（流式工具调用的参数同样分段输出）
+- ``failures`` 中的模型在输出给定数量的 chunk 后断开连接（0 表示直接返回 400），用于模拟调用失败
+
+::
+
+    python -m benchmarks.fake_llm --port 8765 --latency 0.2
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+
+
+@dataclass
+class FakeLLMConfig:
+    """假 LLM 的行为配置."""
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    response_tokens: int = 20
+    tool_calls_per_turn: int = 1
+    # 模型名 -> 断开连接前输出的流式 chunk 数
+    failures: dict[str, int] = field(default_factory=dict)
+
+
+def _numbers(text: str) -> list[float]:
+    return [float(n) for n in re.findall(r"-?\d+(?:\.\d+)?", text)]
+
+
+def _text_content(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+
+class ScriptedResponder:
+    """根据请求内容生成确定性的回复."""
+
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self._prefixes: set[str] = set()
+        self._lock = threading.Lock()
+
+    def tool_calls(self, request: dict[str, Any]) -> list[dict[str, Any]]:
+        """返回本次应发出的工具调用；为空表示直接回答."""
+        messages = request.get("messages", [])
+        tools = [tool["function"]["name"] for tool in request.get("tools", [])]
+        if not tools or not messages or messages[-1].get("role") != "user":
+            return []
+        name = "add" if "add" in tools else tools[0]
+        numbers = _numbers(_text_content(messages[-1].get("content"))) or [1.0, 2.0]
+        calls = []
+        for i in range(self.config.tool_calls_per_turn):
+            # 每个调用使用不同的参数，避免命中工具结果缓存
+            a = numbers[0] + i
+            b = numbers[1] if len(numbers) > 1 else 1.0
+            calls.append({
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps({"a": a, "b": b})},
+            })
+        return calls
+
+    def tokens(self, request: dict[str, Any]) -> list[str]:
+        """返回文本回答的 token 序列."""
+        last = _text_content(request.get("messages", [{}])[-1].get("content"))
+        head = [f"回答：{last[:40]}"] if last else []
+        return head + [f" token{i}" for i in range(max(0, self.config.response_tokens - len(head)))]
+
+    def _cached_prefix_chars(self, request: dict[str, Any]) -> int:
+        """模拟 DeepSeek 的上下文缓存：返回与此前请求相同的最长消息前缀（工具 schema 也须相同）的字符数."""
+        digest = hashlib.sha256(json.dumps(request.get("tools", []), ensure_ascii=False).encode("utf-8"))
+        prefixes, length = [], 0
+        for message in request.get("messages", []):
+            serialized = json.dumps(message, ensure_ascii=False)
+            digest.update(serialized.encode("utf-8"))
+            length += len(serialized)
+            prefixes.append((digest.hexdigest(), length))
+        cached = 0
+        with self._lock:
+            for key, prefix_length in prefixes:
+                if key in self._prefixes:
+                    cached = prefix_length
+            self._prefixes.update(key for key, _ in prefixes)
+        return cached
+
+    def usage(self, request: dict[str, Any], completion_tokens: int) -> dict[str, int]:
+        # 粗略估算：约 4 个字符一个 token；缓存按 64 token 的块命中
+        prompt_tokens = len(json.dumps(request.get("messages", []), ensure_ascii=False)) // 4
+        hit_tokens = min(prompt_tokens, self._cached_prefix_chars(request) // 4 // 64 * 64)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - hit_tokens,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeLLMServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def do_POST(self) -> None:  # noqa: N802
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+        if self.server.config.failures.get(request.get("model"), 1) == 0:
+            self.send_error(400, "model failure")
+            return
+        if request.get("stream"):
+            self._stream(request)
+        else:
+            self._complete(request)
+
+    def _sleep_until_first_token(self) -> None:
+        if self.server.config.latency > 0:
+            time.sleep(self.server.config.latency)
+
+    def _token_interval(self) -> float:
+        rate = self.server.config.tokens_per_second
+        return 1.0 / rate if rate > 0 else 0.0
+
+    def _complete(self, request: dict[str, Any]) -> None:
+        responder = self.server.responder
+        self._sleep_until_first_token()
+        tool_calls = responder.tool_calls(request)
+        tokens = [] if tool_calls else responder.tokens(request)
+        if len(tokens) > 1:
+            time.sleep(self._token_interval() * (len(tokens) - 1))
+        message: dict[str, Any] = {"role": "assistant", "content": "".join(tokens)}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        body = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": responder.usage(request, max(len(tokens), len(tool_calls) * 10)),
+        }
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, request: dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        fail_after = self.server.config.failures.get(request.get("model"))
+        for count, chunk in enumerate(self._chunks(request)):
+            if count == fail_after:
+                # 不发送结束块直接断开：客户端读取响应时出错
+                self.close_connection = True
+                return
+            data = f"data: {chunk}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunks(self, request: dict[str, Any]) -> Iterator[str]:
+        responder = self.server.responder
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta: dict[str, Any], finish_reason: Optional[str] = None, usage: Any = None) -> str:
+            body: dict[str, Any] = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if usage is not None:
+                body["usage"] = usage
+            return json.dumps(body, ensure_ascii=False)
+
+        self._sleep_until_first_token()
+        tool_calls = responder.tool_calls(request)
+        interval = self._token_interval()
+        if tool_calls:
+            # 与真实接口一致：先发送 id 与名称，参数按 token 速率分段输出
+            yield chunk({"role": "assistant", "content": None})
+            for i, call in enumerate(tool_calls):
+                arguments = call["function"]["arguments"]
+                header = {**call, "function": {"name": call["function"]["name"], "arguments": ""}}
+                yield chunk({"tool_calls": [{"index": i, **header}]})
+                for start in range(0, len(arguments), 8):
+                    if interval:
+                        time.sleep(interval)
+                    piece = arguments[start:start + 8]
+                    yield chunk({"tool_calls": [{"index": i, "function": {"arguments": piece}}]})
+            completion_tokens = len(tool_calls) * 10
+        else:
+            tokens = responder.tokens(request)
+            for i, token in enumerate(tokens):
+                if i and interval:
+                    time.sleep(interval)
+                yield chunk({"role": "assistant", "content": token} if i == 0 else {"content": token})
+            completion_tokens = len(tokens)
+        yield chunk({}, finish_reason="tool_calls" if tool_calls else "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            yield chunk(None, usage=responder.usage(request, completion_tokens))
+        yield "[DONE]"
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """在后台线程中运行的假 LLM 服务."""
+
+    daemon_threads = True
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeLLMConfig()
+        self.responder = ScriptedResponder(self.config)
+        self.request_count = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="启动本地的假 OpenAI 兼容 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="输出速率，0 表示不限速")
+    parser.add_argument("--response-tokens", type=int, default=20, help="文本回答的 token 数")
+    parser.add_argument("--tool-calls", type=int, default=1, help="每轮发出的工具调用数")
+    args = parser.parse_args(argv)
+
+    config = FakeLLMConfig(args.latency, args.tokens_per_second, args.response_tokens, args.tool_calls)
+    server = FakeLLMServer(config, args.host, args.port)
+    print(f"Fake LLM 服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
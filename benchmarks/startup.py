@@ -0,0 +1,132 @@
+"""启动耗时基准：模块导入时间与冷启动构建 graph 的耗时.
+
+每次测量都在新的子进程中进行，以排除模块缓存的影响::
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+# 构建 graph 的子进程脚本；不会真正请求 LLM，API key 只需非空
+BUILD_SCRIPT = """
+import time
+start = time.perf_counter()
+from agent import create_agent_graph
+imported = time.perf_counter()
+create_agent_graph()
+built = time.perf_counter()
+print(f"{imported - start} {built - start}")
+"""
+
+TRACKED_MODULES = (
+    "agent.graph",
+    "agent.console",
+    "agent.mcp.tools",
+    "langchain_openai",
+    "langgraph.graph",
+    "langfuse",
+    "mcp",
+)
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _run(args: list[str], env: dict[str, str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def measure_imports(env: dict[str, str]) -> dict[str, float]:
+    """用 ``-X importtime`` 统计关键模块的累计导入时间（秒）."""
+    result = _run(["-X", "importtime", "-c", "import agent.graph, agent.console"], env)
+    cumulative: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match and match.group(4) in TRACKED_MODULES:
+            cumulative[match.group(4)] = int(match.group(2)) / 1e6
+    return cumulative
+
+
+def measure_build(env: dict[str, str]) -> tuple[float, float]:
+    """在子进程中导入并构建 graph，返回 (导入耗时, 构建完成总耗时)."""
+    result = _run(["-c", BUILD_SCRIPT], env)
+    imported, built = result.stdout.split()[-2:]
+    return float(imported), float(built)
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def run(runs: int) -> dict[str, Any]:
+    """执行全部启动基准，返回可序列化为 JSON 的结果."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = str(Path(tmp) / "mcp_tools_cache.json")
+        env = {
+            **os.environ,
+            "DEEPSEEK_API_KEY": os.environ.get("DEEPSEEK_API_KEY") or "benchmark",
+            "AGENT_TOOL_SCHEMA_CACHE": cache_path,
+        }
+
+        imports = [measure_imports(env) for _ in range(runs)]
+        import_times = {
+            module: _summary([sample[module] for sample in imports if module in sample])
+            for module in TRACKED_MODULES
+            if any(module in sample for sample in imports)
+        }
+
+        no_cache_env = {**env, "AGENT_TOOL_SCHEMA_CACHE": ""}
+        cold = [measure_build(no_cache_env) for _ in range(runs)]
+        # 先构建一次写入工具 schema 缓存，之后的构建都命中缓存
+        measure_build(env)
+        warm = [measure_build(env) for _ in range(runs)]
+
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "import_seconds": import_times,
+        "build_seconds": {
+            "no_tool_cache": _summary([built for _, built in cold]),
+            "tool_cache": _summary([built for _, built in warm]),
+        },
+    }
+
+
+def _print_report(results: dict[str, Any]) -> None:
+    print(f"启动基准（{results['runs']} 次，取中位数）")
+    print("模块导入（累计）:")
+    for module, stats in results["import_seconds"].items():
+        print(f"  {module:<20} {stats['median'] * 1000:8.1f} ms")
+    print("构建 graph（进程启动到 create_agent_graph 返回）:")
+    for name, stats in results["build_seconds"].items():
+        print(f"  {name:<20} {stats['median'] * 1000:8.1f} ms")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="测量 agent 的导入与冷启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的重复次数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = run(args.runs)
+    _print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
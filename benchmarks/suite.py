@@ -0,0 +1,313 @@
+"""离线基准套件：用本地假 LLM 服务和真实的 agent.mcp.server 测量 agent 性能.
+
+测量项：
+- startup：导入与冷启动构建 graph 的耗时（见 benchmarks.startup）
+- turns：不同历史长度下单轮对话的延迟分位数，以及 tools 节点与单次 MCP 调用的耗时
+- memory：每轮对话的 Python 内存分配峰值（tracemalloc）与进程峰值 RSS
+- concurrency：不同并发度下 ainvoke 的吞吐与延迟分位数
+
+结果以 JSON 保存，可与之前的结果比较以发现性能回退::
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --compare bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from benchmarks import startup
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+
+DEFAULT_HISTORY_SIZES = (0, 20, 100)
+DEFAULT_CONCURRENCY = (1, 4, 16)
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """返回毫秒单位的延迟统计."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))] * 1000
+
+    return {
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def make_history(size: int) -> list[BaseMessage]:
+    """构造 size 条消息的纯文本历史（用户与助手交替）."""
+    history: list[BaseMessage] = []
+    for i in range(size):
+        if i % 2 == 0:
+            history.append(HumanMessage(content=f"第 {i // 2} 个问题：请解释一下这个数字 {i}。"))
+        else:
+            history.append(AIMessage(content=f"这是关于数字 {i} 的一段说明。" * 4))
+    return history
+
+
+def _prompt(turn: int) -> HumanMessage:
+    # 每轮使用不同的数字，避免命中工具结果缓存
+    return HumanMessage(content=f"{turn * 7 + 1} 加 {turn + 3} 等于多少？")
+
+
+def _peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def bench_turns(app, history_sizes: tuple[int, ...], turns: int) -> dict[str, Any]:
+    """在不同历史长度下测量单轮延迟与工具开销."""
+    results = {}
+    turn = 0
+    for size in history_sizes:
+        history = make_history(size)
+        latencies, tool_node = [], []
+        for _ in range(turns):
+            turn += 1
+            start = time.perf_counter()
+            agent_done: Optional[float] = None
+            for update in app.stream({"messages": [*history, _prompt(turn)]}, stream_mode="updates"):
+                now = time.perf_counter()
+                # 第一次 agent 更新结束到 tools 更新结束之间即 tools 节点的耗时
+                if "agent" in update and agent_done is None:
+                    agent_done = now
+                elif "tools" in update and agent_done is not None:
+                    tool_node.append(now - agent_done)
+            latencies.append(time.perf_counter() - start)
+        results[f"history_{size}"] = {
+            "turn": percentiles(latencies),
+            "tools_node": percentiles(tool_node),
+        }
+    return results
+
+
+def bench_mcp_call(calls: int) -> dict[str, float]:
+    """测量经过会话池的单次 MCP 工具调用耗时（不经过结果缓存）."""
+    from agent.mcp.client import call_mcp_tool_sync
+
+    call_mcp_tool_sync("add", {"a": 0, "b": 0})
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        call_mcp_tool_sync("add", {"a": i, "b": 0.5})
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def bench_memory(app, history_sizes: tuple[int, ...]) -> dict[str, Any]:
+    """测量每轮对话的 Python 内存分配峰值."""
+    per_turn = {}
+    for size in history_sizes:
+        history = make_history(size)
+        tracemalloc.start()
+        try:
+            app.invoke({"messages": [*history, _prompt(size)]})
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        per_turn[f"history_{size}"] = {"peak_alloc_mb": peak / (1024 * 1024)}
+    return {"per_turn": per_turn, "peak_rss_mb": _peak_rss_mb()}
+
+
+async def bench_concurrency(levels: tuple[int, ...], turns: int) -> dict[str, Any]:
+    """测量不同并发度下 ainvoke 的吞吐与延迟."""
+    from agent import acreate_agent_graph
+
+    app = await acreate_agent_graph()
+    # 预热异步 HTTP 客户端
+    await app.ainvoke({"messages": [_prompt(0)]})
+    results = {}
+    turn = 10_000
+    for level in levels:
+        latencies: list[float] = []
+        prompts = []
+        for _ in range(level * turns):
+            turn += 1
+            prompts.append(_prompt(turn))
+        semaphore = asyncio.Semaphore(level)
+        # 预热：先并发执行 level 轮，使会话池扩容到 level 个会话，计时不包含建立会话的耗时
+        warmup = []
+        for _ in range(level):
+            turn += 1
+            warmup.append(_prompt(turn))
+        await asyncio.gather(*(app.ainvoke({"messages": [prompt]}) for prompt in warmup))
+
+        async def run(prompt: HumanMessage) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                await app.ainvoke({"messages": [prompt]})
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(prompt) for prompt in prompts))
+        elapsed = time.perf_counter() - start
+        results[f"concurrency_{level}"] = {
+            "turns_per_second": len(prompts) / elapsed,
+            "turn": percentiles(latencies),
+        }
+    return results
+
+
+def run(
+    llm_config: FakeLLMConfig,
+    history_sizes: tuple[int, ...] = DEFAULT_HISTORY_SIZES,
+    concurrency: tuple[int, ...] = DEFAULT_CONCURRENCY,
+    turns: int = 20,
+    startup_runs: int = 3,
+    streaming: bool = True,
+) -> dict[str, Any]:
+    """执行完整的基准套件，返回可序列化为 JSON 的结果."""
+    results: dict[str, Any] = {
+        "python": sys.version.split()[0],
+        "config": {
+            "llm": asdict(llm_config),
+            "history_sizes": list(history_sizes),
+            "concurrency": list(concurrency),
+            "turns": turns,
+            "streaming": streaming,
+        },
+    }
+    if startup_runs > 0:
+        results["startup"] = startup.run(startup_runs)
+
+    with FakeLLMServer(llm_config) as server:
+        os.environ.update({
+            "DEEPSEEK_API_KEY": os.environ.get("DEEPSEEK_API_KEY") or "benchmark",
+            "DEEPSEEK_BASE_URL": server.base_url,
+            "AGENT_STREAMING": "true" if streaming else "false",
+            "AGENT_LLM_CACHE": "none",
+            "AGENT_CHECKPOINTER": "none",
+        })
+        from agent import create_agent_graph
+
+        app = create_agent_graph()
+        # 预热：建立 MCP 会话与 HTTP 连接
+        app.invoke({"messages": [_prompt(0)]})
+
+        results["turns"] = bench_turns(app, history_sizes, turns)
+        results["mcp_call"] = bench_mcp_call(turns * 5)
+        results["memory"] = bench_memory(app, history_sizes)
+        results["concurrency"] = asyncio.run(bench_concurrency(concurrency, max(1, turns // 4)))
+        results["llm_requests"] = server.request_count
+    return results
+
+
+def _flatten(data: Any, prefix: str = "") -> dict[str, float]:
+    if isinstance(data, dict):
+        flat = {}
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(data, (int, float)) and not isinstance(data, bool) and not prefix.startswith("config."):
+        return {prefix: float(data)}
+    return {}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], threshold: float = 0.1) -> list[str]:
+    """返回相对 baseline 变差超过 threshold 的指标描述."""
+    old, new = _flatten(baseline), _flatten(current)
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        if key.endswith(("runs", "turns", "llm_requests")) or before <= 0:
+            continue
+        change = (after - before) / before
+        # 吞吐越高越好，其余（耗时、内存）越低越好
+        worse = -change if key.endswith("per_second") else change
+        if worse > threshold:
+            regressions.append(f"{key}: {before:.2f} -> {after:.2f} ({change:+.1%})")
+    return regressions
+
+
+def _print_report(results: dict[str, Any]) -> None:
+    if "startup" in results:
+        build = results["startup"]["build_seconds"]
+        print(
+            f"启动: 无工具缓存 {build['no_tool_cache']['median'] * 1000:.0f} ms, "
+            f"有工具缓存 {build['tool_cache']['median'] * 1000:.0f} ms"
+        )
+    print("单轮延迟:")
+    for name, stats in results["turns"].items():
+        turn, tools = stats["turn"], stats["tools_node"]
+        print(
+            f"  {name:<14} p50 {turn['p50_ms']:7.1f} ms  p90 {turn['p90_ms']:7.1f} ms  "
+            f"p99 {turn['p99_ms']:7.1f} ms  tools 节点 p50 {tools.get('p50_ms', 0):6.1f} ms"
+        )
+    call = results["mcp_call"]
+    print(f"MCP 调用: p50 {call['p50_ms']:.2f} ms  p99 {call['p99_ms']:.2f} ms")
+    print("内存:")
+    for name, stats in results["memory"]["per_turn"].items():
+        print(f"  {name:<14} 单轮分配峰值 {stats['peak_alloc_mb']:.2f} MB")
+    print(f"  峰值 RSS {results['memory']['peak_rss_mb']:.1f} MB")
+    print("并发:")
+    for name, stats in results["concurrency"].items():
+        print(
+            f"  {name:<14} {stats['turns_per_second']:7.1f} 轮/秒  "
+            f"p50 {stats['turn']['p50_ms']:7.1f} ms  p99 {stats['turn']['p99_ms']:7.1f} ms"
+        )
+
+
+def _int_list(value: str) -> tuple[int, ...]:
+    return tuple(int(item) for item in value.split(",") if item)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="运行离线基准套件")
+    parser.add_argument("--turns", type=int, default=20, help="每个历史长度下的对话轮数")
+    parser.add_argument("--history-sizes", type=_int_list, default=DEFAULT_HISTORY_SIZES, help="逗号分隔的历史消息数")
+    parser.add_argument("--concurrency", type=_int_list, default=DEFAULT_CONCURRENCY, help="逗号分隔的并发度")
+    parser.add_argument("--startup-runs", type=int, default=3, help="启动基准的重复次数，0 表示跳过")
+    parser.add_argument("--no-streaming", action="store_true", help="以非流式方式调用 LLM")
+    parser.add_argument("--latency", type=float, default=0.05, help="假 LLM 的首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="假 LLM 的输出速率")
+    parser.add_argument("--response-tokens", type=int, default=20, help="文本回答的 token 数")
+    parser.add_argument("--tool-calls", type=int, default=1, help="每轮发出的工具调用数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为回退的相对变化")
+    args = parser.parse_args(argv)
+
+    llm_config = FakeLLMConfig(args.latency, args.tokens_per_second, args.response_tokens, args.tool_calls)
+    results = run(
+        llm_config,
+        history_sizes=args.history_sizes,
+        concurrency=args.concurrency,
+        turns=args.turns,
+        startup_runs=args.startup_runs,
+        streaming=not args.no_streaming,
+    )
+    _print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), results, args.threshold)
+        if regressions:
+            print(f"相对 {args.compare} 的性能回退:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"相对 {args.compare} 无超过 {args.threshold:.0%} 的回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""测试共用的 fixture."""
+
+import sys
+
+import pytest
+
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer
+
+
+@pytest.fixture(scope="module")
+def fake_llm(tmp_path_factory):
+    """启动本地的假 LLM 服务，并让 agent 连接它与真实的 agent.mcp.server."""
+    from agent.mcp.pool import close_mcp_pool
+
+    tmp = tmp_path_factory.mktemp("agent")
+    with FakeLLMServer(FakeLLMConfig()) as server, pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in {
+            "DEEPSEEK_API_KEY": "test",
+            "DEEPSEEK_BASE_URL": server.base_url,
+            "MCP_SERVER_COMMAND": sys.executable,
+            "MCP_SERVERS": "",
+            "AGENT_TOOL_SCHEMA_CACHE": "",
+            "AGENT_LLM_CACHE": "none",
+            "AGENT_CHECKPOINTER": "none",
+            "AGENT_TRACE_EXPORTER": "none",
+            "AGENT_BLOB_DIR": str(tmp / "blobs"),
+            "AGENT_LOG_FILE": str(tmp / "agent.log"),
+        }.items():
+            monkeypatch.setenv(name, value)
+        try:
+            yield server
+        finally:
+            close_mcp_pool()
@@ -0,0 +1,81 @@
+"""批量执行脚本化对话：读取输入、并发执行、结果落盘与续跑."""
+
+import json
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from agent.batch import BatchRunner, Conversation, load_completed_ids, load_conversations
+
+
+class State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+async def agent(state: State) -> dict:
+    text = state["messages"][-1].content
+    if text == "boom":
+        raise RuntimeError("boom")
+    turns = sum(1 for message in state["messages"] if message.type == "human")
+    return {"messages": [AIMessage(content=f"{turns}: {text}")]}
+
+
+def build_app():
+    graph = StateGraph(State)
+    graph.add_node("agent", agent)
+    graph.set_entry_point("agent")
+    graph.add_edge("agent", END)
+    return graph.compile(checkpointer=InMemorySaver())
+
+
+def _read(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_load_conversations(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"id": "a", "turns": ["x", "y"]}\n\n{"message": "z", "metadata": {"k": 1}}\n', encoding="utf-8")
+    assert load_conversations(str(path)) == [
+        Conversation("a", ["x", "y"]),
+        Conversation("3", ["z"], {"k": 1}),
+    ]
+    path.write_text('{"id": "bad", "turns": [1]}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="in.jsonl:1"):
+        load_conversations(str(path))
+
+
+def test_load_completed_ids_skips_failures_and_partial_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    assert load_completed_ids(str(path)) == set()
+    path.write_text('{"id": "a", "error": null}\n{"id": "b", "error": "x"}\n{"id": "c", "err', encoding="utf-8")
+    assert load_completed_ids(str(path)) == {"a"}
+
+
+async def test_run_writes_results_and_resumes(tmp_path):
+    output = tmp_path / "out.jsonl"
+    app = build_app()
+    conversations = [Conversation(str(i), ["hi", "again"]) for i in range(5)] + [Conversation("bad", ["boom"])]
+
+    report = await BatchRunner(app, concurrency=3).run(conversations, str(output))
+    assert (report["total"], report["succeeded"], report["failed"], report["skipped"]) == (6, 5, 1, 0)
+    records = {record["id"]: record for record in _read(output)}
+    assert [turn["response"] for turn in records["0"]["turns"]] == ["1: hi", "2: again"]
+    assert records["bad"]["error"] == "RuntimeError: boom"
+    # 完成后不再保留会话状态
+    assert (await app.aget_state({"configurable": {"thread_id": "batch-0"}})).values == {}
+
+    report = await BatchRunner(app, concurrency=3).run(conversations, str(output))
+    assert (report["skipped"], report["failed"]) == (5, 1)
+    assert len(_read(output)) == 7
+
+
+async def test_no_resume_truncates_output(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text('{"id": "0", "error": null}\n', encoding="utf-8")
+    report = await BatchRunner(build_app()).run([Conversation("0", ["hi"])], str(output), resume=False)
+    assert report["skipped"] == 0
+    assert [record["id"] for record in _read(output)] == ["0"]
@@ -0,0 +1,81 @@
+"""pytest-benchmark 用例：与 benchmarks.suite 相同的热点路径，以及结果比较逻辑.
+
+只运行基准::
+
+    uv run pytest tests/test_benchmarks.py --benchmark-only
+    uv run pytest tests/test_benchmarks.py --benchmark-autosave --benchmark-compare
+"""
+
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.cache import make_cache_key
+from agent.history import HistoryCompactor
+from benchmarks.suite import bench_concurrency, compare, make_history, percentiles
+
+
+@pytest.fixture(scope="module")
+def app(fake_llm):
+    from agent import create_agent_graph
+
+    app = create_agent_graph()
+    # 预热：建立 MCP 会话与 HTTP 连接
+    app.invoke({"messages": [HumanMessage(content="0 加 0 等于多少？")]})
+    return app
+
+
+def test_percentiles():
+    stats = percentiles([0.001 * i for i in range(1, 101)])
+    assert stats["p50_ms"] == pytest.approx(51)
+    assert stats["max_ms"] == pytest.approx(100)
+    assert percentiles([]) == {}
+
+
+def test_compare_reports_regressions_only():
+    baseline = {"turn": {"p50_ms": 10.0}, "concurrency": {"turns_per_second": 100.0}, "config": {"turns": 5}}
+    current = {"turn": {"p50_ms": 12.0}, "concurrency": {"turns_per_second": 80.0}, "config": {"turns": 50}}
+    assert compare(baseline, current) == [
+        "concurrency.turns_per_second: 100.00 -> 80.00 (-20.0%)",
+        "turn.p50_ms: 10.00 -> 12.00 (+20.0%)",
+    ]
+    assert compare(baseline, baseline) == []
+
+
+@pytest.mark.parametrize("history_size", [0, 100])
+def test_bench_turn(benchmark, app, history_size):
+    history = make_history(history_size)
+    prompts = iter(range(1, 1_000_000))
+
+    def turn():
+        # 每轮使用不同的数字，避免命中工具结果缓存
+        return app.invoke({"messages": [*history, HumanMessage(content=f"{next(prompts)} 加 1 等于多少？")]})
+
+    result = benchmark.pedantic(turn, rounds=10, warmup_rounds=1)
+    assert result["messages"][-1].content
+
+
+def test_bench_mcp_call(benchmark, fake_llm):
+    from agent.mcp.client import call_mcp_tool_sync
+
+    arguments = iter(range(1_000_000))
+    call_mcp_tool_sync("add", {"a": 0, "b": 0})
+    result = benchmark.pedantic(lambda: call_mcp_tool_sync("add", {"a": next(arguments), "b": 0.5}), rounds=50)
+    assert result.startswith("结果")
+
+
+def test_bench_concurrency(benchmark, fake_llm):
+    results = benchmark.pedantic(lambda: asyncio.run(bench_concurrency((4,), turns=2)), rounds=1)
+    assert results["concurrency_4"]["turns_per_second"] > 0
+
+
+def test_bench_history_compaction(benchmark):
+    history = make_history(400)
+    compactor = HistoryCompactor(max_tokens=2000)
+    assert benchmark(compactor.compact, history)
+
+
+def test_bench_response_cache_key(benchmark):
+    history = make_history(100)
+    assert benchmark(make_cache_key, "deepseek-chat", 0.7, [], history)
@@ -0,0 +1,69 @@
+"""Blob 存储：内容寻址去重、引用计数与淘汰、大结果的截断视图与分段读取."""
+
+import pytest
+from langchain_core.messages import ToolMessage
+
+from agent import blobs
+from agent.blobs import BlobStore, create_read_blob_tool, offload_text, release_blobs
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs"), max_bytes=100)
+    monkeypatch.setattr(blobs, "_blob_store", store)
+    return store
+
+
+def test_put_deduplicates_and_reads_ranges(store):
+    ref = store.put(b"hello world")
+    assert store.put(b"hello world", retain=False) == ref
+    assert ref["size"] == 11 and len(ref["blob"]) == 64
+    assert store.read(ref["blob"]) == b"hello world"
+    assert store.read(ref["blob"], 6, 3) == b"wor"
+    assert store.read(ref["blob"], 50) == b""
+    assert store.read("0" * 64) is None
+    assert store.stats() == {"blobs": 1, "bytes": 11, "referenced_bytes": 11, "max_bytes": 100, "evictions": 0}
+
+
+def test_eviction_skips_referenced_blobs(store):
+    kept = store.put(b"a" * 40)["blob"]
+    old = store.put(b"b" * 40, retain=False)["blob"]
+    store.put(b"c" * 40, retain=False)
+    # 超出上限时淘汰最久未访问且未被引用的 blob
+    assert store.size(old) is None and store.size(kept) == 40
+    assert store.evictions == 1
+
+    store.release(kept)
+    store.put(b"d" * 40, retain=False)
+    assert store.size(kept) is None
+
+
+def test_store_reloads_from_disk(store, tmp_path):
+    digest = store.put(b"persisted")["blob"]
+    (tmp_path / "blobs" / digest[:2] / f"{digest}.abc.tmp").write_bytes(b"partial")
+    reloaded = BlobStore(str(tmp_path / "blobs"), max_bytes=100)
+    assert reloaded.read(digest) == b"persisted"
+    assert reloaded.stats()["blobs"] == 1
+
+
+def test_offload_text_keeps_head_and_tail(store):
+    text = "x" * 100 + "y" * 20
+    assert offload_text("short", max_chars=40) == ("short", None)
+    view, ref = offload_text(text, max_chars=40)
+    assert ref is not None and ref["chars"] == 120
+    assert view.startswith("x" * 30 + "\n…[已省略 80 个字符") and view.endswith("\n" + "y" * 10)
+    assert ref["blob"] in view
+
+    release_blobs([ToolMessage(content=view, tool_call_id="1", artifact=ref), ToolMessage(content="", tool_call_id="2")])
+    assert store.stats()["referenced_bytes"] == 0
+
+
+def test_read_blob_tool_respects_utf8_boundaries(store):
+    digest = store.put("你好世界".encode())["blob"]
+    read_blob = create_read_blob_tool(store, max_chars=7)
+    # 每个汉字 3 字节：7 字节的分段只返回完整的两个字
+    assert read_blob.invoke({"blob": digest}) == "[字节 0-6 / 12，下一段 offset=6]\n你好"
+    # offset 落在字符中间时从下一个字符开始
+    assert read_blob.invoke({"blob": digest, "offset": 4}) == "[字节 6-9 / 12，下一段 offset=9]\n世"
+    assert read_blob.invoke({"blob": digest, "offset": 9}) == "[字节 9-12 / 12，已读完]\n界"
+    assert read_blob.invoke({"blob": "0" * 64}).startswith("错误: blob")
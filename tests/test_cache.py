@@ -0,0 +1,109 @@
+"""LRU + TTL 缓存与 LLM 响应缓存."""
+
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent.cache import (
+    MemoryResponseCache,
+    ResponseCache,
+    SQLiteResponseCache,
+    TTLCache,
+    create_response_cache,
+    make_cache_key,
+)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries():
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=0.05)
+    cache.set("short", 1)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.08)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def _history(call_id: str, message_id: str) -> list:
+    return [
+        HumanMessage(content="1+2?", id=message_id),
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": call_id}]),
+        ToolMessage(content="3", tool_call_id=call_id),
+    ]
+
+
+def test_cache_key_ignores_message_and_tool_call_ids():
+    key = make_cache_key("m", 0.7, [], _history("call_a", "h1"))
+    assert key == make_cache_key("m", 0.7, [], _history("call_b", "h2"))
+    assert key != make_cache_key("m", 0.0, [], _history("call_a", "h1"))
+    assert key != make_cache_key("m", 0.7, [{"name": "add"}], _history("call_a", "h1"))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def response_cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryResponseCache(max_entries=2, ttl=60)
+    return SQLiteResponseCache(str(tmp_path / "llm_cache.sqlite"), max_entries=2, ttl=60)
+
+
+def test_backends_must_implement_storage():
+    class WriteOnlyCache(ResponseCache):
+        def _set(self, key, value):
+            pass
+
+    with pytest.raises(TypeError, match="_get"):
+        WriteOnlyCache()
+
+
+def test_lookup_returns_a_fresh_copy_and_counts_hits(response_cache):
+    original = AIMessage(content="", id="run-1", tool_calls=[{"name": "add", "args": {}, "id": "call_1"}])
+    response_cache.update("k", original)
+    cached = response_cache.lookup("k")
+    assert cached.id != original.id
+    assert cached.tool_calls[0]["id"] != "call_1"
+    assert cached.tool_calls[0]["name"] == "add"
+    assert response_cache.lookup("missing") is None
+    assert response_cache.stats.as_dict() == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_empty_responses_are_not_cached(response_cache):
+    response_cache.update("k", AIMessage(content=""))
+    assert response_cache.lookup("k") is None
+
+
+def test_capacity_evicts_oldest_entries(response_cache):
+    for key in ("a", "b", "c"):
+        response_cache.update(key, AIMessage(content=key))
+        time.sleep(0.01)
+    assert response_cache.lookup("a") is None
+    assert response_cache.lookup("c").content == "c"
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    SQLiteResponseCache(path, max_entries=10, ttl=60).update("k", AIMessage(content="hello"))
+    assert SQLiteResponseCache(path, max_entries=10, ttl=60).lookup("k").content == "hello"
+
+
+def test_sqlite_cache_expires_entries(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "llm_cache.sqlite"), max_entries=10, ttl=0.05)
+    cache.update("k", AIMessage(content="hello"))
+    time.sleep(0.08)
+    assert cache.lookup("k") is None
+
+
+def test_unknown_cache_kind_is_rejected():
+    assert create_response_cache("none") is None
+    with pytest.raises(ValueError):
+        create_response_cache("redis")
@@ -0,0 +1,80 @@
+"""按 thread_id 持久化的 checkpointer：memory / sqlite、跨实例恢复与删除会话."""
+
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from agent.checkpoint import (
+    aclose_checkpointer,
+    acreate_checkpointer,
+    adelete_thread,
+    create_checkpointer,
+    delete_thread,
+)
+
+
+class State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def echo(state: State) -> dict:
+    return {"messages": [AIMessage(content=f"echo: {state['messages'][-1].content}")]}
+
+
+def build(checkpointer):
+    graph = StateGraph(State)
+    graph.add_node("echo", echo)
+    graph.set_entry_point("echo")
+    graph.add_edge("echo", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_none_disables_persistence():
+    assert create_checkpointer("none") is None
+
+
+def test_unknown_kind_is_rejected():
+    with pytest.raises(ValueError):
+        create_checkpointer("redis")
+
+
+def test_threads_are_isolated():
+    app = build(create_checkpointer("memory"))
+    app.invoke({"messages": [HumanMessage(content="a")]}, config("t1"))
+    app.invoke({"messages": [HumanMessage(content="b")]}, config("t1"))
+    app.invoke({"messages": [HumanMessage(content="c")]}, config("t2"))
+    assert len(app.get_state(config("t1")).values["messages"]) == 4
+    assert len(app.get_state(config("t2")).values["messages"]) == 2
+
+
+def test_sqlite_state_survives_a_new_checkpointer(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    build(create_checkpointer("sqlite", path)).invoke({"messages": [HumanMessage(content="hi")]}, config("t"))
+    restored = build(create_checkpointer("sqlite", path)).get_state(config("t")).values["messages"]
+    assert [message.content for message in restored] == ["hi", "echo: hi"]
+
+
+def test_delete_thread_removes_state(tmp_path):
+    app = build(create_checkpointer("sqlite", str(tmp_path / "checkpoints.sqlite")))
+    app.invoke({"messages": [HumanMessage(content="hi")]}, config("t"))
+    delete_thread(app, "t")
+    assert app.get_state(config("t")).values == {}
+
+
+async def test_async_sqlite_round_trip(tmp_path):
+    checkpointer = await acreate_checkpointer("sqlite", str(tmp_path / "checkpoints.sqlite"))
+    try:
+        app = build(checkpointer)
+        await app.ainvoke({"messages": [HumanMessage(content="hi")]}, config("t"))
+        assert len((await app.aget_state(config("t"))).values["messages"]) == 2
+        await adelete_thread(app, "t")
+        assert (await app.aget_state(config("t"))).values == {}
+    finally:
+        await aclose_checkpointer(checkpointer)
@@ -0,0 +1,51 @@
+"""控制台的流式输出：token 逐个打印，完整消息不重复打印."""
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+from agent.console import ConsoleInterface
+
+AGENT = {"langgraph_node": "agent"}
+
+
+class FakeApp:
+    """按顺序产出预设 (mode, payload) 事件的 graph."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def stream(self, state, config, stream_mode):
+        yield from self.events
+
+
+def _run(events, capsys):
+    console = ConsoleInterface(FakeApp(events), stream=True)
+    state = {"messages": [HumanMessage(content="hi", id="h1")]}
+    messages = console._run_turn(state, {"configurable": {"thread_id": "t"}})
+    return messages, capsys.readouterr().out
+
+
+def test_streamed_answer_is_printed_once(capsys):
+    answer = AIMessage(content="你好世界", id="a1")
+    events = [
+        ("messages", (AIMessageChunk(content="你好", id="a1"), AGENT)),
+        ("messages", (AIMessageChunk(content="世界", id="a1"), AGENT)),
+        ("updates", {"agent": {"messages": [answer]}}),
+        ("values", {"messages": [HumanMessage(content="hi", id="h1"), answer]}),
+    ]
+    messages, out = _run(events, capsys)
+    assert out.count("你好世界") == 1
+    assert messages[-1] is answer
+
+
+def test_tool_events_and_unstreamed_messages_are_printed(capsys):
+    events = [
+        ("messages", (AIMessageChunk(content="", id="a1", tool_call_chunks=[
+            {"name": "add", "args": "", "id": "c1", "index": 0},
+        ]), AGENT)),
+        ("updates", {"tools": {"messages": [ToolMessage(content="3", name="add", tool_call_id="c1")]}}),
+        ("updates", {"agent": {"messages": [AIMessage(content="结果是 3", id="a2")]}}),
+    ]
+    _, out = _run(events, capsys)
+    assert "[调用工具] add" in out
+    assert "Tool call: add 3" in out
+    assert "Agent: 结果是 3" in out
@@ -0,0 +1,95 @@
+"""每轮对话的截止时间：剩余时间的传递、部分回答，以及流式输出被截断时不重复输出已发送的文本."""
+
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent.console import ConsoleInterface
+from agent.deadline import (
+    FINISH_DEADLINE,
+    DeadlineExceeded,
+    clamp,
+    expired,
+    partial_answer,
+    remaining,
+    turn_deadline,
+    unstreamed_text,
+)
+from agent.mcp.client import call_mcp_tool_sync
+from agent.server import turn_events
+
+
+def test_turn_deadline_nests_and_clamps():
+    assert remaining() is None and clamp(5) == 5
+    with turn_deadline(10):
+        with turn_deadline(0.05):
+            assert clamp(5) <= 0.05
+        assert 9 < remaining() <= 10
+        # 外层更早的截止时间优先
+        with turn_deadline(60):
+            assert remaining() <= 10
+    with turn_deadline(0.01):
+        time.sleep(0.02)
+        assert expired()
+        with pytest.raises(DeadlineExceeded):
+            clamp(5)
+
+
+def test_partial_answer():
+    question = HumanMessage(content="q")
+    call = AIMessage(content="", tool_calls=[{"name": "add", "args": {}, "id": "c1"}])
+    results = [ToolMessage(content="结果: 3.0", name="add", tool_call_id="c1")]
+    answer = partial_answer([question, call, *results], FINISH_DEADLINE, "超时")
+    assert answer.content == "已获得的工具结果：\n- add: 结果: 3.0\n\n（本轮未完成：超时）"
+    assert answer.response_metadata == {"finish_reason": FINISH_DEADLINE}
+
+    answer = partial_answer([question], FINISH_DEADLINE, "超时", "部分回答", message_id="run-1")
+    assert (answer.id, answer.content) == ("run-1", "部分回答\n\n（本轮未完成：超时）")
+
+
+def test_unstreamed_text():
+    answer = AIMessage(content="部分回答\n\n（本轮未完成：超时）", id="run-1")
+    assert unstreamed_text(answer, {"run-1": "部分回答"}) == "\n\n（本轮未完成：超时）"
+    assert unstreamed_text(answer, {}) == answer.content
+    assert unstreamed_text(AIMessage(content="完整回答", id="run-2"), {"run-2": "完整回答"}) == ""
+
+
+@pytest.fixture(scope="module")
+def app(fake_llm):
+    from agent import create_agent_graph
+
+    # 预先启动 MCP server，工具调用不占用本轮的时间
+    call_mcp_tool_sync("add", {"a": 0, "b": 0})
+    return create_agent_graph()
+
+
+@pytest.fixture
+def slow_tokens(fake_llm, monkeypatch):
+    # 回答约 20 个 token，每秒 20 个：截止时间在回答流式输出的中途到达
+    monkeypatch.setattr(fake_llm.config, "tokens_per_second", 20)
+
+
+def test_console_prints_deadline_partial_answer_once(app, slow_tokens, capsys):
+    console = ConsoleInterface(app, stream=True)
+    state = {"messages": [HumanMessage(content="1 加 2 等于多少？", id="h1")]}
+    with turn_deadline(0.6):
+        messages = console._run_turn(state, {"configurable": {"thread_id": "deadline-console"}})
+    answer = messages[-1]
+    assert answer.response_metadata["finish_reason"] == FINISH_DEADLINE
+    assert answer.content.startswith("回答：") and "token19" not in answer.content
+
+    out = capsys.readouterr().out
+    assert out.count("回答：") == 1 and out.count("本轮未完成") == 1
+    assert out.count("\nAgent: ") == 1
+
+
+async def test_server_sends_deadline_partial_answer_once(app, slow_tokens):
+    with turn_deadline(0.6):
+        events = [event async for event in turn_events(app, "deadline-server", "1 加 2 等于多少？")]
+    names = [name for name, _ in events]
+    assert "message" not in names
+    done = events[-1][1]
+    assert done["finish_reason"] == FINISH_DEADLINE
+    # token 事件拼接起来就是完整的部分回答（包括末尾补上的未完成原因）
+    assert "".join(data["content"] for name, data in events if name == "token") == done["response"]
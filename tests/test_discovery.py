@@ -0,0 +1,65 @@
+"""磁盘上的 MCP 工具 schema 缓存."""
+
+import pytest
+
+from agent.mcp import discovery
+from agent.mcp.discovery import _save_complete, load_cached_tool_specs, save_tool_specs
+
+SPECS = [{"name": "add", "inputSchema": {"type": "object"}}]
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    path = tmp_path / "nested" / "mcp_tools.json"
+    monkeypatch.setenv("AGENT_TOOL_SCHEMA_CACHE", str(path))
+    monkeypatch.delenv("MCP_SERVERS", raising=False)
+    monkeypatch.setenv("MCP_SERVER_COMMAND", "python")
+    return path
+
+
+def test_round_trip_creates_cache_directory(cache_path):
+    assert load_cached_tool_specs() is None
+    save_tool_specs(SPECS)
+    assert cache_path.exists()
+    assert not list(cache_path.parent.glob("*.tmp"))
+    assert load_cached_tool_specs() == SPECS
+
+
+def test_endpoint_change_invalidates_cache(cache_path, monkeypatch):
+    save_tool_specs(SPECS)
+    monkeypatch.setenv("MCP_SERVER_COMMAND", "python3")
+    assert load_cached_tool_specs() is None
+
+
+def test_corrupt_cache_is_ignored(cache_path):
+    cache_path.parent.mkdir()
+    cache_path.write_text("{not json", encoding="utf-8")
+    assert load_cached_tool_specs() is None
+
+
+def test_empty_path_disables_cache(cache_path, monkeypatch):
+    monkeypatch.setenv("AGENT_TOOL_SCHEMA_CACHE", "")
+    save_tool_specs(SPECS)
+    assert load_cached_tool_specs() is None
+    assert not cache_path.exists()
+
+
+def test_partial_discovery_is_not_cached(cache_path):
+    assert _save_complete(SPECS, ["broken"]) == SPECS
+    assert load_cached_tool_specs() is None
+    _save_complete(SPECS, [])
+    assert load_cached_tool_specs() == SPECS
+
+
+def test_refresh_without_cache_only_warms_pool(cache_path, monkeypatch, caplog):
+    monkeypatch.setenv("AGENT_TOOL_SCHEMA_CACHE", "")
+    monkeypatch.setattr(discovery, "fetch_tool_specs", lambda: SPECS)
+    discovery.refresh_in_background().join()
+    assert "已变化" not in caplog.text
+
+
+def test_refresh_reports_changed_tools(cache_path, monkeypatch, caplog):
+    save_tool_specs([])
+    monkeypatch.setattr(discovery, "fetch_tool_specs", lambda: SPECS)
+    discovery.refresh_in_background().join()
+    assert "已变化" in caplog.text
@@ -0,0 +1,72 @@
+"""agent graph 的原生异步路径：acreate_agent_graph 构建的 graph 通过 ainvoke / astream 执行一轮工具调用."""
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+QUESTION = "15 加 27 等于多少？"
+
+
+async def _app(monkeypatch, streaming: bool):
+    from agent import acreate_agent_graph
+
+    monkeypatch.setenv("AGENT_STREAMING", "true" if streaming else "false")
+    return await acreate_agent_graph()
+
+
+def _assert_tool_turn(messages: list) -> None:
+    question, call, result, answer = messages
+    assert isinstance(question, HumanMessage) and question.content == QUESTION
+    assert isinstance(call, AIMessage)
+    assert [(tool_call["name"], tool_call["args"]) for tool_call in call.tool_calls] == [("add", {"a": 15, "b": 27})]
+    assert isinstance(result, ToolMessage)
+    assert (result.name, result.content, result.status) == ("add", "结果: 42.0", "success")
+    assert result.tool_call_id == call.tool_calls[0]["id"]
+    assert isinstance(answer, AIMessage) and not answer.tool_calls
+    assert answer.content.startswith("回答：结果: 42.0")
+
+
+async def test_ainvoke_runs_a_tool_calling_turn(fake_llm, monkeypatch):
+    app = await _app(monkeypatch, streaming=False)
+    requests = fake_llm.request_count
+    result = await app.ainvoke({"messages": [HumanMessage(content=QUESTION)]})
+    _assert_tool_turn(result["messages"])
+    assert fake_llm.request_count - requests == 2
+
+
+async def test_astream_streams_tokens_and_node_updates(fake_llm, monkeypatch):
+    app = await _app(monkeypatch, streaming=True)
+    chunks: list[AIMessageChunk] = []
+    nodes: list[str] = []
+    messages: list = []
+    async for mode, payload in app.astream(
+        {"messages": [HumanMessage(content=QUESTION)]}, stream_mode=["messages", "updates", "values"]
+    ):
+        if mode == "messages" and isinstance(payload[0], AIMessageChunk):
+            chunks.append(payload[0])
+        elif mode == "updates":
+            nodes.extend(payload)
+        elif mode == "values":
+            messages = payload["messages"]
+
+    _assert_tool_turn(messages)
+    assert "tools" in nodes
+    # 最终回答逐 token 流式输出，拼接后与 graph 状态中的回答一致
+    answer = messages[-1]
+    streamed = "".join(chunk.text for chunk in chunks if chunk.id == answer.id)
+    assert len([chunk for chunk in chunks if chunk.id == answer.id and chunk.text]) > 1
+    assert streamed == answer.content
+
+
+@pytest.mark.parametrize("streaming", [False, True], ids=["invoke", "stream"])
+async def test_async_turns_keep_thread_state(fake_llm, monkeypatch, streaming):
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from agent import acreate_agent_graph
+
+    monkeypatch.setenv("AGENT_STREAMING", "true" if streaming else "false")
+    app = await acreate_agent_graph(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": f"async-{streaming}"}}
+    await app.ainvoke({"messages": [HumanMessage(content=QUESTION)]}, config)
+    result = await app.ainvoke({"messages": [HumanMessage(content="1 加 2 等于多少？")]}, config)
+    assert len(result["messages"]) == 8
+    assert result["messages"][-2].content == "结果: 3.0"
@@ -0,0 +1,83 @@
+"""HistoryCompactor：预算内不改写、截断较早的工具结果、按单元丢弃与滚动摘要."""
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+
+from agent.history import SUMMARY_MESSAGE_ID, HistoryCompactor, group_messages
+
+
+def chars(messages):
+    """以字符数作为 token 数，便于精确控制预算."""
+    return sum(len(str(message.content)) for message in messages)
+
+
+def tool_round(call_id: str, result: str) -> list:
+    return [
+        AIMessage(content="", tool_calls=[{"name": "add", "args": {}, "id": call_id}]),
+        ToolMessage(content=result, name="add", tool_call_id=call_id),
+    ]
+
+
+def test_groups_keep_tool_calls_with_their_results():
+    messages = [HumanMessage(content="q"), *tool_round("c1", "1"), AIMessage(content="a")]
+    assert [len(group) for group in group_messages(messages)] == [1, 2, 1]
+
+
+def test_history_within_budget_is_left_untouched():
+    compactor = HistoryCompactor(max_tokens=100, token_counter=chars)
+    assert compactor.compact([HumanMessage(content="hello"), AIMessage(content="world")]) == []
+
+
+def test_drops_oldest_groups_and_keeps_system_prompt():
+    compactor = HistoryCompactor(max_tokens=30, token_counter=chars)
+    system = SystemMessage(content="sys")
+    messages = [system]
+    for i in range(5):
+        messages += [HumanMessage(content=f"question{i}"), AIMessage(content=f"answer{i}")]
+    update = compactor.compact(messages)
+    assert isinstance(update[0], RemoveMessage)
+    kept = update[1:]
+    assert kept[0] is system
+    assert [message.content for message in kept[1:]] == ["answer3", "question4", "answer4"]
+    assert chars(kept) <= 30
+
+
+def test_truncates_only_tool_results_before_the_current_turn():
+    compactor = HistoryCompactor(max_tokens=1000, max_tool_result_chars=10, token_counter=chars)
+    old = tool_round("c0", "x" * 400)
+    current = [HumanMessage(content="now"), *tool_round("c1", "y" * 400), *tool_round("c2", "z" * 400)]
+    update = compactor.compact([HumanMessage(content="before"), *old, AIMessage(content="done"), *current])
+    results = {message.tool_call_id: message.content for message in update if isinstance(message, ToolMessage)}
+    assert results["c0"].startswith("x" * 10) and "已截断" in results["c0"]
+    assert results["c1"] == "y" * 400
+    assert results["c2"] == "z" * 400
+
+
+def test_never_splits_a_tool_call_from_its_results():
+    compactor = HistoryCompactor(max_tokens=25, token_counter=chars)
+    messages = [HumanMessage(content="q" * 10), *tool_round("c1", "r" * 10), AIMessage(content="a" * 10)]
+    kept = compactor.compact(messages)[1:]
+    assert not (kept and isinstance(kept[0], ToolMessage))
+
+
+def test_dropped_messages_are_merged_into_a_rolling_summary():
+    llm = FakeListChatModel(responses=["用户问了早期的问题"])
+    compactor = HistoryCompactor(max_tokens=40, summary_llm=llm, summary_max_tokens=10, token_counter=chars)
+    messages = []
+    for i in range(4):
+        messages += [HumanMessage(content=f"question{i}"), AIMessage(content=f"answer{i}")]
+    update = compactor.compact(messages)
+    summary = update[1]
+    assert summary.id == SUMMARY_MESSAGE_ID
+    assert "用户问了早期的问题" in summary.content
+    assert update[-1].content == "answer3"
+
+
+async def test_async_compaction_matches_sync():
+    compactor = HistoryCompactor(max_tokens=30, token_counter=chars)
+    messages = []
+    for i in range(5):
+        messages += [HumanMessage(content=f"question{i}"), AIMessage(content=f"answer{i}")]
+    sync = [message.content for message in compactor.compact(messages)[1:]]
+    asynchronous = [message.content for message in (await compactor.acompact(messages))[1:]]
+    assert sync == asynchronous
@@ -0,0 +1,122 @@
+"""LLM transport：令牌桶限流、退避重试，以及截止时间对重试与限流等待的约束."""
+
+import time
+from email.utils import formatdate
+from typing import Optional
+
+import httpx
+import pytest
+
+from agent.deadline import DeadlineExceeded, turn_deadline
+from agent.llm_transport import AsyncResilientTransport, RateLimiter, ResilientTransport, RetryPolicy
+
+
+def test_rate_limiter_disabled():
+    limiter = RateLimiter(0, 0)
+    assert not limiter.enabled
+    assert limiter.reserve(10_000) == 0
+
+
+def test_rate_limiter_queues_requests_beyond_the_burst():
+    limiter = RateLimiter(requests_per_second=2, tokens_per_minute=0)
+    assert [limiter.reserve(0) for _ in range(2)] == [0, 0]
+    assert limiter.reserve(0) == pytest.approx(0.5, abs=0.01)
+    assert limiter.reserve(0) == pytest.approx(1.0, abs=0.01)
+
+
+def test_rate_limiter_counts_tokens():
+    limiter = RateLimiter(requests_per_second=0, tokens_per_minute=600)
+    assert limiter.reserve(600) == 0
+    assert limiter.reserve(10) == pytest.approx(1.0, abs=0.01)
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(max_retries=5, base_delay=0.5, max_delay=2)
+    for attempt in range(6):
+        assert 0 <= policy.backoff(attempt) <= min(2, 0.5 * 2 ** attempt)
+
+
+def test_delay_for_honours_retry_after():
+    policy = RetryPolicy(max_retries=3, base_delay=0.1, max_delay=5)
+    assert policy.delay_for(httpx.Response(400), 0) is None
+    assert policy.delay_for(httpx.Response(429, headers={"Retry-After": "2"}), 0) == 2
+    assert policy.delay_for(httpx.Response(503, headers={"Retry-After": "60"}), 0) is None
+    retry_at = formatdate(time.time() + 3, usegmt=True)
+    assert 1 < policy.delay_for(httpx.Response(503, headers={"Retry-After": retry_at}), 0) <= 3
+    assert 0 <= policy.delay_for(httpx.Response(502), 0) <= 0.1
+
+
+def _scripted(*outcomes, retry_after: Optional[str] = None):
+    """依次返回给定的状态码或抛出给定的异常；429 立即重试，给出 retry_after 时 503 带上该 Retry-After."""
+    remaining = list(outcomes)
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        outcome = remaining.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        headers = {}
+        if outcome == 429:
+            headers["Retry-After"] = "0"
+        elif outcome == 503 and retry_after is not None:
+            headers["Retry-After"] = retry_after
+        return httpx.Response(outcome, headers=headers)
+
+    return httpx.MockTransport(handler), seen
+
+
+async def _send(transport, is_async: bool) -> httpx.Response:
+    request = httpx.Request("POST", "http://llm/v1/chat/completions", content=b"{}")
+    if is_async:
+        return await transport.handle_async_request(request)
+    return transport.handle_request(request)
+
+
+def _transport(inner, is_async: bool, policy: RetryPolicy, limiter: RateLimiter = RateLimiter(0, 0)):
+    return (AsyncResilientTransport if is_async else ResilientTransport)(inner, policy, limiter)
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def is_async(request):
+    return request.param
+
+
+async def test_retries_transient_failures(is_async):
+    inner, seen = _scripted(httpx.ConnectError("refused"), 429, 503, 200)
+    response = await _send(_transport(inner, is_async, RetryPolicy(3, 0.001, 0.01)), is_async)
+    assert response.status_code == 200
+    assert len(seen) == 4
+
+
+async def test_returns_last_response_when_retries_are_exhausted(is_async):
+    inner, seen = _scripted(503, 503)
+    response = await _send(_transport(inner, is_async, RetryPolicy(1, 0.001, 0.01)), is_async)
+    assert response.status_code == 503
+    assert len(seen) == 2
+
+
+async def test_raises_transport_error_when_retries_are_exhausted(is_async):
+    inner, _ = _scripted(httpx.ConnectError("refused"))
+    with pytest.raises(httpx.ConnectError):
+        await _send(_transport(inner, is_async, RetryPolicy(0, 0.001, 0.01)), is_async)
+
+
+async def test_does_not_retry_past_the_deadline(is_async):
+    # 服务端要求重试前等待 10 秒，超出剩余时间（不带 Retry-After 时退避是随机的，可能落在剩余时间内）
+    inner, seen = _scripted(503, 200, retry_after="10")
+    with turn_deadline(2):
+        response = await _send(_transport(inner, is_async, RetryPolicy(3, 10, 10)), is_async)
+    assert response.status_code == 503
+    assert len(seen) == 1
+
+
+async def test_does_not_wait_for_rate_limit_past_the_deadline(is_async):
+    inner, seen = _scripted(200, 200)
+    limiter = RateLimiter(requests_per_second=0.1, tokens_per_minute=0)
+    transport = _transport(inner, is_async, RetryPolicy(0, 0, 0), limiter)
+    with turn_deadline(1):
+        assert (await _send(transport, is_async)).status_code == 200
+        with pytest.raises(DeadlineExceeded):
+            await _send(transport, is_async)
+    assert len(seen) == 1
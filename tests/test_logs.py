@@ -0,0 +1,80 @@
+"""非阻塞日志：JSON / 文本格式、上下文字段、队列满时丢弃与 stderr 输出开关."""
+
+import json
+import logging
+import queue
+
+import pytest
+
+from agent import logs
+from agent.logs import (
+    DroppingQueueHandler,
+    JSONFormatter,
+    TextFormatter,
+    configure_logging,
+    log_context,
+)
+
+
+def _record(message: str = "hello %s", *args) -> logging.LogRecord:
+    record = logging.LogRecord("agent.test", logging.INFO, __file__, 1, message, args or ("world",), None)
+    logs._ContextFilter().filter(record)
+    return record
+
+
+def test_json_formatter_includes_context_and_extra_fields():
+    with log_context(thread_id="t1", turn_id="a1b2"):
+        record = _record()
+    record.tool = "add"
+    data = json.loads(JSONFormatter().format(record))
+    assert data["message"] == "hello world"
+    assert (data["level"], data["logger"]) == ("INFO", "agent.test")
+    assert (data["thread_id"], data["turn_id"], data["tool"]) == ("t1", "a1b2", "add")
+
+
+def test_text_formatter_appends_context_only_when_set():
+    assert TextFormatter().format(_record()).endswith("agent.test - INFO - hello world")
+    with log_context(thread_id="t1"):
+        assert TextFormatter().format(_record()).endswith("hello world [t1/-]")
+
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(_record())
+    handler.handle(_record())
+    assert handler.dropped == 1
+    # 消息参数在调用方线程中合并
+    assert handler.queue.get_nowait().msg == "hello world"
+
+
+@pytest.fixture
+def configured(monkeypatch, tmp_path):
+    path = tmp_path / "agent.log"
+    monkeypatch.setenv("AGENT_LOG_FILE", str(path))
+    monkeypatch.setenv("AGENT_LOG_FORMAT", "json")
+    monkeypatch.setenv("AGENT_LOG_LEVEL", "INFO")
+    logs.shutdown_logging()
+    yield path
+    logs.shutdown_logging()
+
+
+def test_configure_logging_writes_file_without_stderr(configured, monkeypatch, capsys):
+    monkeypatch.delenv("AGENT_LOG_STDERR_LEVEL", raising=False)
+    configure_logging()
+    with log_context(thread_id="t1"):
+        logging.getLogger("agent.test").warning("careful")
+    logs.shutdown_logging()
+    (line,) = configured.read_text(encoding="utf-8").splitlines()
+    assert json.loads(line)["message"] == "careful"
+    assert capsys.readouterr().err == ""
+
+
+def test_stderr_output_is_opt_in(configured, monkeypatch, capsys):
+    monkeypatch.setenv("AGENT_LOG_STDERR_LEVEL", "warning")
+    configure_logging()
+    logger = logging.getLogger("agent.test")
+    logger.info("quiet")
+    logger.error("loud")
+    logs.shutdown_logging()
+    err = capsys.readouterr().err
+    assert "ERROR - loud" in err and "quiet" not in err
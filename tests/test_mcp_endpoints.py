@@ -0,0 +1,98 @@
+"""MCP server 端点配置与多 server 的工具合并."""
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+from agent.mcp.endpoints import MCPEndpoint, get_mcp_endpoints, parse_endpoint
+from agent.mcp.pool import MCPServerRouter
+
+SERVER = f"stdio:{sys.executable} -m agent.mcp.server"
+
+
+@pytest.mark.parametrize(
+    ("spec", "expected"),
+    [
+        (
+            "stdio:python -m agent.mcp.server",
+            MCPEndpoint("d", "stdio", command="python", args=("-m", "agent.mcp.server")),
+        ),
+        ("tools=unix:/tmp/a.sock", MCPEndpoint("tools", "unix", path="/tmp/a.sock", url="http://localhost/mcp/")),
+        ("web=https://host/mcp/?a=b", MCPEndpoint("web", "http", url="https://host/mcp/?a=b")),
+        ("http://host/mcp/?a=b", MCPEndpoint("d", "http", url="http://host/mcp/?a=b")),
+    ],
+)
+def test_parse_endpoint(spec, expected):
+    assert parse_endpoint(spec, "d") == expected
+
+
+@pytest.mark.parametrize("spec", ["ftp://host", "a__b=http://host", "stdio:", "9x=unix:/tmp/s"])
+def test_parse_endpoint_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        parse_endpoint(spec, "d")
+
+
+def test_get_mcp_endpoints(monkeypatch):
+    monkeypatch.delenv("MCP_SERVERS", raising=False)
+    monkeypatch.setenv("MCP_SERVER_COMMAND", "python3")
+    (default,) = get_mcp_endpoints()
+    assert default.describe() == "default=stdio:python3 -m agent.mcp.server"
+
+    monkeypatch.setenv("MCP_SERVERS", "a=unix:/tmp/a.sock; ;b=http://h/mcp/")
+    assert [endpoint.describe() for endpoint in get_mcp_endpoints()] == ["a=unix:/tmp/a.sock", "b=http://h/mcp/"]
+
+    monkeypatch.setenv("MCP_SERVERS", "a=unix:/x;a=unix:/y")
+    with pytest.raises(ValueError, match="重复"):
+        get_mcp_endpoints()
+
+
+@pytest.fixture
+def router_factory():
+    routers = []
+
+    def make(*specs: str) -> MCPServerRouter:
+        router = MCPServerRouter([parse_endpoint(spec, f"server{i}") for i, spec in enumerate(specs)])
+        routers.append(router)
+        return router
+
+    yield make
+    for router in routers:
+        router.close()
+
+
+def test_single_server_is_not_namespaced(router_factory):
+    router = router_factory(f"main={SERVER}")
+    specs, failed = router.list_tool_specs_sync()
+    assert failed == []
+    assert {spec["name"] for spec in specs} >= {"add"}
+    assert router.call_tool_sync("add", {"a": 1, "b": 2}) == "结果: 3.0"
+
+
+async def test_multiple_servers_are_namespaced(router_factory):
+    router = router_factory(f"a={SERVER}", f"b={SERVER}", "broken=stdio:/nonexistent/mcp-server")
+    specs, failed = await router.list_tool_specs()
+    assert failed == ["broken"]
+    assert {"a__add", "b__add"} <= {spec["name"] for spec in specs}
+    assert await router.call_tool("b__add", {"a": 2, "b": 2}) == "结果: 4.0"
+    assert router.call_tool_batch_sync("a__add", [{"a": 1, "b": 1}, {"a": 2, "b": 3}]) == ["结果: 2.0", "结果: 5.0"]
+    with pytest.raises(ValueError, match="未知的 MCP 工具"):
+        router.route("add")
+
+
+def test_unix_socket_transport(router_factory, tmp_path):
+    socket_path = tmp_path / "mcp.sock"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "agent.mcp.server", "--transport", "unix", "--socket", str(socket_path)]
+    )
+    try:
+        for _ in range(100):
+            if socket_path.exists():
+                break
+            time.sleep(0.05)
+        router = router_factory(f"tools=unix:{socket_path}")
+        assert router.call_tool_sync("add", {"a": 20, "b": 22}) == "结果: 42.0"
+    finally:
+        process.terminate()
+        process.wait(10)
@@ -0,0 +1,51 @@
+"""MCP server 与 graph 的集成：假 LLM 发出 add 调用，由真实的 agent.mcp.server 执行."""
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import ToolException
+
+from agent.mcp.client import call_mcp_tool, call_mcp_tool_batch, call_mcp_tool_sync
+
+
+@pytest.fixture(scope="module")
+def app(fake_llm):
+    from agent import create_agent_graph
+
+    return create_agent_graph()
+
+
+def test_call_tool_through_pool(fake_llm):
+    assert call_mcp_tool_sync("add", {"a": 15, "b": 27}) == "结果: 42.0"
+
+
+async def test_call_tool_through_pool_async(fake_llm):
+    assert await call_mcp_tool("add", {"a": 1, "b": 2}) == "结果: 3.0"
+
+
+@pytest.mark.parametrize(
+    ("name", "arguments", "message"),
+    [
+        ("nope", {}, "错误: 未知的工具 'nope'"),
+        # 未通过 server 端 inputSchema 校验的参数同样以 isError 返回
+        ("add", {"a": "x", "b": 1}, "Input validation error"),
+    ],
+)
+async def test_tool_errors_raise_tool_exception(fake_llm, name, arguments, message):
+    with pytest.raises(ToolException, match=message):
+        await call_mcp_tool(name, arguments)
+
+
+async def test_batch_call_keeps_per_call_errors(fake_llm):
+    results = await call_mcp_tool_batch("add", [{"a": 1, "b": 1}, {"a": 1}])
+    assert results == ["结果: 2.0", "错误: 参数 'a' 和 'b' 是必需的"]
+
+
+def test_graph_runs_mcp_tool(app, fake_llm):
+    result = app.invoke({"messages": [HumanMessage(content="15 加 27 等于多少？")]})
+    messages = result["messages"]
+    tool_messages = [message for message in messages if isinstance(message, ToolMessage)]
+    assert [(message.name, message.content, message.status) for message in tool_messages] == [
+        ("add", "结果: 42.0", "success")
+    ]
+    assert isinstance(messages[-1], AIMessage) and not messages[-1].tool_calls
+    assert fake_llm.request_count >= 2
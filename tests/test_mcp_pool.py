@@ -0,0 +1,77 @@
+"""MCP 会话池：会话复用、并发上限与断线重连."""
+
+import asyncio
+
+import anyio
+import pytest
+
+from agent.mcp.pool import MCPSessionPool
+
+
+class FakeClient:
+    """代替 MCPClient 的内存客户端，记录打开的会话数."""
+
+    opened = 0
+    active = 0
+    peak = 0
+    fail_next = 0
+
+    def __init__(self):
+        FakeClient.opened += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+    async def ping(self):
+        return None
+
+    async def call_tool(self, name, arguments, timeout=None):
+        if FakeClient.fail_next:
+            FakeClient.fail_next -= 1
+            raise anyio.ClosedResourceError()
+        FakeClient.active += 1
+        FakeClient.peak = max(FakeClient.peak, FakeClient.active)
+        try:
+            await asyncio.sleep(arguments.get("sleep", 0))
+        finally:
+            FakeClient.active -= 1
+        return f"{name}:{arguments.get('value')}"
+
+
+@pytest.fixture
+def pool():
+    FakeClient.opened = FakeClient.active = FakeClient.peak = FakeClient.fail_next = 0
+    pool = MCPSessionPool(
+        client_factory=FakeClient, max_size=2, idle_timeout=60, health_check_interval=60, call_timeout=5
+    )
+    yield pool
+    pool.close()
+
+
+def test_sequential_calls_reuse_one_session(pool):
+    assert [pool.call_tool_sync("echo", {"value": i}) for i in range(3)] == ["echo:0", "echo:1", "echo:2"]
+    assert FakeClient.opened == 1
+    assert pool.stats() == {"sessions": 1, "idle": 1, "waiting": 0}
+
+
+async def test_concurrent_calls_are_bounded_by_max_size(pool):
+    results = await asyncio.gather(*(pool.call_tool("echo", {"value": i, "sleep": 0.05}) for i in range(6)))
+    assert results == [f"echo:{i}" for i in range(6)]
+    assert FakeClient.opened == 2
+    assert FakeClient.peak == 2
+
+
+def test_reconnects_once_after_connection_error(pool):
+    pool.call_tool_sync("echo", {"value": 1})
+    FakeClient.fail_next = 1
+    assert pool.call_tool_sync("echo", {"value": 2}) == "echo:2"
+    assert FakeClient.opened == 2
+
+
+def test_second_connection_error_is_raised(pool):
+    FakeClient.fail_next = 2
+    with pytest.raises(anyio.ClosedResourceError):
+        pool.call_tool_sync("echo", {"value": 1})
@@ -0,0 +1,121 @@
+"""MCP server 的工具注册表（inline / thread / process 执行）与客户端的批量调用."""
+
+import threading
+
+import pytest
+
+from agent.mcp import client, tools
+from agent.mcp.server import ToolInputError, ToolRegistry, _add, _add_batch, call_tool
+from agent.mcp.tools import (
+    ToolResultCache,
+    _convert_mcp_tools,
+    batch_call_mcp_tool,
+    batch_call_mcp_tool_sync,
+)
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"a": {"type": "number"}, "b": {"type": "number"}},
+    "required": ["a", "b"],
+}
+
+
+def _thread_name(arguments: dict) -> str:
+    return threading.current_thread().name
+
+
+@pytest.fixture
+def registry():
+    registry = ToolRegistry()
+    registry.register("add", "加法", SCHEMA, batch_func=_add_batch, cacheable=True)(_add)
+    registry.register("where", "所在线程", SCHEMA, executor="thread")(_thread_name)
+    yield registry
+    registry.shutdown()
+
+
+async def test_call_dispatches_by_name(registry):
+    assert await registry.call("add", {"a": 1, "b": 2}) == "结果: 3.0"
+    assert (await registry.call("where", {})).startswith("mcp-tool")
+    with pytest.raises(ToolInputError, match="未知的工具 'nope'"):
+        await registry.call("nope", {})
+    with pytest.raises(ToolInputError, match="参数 'a' 和 'b' 是必需的"):
+        await registry.call("add", {"a": 1})
+
+
+async def test_process_executor():
+    registry = ToolRegistry()
+    registry.register("add", "加法", SCHEMA, executor="process")(_add)
+    try:
+        assert await registry.call("add", {"a": 2, "b": 3}) == "结果: 5.0"
+    finally:
+        registry.shutdown()
+
+
+async def test_server_reports_failures_with_is_error():
+    result = await call_tool("add", {"a": 1})
+    assert result.isError and result.content[0].text == "错误: 参数 'a' 和 'b' 是必需的"
+    assert (await call_tool("batch_call", {"tool": "add"})).isError
+    (content,) = await call_tool("add", {"a": 1, "b": 2})
+    assert content.text == "结果: 3.0"
+
+
+def test_register_rejects_unknown_executor():
+    with pytest.raises(ValueError, match="executor"):
+        ToolRegistry().register("x", "", SCHEMA, executor="gpu")
+
+
+async def test_call_batch_keeps_order_and_isolates_errors(registry):
+    calls = [{"a": 1, "b": 1}, {"a": 1}, {"a": 2, "b": 2}]
+    expected = ["结果: 2.0", "错误: 参数 'a' 和 'b' 是必需的", "结果: 4.0"]
+    assert await registry.call_batch("add", calls) == expected
+    # 没有 batch_func 的工具并发地逐个执行
+    assert len(await registry.call_batch("where", [{}, {}])) == 2
+    registry.register("add_each", "加法", SCHEMA)(_add)
+    assert await registry.call_batch("add_each", calls) == expected
+    assert await registry.call_batch("nope", [{}, {}]) == ["错误: 未知的工具 'nope'"] * 2
+
+
+def test_tool_metadata(registry):
+    add, where, batch = registry.tools()
+    assert add.meta == {"batchable": True, "cacheable": True}
+    assert where.meta == {"batchable": True}
+    assert batch.meta == {"batch": True}
+
+
+def test_add_rejects_non_numbers():
+    with pytest.raises(ToolInputError):
+        _add({"a": "x", "b": 1})
+
+
+@pytest.fixture
+def batch_calls(monkeypatch):
+    """把批量调用替换为本地的 _add_batch，记录发给 server 的参数."""
+    sent: list[list[dict]] = []
+
+    def call_batch_sync(name, arguments_list):
+        sent.append(arguments_list)
+        return _add_batch(arguments_list)
+
+    async def call_batch(name, arguments_list):
+        return call_batch_sync(name, arguments_list)
+
+    monkeypatch.setattr(client, "call_mcp_tool_batch_sync", call_batch_sync)
+    monkeypatch.setattr(client, "call_mcp_tool_batch", call_batch)
+    monkeypatch.setattr(tools, "_tool_result_cache", ToolResultCache(max_entries=16, ttl=60))
+    _convert_mcp_tools([{"name": "add", "inputSchema": SCHEMA, "_meta": {"batchable": True, "cacheable": True}}])
+    return sent
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+async def test_batch_call_skips_cached_and_invalid_arguments(batch_calls, is_async):
+    async def call(arguments_list):
+        if is_async:
+            return await batch_call_mcp_tool("add", arguments_list)
+        return batch_call_mcp_tool_sync("add", arguments_list)
+
+    assert await call([{"a": 1, "b": 1}]) == ["结果: 2.0"]
+    results = await call([{"a": 1, "b": 1}, {"a": "x", "b": 1}, {"a": 2, "b": 2}])
+    assert results[0] == "结果: 2.0" and results[2] == "结果: 4.0"
+    assert results[1].startswith("错误: 参数无效")
+    # 命中缓存与校验失败的参数都不发送给 server
+    assert batch_calls == [[{"a": 1, "b": 1}], [{"a": 2, "b": 2}]]
@@ -0,0 +1,144 @@
+"""把工具 JSON Schema 编译为 Pydantic 参数模型."""
+
+import pytest
+from pydantic import ValidationError
+
+from agent.mcp import client
+from agent.mcp.schema import compile_tool_schema, format_errors
+from agent.mcp.tools import _convert_mcp_tools
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "minLength": 1, "description": "查询"},
+        "limit": {"type": "integer", "minimum": 1, "maximum": 50, "default": 10},
+        "mode": {"enum": ["fast", "exact"]},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "filter": {"$ref": "#/$defs/Filter"},
+        "weights": {"type": "object", "additionalProperties": {"type": "number"}},
+        "note": {"type": ["string", "null"]},
+        "_private": {"type": "boolean"},
+    },
+    "required": ["query"],
+    "$defs": {
+        "Filter": {
+            "type": "object",
+            "properties": {"field": {"type": "string"}, "value": {"anyOf": [{"type": "number"}, {"type": "string"}]}},
+            "required": ["field"],
+            "additionalProperties": False,
+        }
+    },
+}
+
+
+@pytest.fixture
+def compiled():
+    return compile_tool_schema("search-docs", SCHEMA)
+
+
+def test_valid_arguments_are_normalized(compiled):
+    arguments = {
+        "query": "x",
+        "limit": 5.0,
+        "tags": ["a"],
+        "filter": {"field": "f", "value": 1},
+        "weights": {"a": 1},
+        "note": None,
+        "_private": True,
+        "extra": "passed through",
+    }
+    assert compiled.validate(arguments) == {
+        "query": "x",
+        "limit": 5,
+        "tags": ["a"],
+        "filter": {"field": "f", "value": 1.0},
+        "weights": {"a": 1.0},
+        "note": None,
+        "_private": True,
+        "extra": "passed through",
+    }
+    # 未提供的可选参数不发送（由 server 使用默认值）
+    assert compiled.validate({"query": "x"}) == {"query": "x"}
+
+
+@pytest.mark.parametrize(
+    ("arguments", "location"),
+    [
+        ({}, "query"),
+        ({"query": ""}, "query"),
+        ({"query": "x", "limit": 100}, "limit"),
+        ({"query": "x", "mode": "slow"}, "mode"),
+        ({"query": "x", "tags": "a"}, "tags"),
+        ({"query": "x", "filter": {"field": "f", "other": 1}}, "filter.other"),
+    ],
+)
+def test_invalid_arguments_are_reported(compiled, arguments, location):
+    with pytest.raises(ValidationError) as error:
+        compiled.validate(arguments)
+    assert format_errors(error.value).startswith(f"{location}: ")
+
+
+def test_compiled_models_are_cached():
+    assert compile_tool_schema("search-docs", dict(SCHEMA)) is compile_tool_schema("search-docs", SCHEMA)
+    assert compile_tool_schema("other", SCHEMA) is not compile_tool_schema("search-docs", SCHEMA)
+
+
+def test_schema_without_properties_accepts_anything():
+    compiled = compile_tool_schema("ping", None)
+    assert compiled.validate({"anything": [1]}) == {"anything": [1]}
+
+
+def test_recursive_refs_fall_back_to_any():
+    schema = {
+        "type": "object",
+        "properties": {"tree": {"$ref": "#/$defs/Node"}},
+        "$defs": {
+            "Node": {
+                "type": "object",
+                "properties": {"children": {"type": "array", "items": {"$ref": "#/$defs/Node"}}},
+            }
+        },
+    }
+    compiled = compile_tool_schema("tree", schema)
+    tree = {"children": [{"children": [{"anything": 1}]}]}
+    assert compiled.validate({"tree": tree}) == {"tree": tree}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """记录转换后的 LangChain 工具发给 server 的参数."""
+    calls: list[dict] = []
+
+    def call_sync(name, arguments):
+        calls.append(arguments)
+        return "ok"
+
+    async def call(name, arguments):
+        return call_sync(name, arguments)
+
+    monkeypatch.setattr(client, "call_mcp_tool_sync", call_sync)
+    monkeypatch.setattr(client, "call_mcp_tool", call)
+    return calls
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+async def test_converted_tool_sends_only_provided_arguments(sent, is_async):
+    schema = {
+        "type": "object",
+        "properties": {
+            "q": {"type": "string"},
+            "n": {"type": "integer"},
+            "_private": {"type": "string"},
+            "filter": SCHEMA["$defs"]["Filter"],
+        },
+        "required": ["q"],
+    }
+    (tool,) = _convert_mcp_tools([{"name": "search", "inputSchema": schema}])
+    calls = [{"q": "a"}, {"q": "a", "n": 2.0, "_private": "p", "filter": {"field": "f", "value": 1}}]
+    for arguments in calls:
+        assert (await tool.ainvoke(arguments) if is_async else tool.invoke(arguments)) == "ok"
+    # 未提供的可选参数不以 null 发送，以下划线开头的参数使用 schema 中的原名
+    assert sent == [{"q": "a"}, {"q": "a", "n": 2, "_private": "p", "filter": {"field": "f", "value": 1.0}}]
+    with pytest.raises(ValidationError):
+        tool.invoke({"n": 1})
+    assert len(sent) == 2
@@ -0,0 +1,126 @@
+"""指标（计数、直方图、回调 gauge、Prometheus 输出与多进程合并）与按轮次采样的 profiler."""
+
+import urllib.request
+
+import pytest
+
+from agent.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    _Metric,
+    merge_prometheus,
+    start_metrics_server,
+)
+from agent.profiling import TurnProfiler
+
+
+def test_counter():
+    counter = Counter("calls_total", "Calls", ("tool",))
+    counter.inc("add")
+    counter.inc("add", amount=2)
+    assert counter.snapshot() == {"add": 3.0}
+    assert counter.render() == ['calls_total{tool="add"} 3']
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()[""]
+    assert (snapshot["count"], snapshot["sum"]) == (4, 5.6)
+    assert snapshot["p50"] == pytest.approx(0.1)
+    assert histogram.render() == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 5.6",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_disabled_metrics_record_nothing():
+    histogram = Histogram("h", "", enabled=False)
+    with histogram.time():
+        pass
+    assert histogram.snapshot() == {}
+
+
+def test_gauge_reads_callbacks_and_survives_failures():
+    gauge = Gauge("depth", "Depth", ("queue",))
+    gauge.register("a", lambda: {("q1",): 3})
+    gauge.register("b", lambda: 1 / 0)
+    assert gauge.snapshot() == {"q1": 3.0}
+    gauge.unregister("a")
+    assert gauge.render() == []
+
+
+def test_metrics_must_implement_render_and_snapshot():
+    class NoSnapshot(_Metric):
+        def render(self):
+            return []
+
+    with pytest.raises(TypeError, match="snapshot"):
+        NoSnapshot("x", "", (), True)
+
+
+def test_registry_renders_only_metrics_with_samples():
+    registry = MetricsRegistry()
+    registry.turn_latency.observe(0.2, "http")
+    registry.register_queue("pool", lambda: {"mcp_idle": 2})
+    text = registry.render_prometheus()
+    assert "# TYPE agent_turn_seconds histogram" in text
+    assert 'agent_turn_seconds_count{entrypoint="http"} 1' in text
+    assert 'agent_queue_depth{queue="mcp_idle"} 2' in text
+    assert "agent_llm_latency_seconds" not in text
+    assert registry.snapshot()["agent_turn_seconds"]["http"]["count"] == 1
+
+
+def test_merge_prometheus_labels_each_worker():
+    text = "# HELP c Calls\n# TYPE c counter\nc 1\nc{tool=\"add\"} 2\n"
+    merged = merge_prometheus({"0": text, "1": text})
+    assert merged.splitlines() == [
+        "# HELP c Calls",
+        "# TYPE c counter",
+        'c{worker="0"} 1',
+        'c{worker="0",tool="add"} 2',
+        'c{worker="1"} 1',
+        'c{worker="1",tool="add"} 2',
+    ]
+
+
+def test_metrics_server(unused_tcp_port):
+    server = start_metrics_server(unused_tcp_port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{unused_tcp_port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+    finally:
+        server.shutdown()
+
+
+def test_profiler_writes_cprofile_files(tmp_path):
+    profiler = TurnProfiler("cprofile", str(tmp_path))
+    with profiler.profile("turn/1") as path:
+        sum(range(1000))
+    assert path is not None and path.exists() and path.suffix == ".prof"
+    assert profiler.last_profile == str(path)
+
+
+def test_profiler_skips_when_off_unsampled_or_busy(tmp_path):
+    profiler = TurnProfiler("off", str(tmp_path))
+    with profiler.profile("t") as path:
+        assert path is None
+    profiler.configure(mode="cprofile", sample_rate=0.0)
+    with profiler.profile("t") as path:
+        assert path is None
+    profiler.configure(sample_rate=1.0)
+    with profiler.profile("outer") as outer, profiler.profile("inner") as inner:
+        assert outer is not None and inner is None
+
+
+def test_profiler_rejects_unknown_modes():
+    with pytest.raises(ValueError, match="未知的 profiler"):
+        TurnProfiler().configure(mode="perf")
@@ -0,0 +1,60 @@
+"""Prompt 组装（固定的 system prompt 前缀）与上下文缓存命中的统计."""
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.config import get_system_prompt
+from agent.prompt import (
+    SYSTEM_PROMPT_ID,
+    PromptAssembler,
+    PromptCacheTracker,
+    prompt_cache_usage,
+)
+
+
+def _response(hit: int, miss: int) -> AIMessage:
+    return AIMessage(
+        content="",
+        response_metadata={"token_usage": {"prompt_cache_hit_tokens": hit, "prompt_cache_miss_tokens": miss}},
+    )
+
+
+def test_system_prompt_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("AGENT_SYSTEM_PROMPT", raising=False)
+    assert get_system_prompt() == ""
+    messages = [HumanMessage(content="hi")]
+    assert PromptAssembler(get_system_prompt()).build(messages) is messages
+
+
+def test_system_prompt_is_a_stable_prefix():
+    assembler = PromptAssembler("你是助手")
+    first = assembler.build([HumanMessage(content="a")])
+    second = assembler.build([HumanMessage(content="a"), AIMessage(content="b")])
+    # 每次复用同一个消息对象，序列化后的前缀逐字节相同
+    assert first[0] is second[0]
+    assert (first[0].type, first[0].id, first[0].content) == ("system", SYSTEM_PROMPT_ID, "你是助手")
+
+
+def test_prompt_cache_usage_formats():
+    assert prompt_cache_usage(_response(30, 10)) == (30, 10)
+    openai = AIMessage(
+        content="",
+        usage_metadata={
+            "input_tokens": 50,
+            "output_tokens": 1,
+            "total_tokens": 51,
+            "input_token_details": {"cache_read": 20},
+        },
+    )
+    assert prompt_cache_usage(openai) == (20, 30)
+    assert prompt_cache_usage(AIMessage(content="")) is None
+
+
+def test_tracker_accumulates_per_session():
+    tracker = PromptCacheTracker()
+    tracker.record(_response(0, 100), "m", "t1", None)
+    tracker.record(_response(90, 10), "m", "t1", None)
+    tracker.record(_response(50, 50), "m", None, None)
+    tracker.record(AIMessage(content=""), "m", "t1", None)
+    assert tracker.session("t1") == {"hit_tokens": 90, "miss_tokens": 110, "hit_ratio": 0.45}
+    assert tracker.session("t2") is None
+    assert tracker.stats() == {"hit_tokens": 140, "miss_tokens": 160, "hit_ratio": 0.4667}
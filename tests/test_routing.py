@@ -0,0 +1,101 @@
+"""模型级联：路由配置解析、启发式分档、分类器兜底，以及工具或模型调用失败时的升级."""
+
+import itertools
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent.routing import ModelRoute, ModelRouter, parse_model_routes
+
+ROUTES = [ModelRoute("fast", "deepseek-chat"), ModelRoute("strong", "deepseek-reasoner")]
+
+
+def _classifier(answer: str) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=itertools.cycle([AIMessage(content=answer)]))
+
+
+def test_parse_model_routes():
+    assert parse_model_routes(" fast=deepseek-chat, ,strong = deepseek-reasoner") == ROUTES
+    assert parse_model_routes("deepseek-chat") == [ModelRoute("deepseek-chat", "deepseek-chat")]
+    with pytest.raises(ValueError, match="重复"):
+        parse_model_routes("a=x,a=y")
+    with pytest.raises(ValueError, match="无法解析"):
+        parse_model_routes("a=")
+
+
+def test_heuristic_sends_simple_turns_to_the_cheapest_model():
+    router = ModelRouter(ROUTES, max_simple_chars=400, min_confidence=0.5)
+    decision = router.classify([HumanMessage(content="你好")])
+    assert (decision.route, decision.reason) == ("fast", "heuristic")
+    assert decision.confidence > 0.9
+
+    question = "这段代码为什么报错？怎么修？\n```python\n" + "x = 1\n" * 100 + "```"
+    assert router.classify([HumanMessage(content=question)]).route == "strong"
+
+
+def test_low_confidence_without_classifier_uses_the_strongest_model():
+    router = ModelRouter(ROUTES, min_confidence=1.01)
+    decision = router.decide([HumanMessage(content="你好")])
+    assert (decision.route, decision.reason) == ("strong", "low_confidence")
+
+
+@pytest.mark.parametrize(
+    ("answer", "route", "reason"),
+    [("simple", "fast", "classifier"), ("Complex.", "strong", "classifier"), ("不确定", "strong", "low_confidence")],
+)
+async def test_classifier_decides_uncertain_turns(answer, route, reason):
+    router = ModelRouter(ROUTES, min_confidence=1.01, classifier=_classifier(answer))
+    messages = [HumanMessage(content="你好")]
+    for decision in (router.decide(messages), await router.adecide(messages)):
+        assert (decision.route, decision.reason) == (route, reason)
+
+
+def test_classifier_failure_uses_the_strongest_model():
+    router = ModelRouter(ROUTES, min_confidence=1.01, classifier=GenericFakeChatModel(messages=iter([])))
+    assert router.decide([HumanMessage(content="你好")]).route == "strong"
+
+
+def test_node_escalates_after_a_failed_tool_call():
+    router = ModelRouter(ROUTES)
+    question = HumanMessage(content="你好")
+    assert router.node({"messages": [question]}) == {"model_route": "fast"}
+
+    call = AIMessage(content="", tool_calls=[{"name": "add", "args": {}, "id": "call_1"}])
+    ok = ToolMessage(content="结果: 3.0", tool_call_id="call_1")
+    failed = ToolMessage(content="错误: 参数 'a' 和 'b' 是必需的", tool_call_id="call_1", status="error")
+    assert router.node({"messages": [question, call, ok], "model_route": "fast"}) == {}
+    assert router.node({"messages": [question, call, failed], "model_route": "fast"}) == {"model_route": "strong"}
+    # 已经是最强的模型时不再升级
+    assert router.node({"messages": [question, call, failed], "model_route": "strong"}) == {}
+
+
+async def _turn(fake_llm, monkeypatch, failure: int):
+    """便宜的模型在输出 failure 个流式 chunk 后失败，返回 (本轮结果或异常, 发给假 LLM 的请求数)."""
+    from agent import acreate_agent_graph
+
+    monkeypatch.setenv("AGENT_STREAMING", "true")
+    monkeypatch.setitem(fake_llm.config.failures, "deepseek-chat", failure)
+    app = await acreate_agent_graph(model_router=ModelRouter(ROUTES))
+    requests = fake_llm.request_count
+    try:
+        result = await app.ainvoke({"messages": [HumanMessage(content="15 加 27 等于多少？")]})
+    except Exception as e:
+        return e, fake_llm.request_count - requests
+    return result, fake_llm.request_count - requests
+
+
+# 0：直接返回错误；1：只输出了不含内容的首个 chunk
+@pytest.mark.parametrize("failure", [0, 1])
+async def test_model_failure_before_any_output_escalates(fake_llm, monkeypatch, failure):
+    result, requests = await _turn(fake_llm, monkeypatch, failure)
+    assert result["model_route"] == "strong"
+    assert result["messages"][-1].content.startswith("回答：结果: 42.0")
+    assert requests == 3
+
+
+async def test_model_failure_after_streamed_output_does_not_escalate(fake_llm, monkeypatch):
+    # 第二个 chunk 是工具调用的名称，调用方已经看到了它
+    error, requests = await _turn(fake_llm, monkeypatch, 2)
+    assert isinstance(error, Exception)
+    assert requests == 1
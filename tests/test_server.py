@@ -0,0 +1,125 @@
+"""HTTP/SSE 服务：接口、准入控制、SSE 事件，以及跨事件循环使用的 LLM 客户端."""
+
+import asyncio
+import itertools
+import json
+from typing import Annotated, TypedDict
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from agent.server import AdmissionController, AgentServer, HTTPError
+
+
+class State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def build_app():
+    llm = GenericFakeChatModel(messages=itertools.cycle([AIMessage(content="hello there")]))
+
+    async def agent(state: State) -> dict:
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    graph = StateGraph(State)
+    graph.add_node("agent", agent)
+    graph.set_entry_point("agent")
+    graph.add_edge("agent", END)
+    return graph.compile(checkpointer=InMemorySaver())
+
+
+@pytest.fixture
+async def client():
+    server = AgentServer(build_app(), AdmissionController(max_in_flight=2, max_queue=2, queue_timeout=1))
+    listener = await server.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as http:
+        yield http
+    await server.shutdown(timeout=1)
+
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def test_json_turn_and_history(client):
+    response = await client.post("/threads/t1/turns", json={"message": "hi", "stream": False})
+    assert response.status_code == 200
+    assert response.json() == {"thread_id": "t1", "response": "hello there", "finish_reason": None, "tool_results": []}
+
+    history = (await client.get("/threads/t1")).json()
+    assert [message["type"] for message in history["messages"]] == ["human", "ai"]
+
+    assert (await client.delete("/threads/t1")).json() == {"thread_id": "t1", "deleted": True}
+    assert (await client.get("/threads/t1")).status_code == 404
+
+
+async def test_sse_turn_streams_tokens_once(client):
+    response = await client.post("/turns", json={"message": "hi", "stream": True})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert "".join(data["content"] for event, data in events if event == "token") == "hello there"
+    assert [event for event, _ in events if event not in ("token",)] == ["done"]
+    assert events[-1][1]["thread_id"] == response.headers["x-thread-id"]
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "body", "status"),
+    [
+        ("POST", "/turns", {}, 400),
+        ("POST", "/turns", {"message": "hi", "timeout": -1}, 400),
+        ("POST", "/turns", "not json", 400),
+        ("GET", "/nowhere", None, 404),
+    ],
+)
+async def test_bad_requests(client, method, path, body, status):
+    content = body if isinstance(body, str) else json.dumps(body) if body is not None else None
+    response = await client.request(method, path, content=content)
+    assert response.status_code == status
+    assert "error" in response.json()
+
+
+async def test_health(client):
+    health = (await client.get("/health")).json()
+    assert (health["status"], health["in_flight"], health["max_in_flight"]) == ("ok", 0, 2)
+
+
+async def test_admission_rejects_when_queue_is_full():
+    admission = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    async with admission.slot():
+        with pytest.raises(HTTPError) as error:
+            async with admission.slot():
+                pass
+    assert error.value.status == 503
+    assert admission.rejected == 1
+
+
+async def test_admission_times_out_queued_turns():
+    admission = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    async with admission.slot():
+        with pytest.raises(HTTPError) as error:
+            async with admission.slot():
+                pass
+    assert (error.value.status, error.value.retry_after) == (503, 1)
+    assert await admission.wait_idle(1)
+
+
+def test_async_http_client_works_across_event_loops(fake_llm):
+    from agent.llm_transport import get_async_http_client
+
+    async def post() -> int:
+        response = await get_async_http_client().post(
+            f"{fake_llm.base_url}/chat/completions", json={"messages": [{"role": "user", "content": "hi"}]}
+        )
+        return response.status_code
+
+    assert [asyncio.run(post()) for _ in range(2)] == [200, 200]
@@ -0,0 +1,86 @@
+"""多进程模式：一致性哈希路由、请求转发、指标汇总与 worker 重启."""
+
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+import pytest
+
+from agent.supervisor import HashRing, Supervisor
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing([0, 1, 2, 3])
+    keys = [f"thread-{i}" for i in range(4000)]
+    owners = [ring.node(key) for key in keys]
+    rebuilt = HashRing([0, 1, 2, 3])
+    assert owners == [rebuilt.node(key) for key in keys]
+    counts = Counter(owners)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 500
+
+
+def test_hash_ring_moves_few_keys_when_a_node_is_added():
+    keys = [f"thread-{i}" for i in range(4000)]
+    before = HashRing([0, 1, 2, 3])
+    after = HashRing([0, 1, 2, 3, 4])
+    moved = [key for key in keys if before.node(key) != after.node(key)]
+    # 只有归属新节点的 key 改变位置（约 1/5）
+    assert all(after.node(key) == 4 for key in moved)
+    assert len(moved) < len(keys) * 0.35
+
+
+def test_health_before_workers_start(tmp_path):
+    supervisor = Supervisor(2, socket_dir=str(tmp_path))
+    assert supervisor.health()["status"] == "degraded"
+    assert supervisor.health()["workers"]["0"] == {"healthy": False, "pid": None, "restarts": 0}
+    assert supervisor.worker_for("t1") is supervisor.worker_for("t1")
+
+
+async def _wait_healthy(supervisor: Supervisor, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while supervisor.health()["status"] != "ok":
+        assert time.monotonic() < deadline, supervisor.health()
+        await asyncio.sleep(0.1)
+
+
+@pytest.fixture
+async def supervisor(fake_llm, tmp_path):
+    supervisor = Supervisor(2, socket_dir=str(tmp_path), health_interval=0.2, shutdown_timeout=5)
+    listener = await supervisor.start("127.0.0.1", 0)
+    supervisor.port = listener.sockets[0].getsockname()[1]
+    try:
+        await _wait_healthy(supervisor)
+        yield supervisor
+    finally:
+        await supervisor.shutdown()
+
+
+async def test_turns_are_routed_by_thread_id(supervisor):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{supervisor.port}", timeout=30) as http:
+        first = await http.post("/turns", json={"message": "20 加 22 等于多少？", "stream": False})
+        assert first.status_code == 200
+        thread_id = first.json()["thread_id"]
+        worker = first.headers["x-worker"]
+        assert worker == str(supervisor.worker_for(thread_id).index)
+
+        second = await http.post(f"/threads/{thread_id}/turns", json={"message": "再加 1", "stream": False})
+        assert second.headers["x-worker"] == worker
+        history = (await http.get(f"/threads/{thread_id}")).json()
+        assert [message["type"] for message in history["messages"]].count("human") == 2
+
+        metrics = (await http.get("/metrics")).text
+        assert 'agent_worker_up{worker="0"} 1' in metrics
+        assert f'agent_turn_seconds_count{{worker="{worker}",entrypoint="http"}} 2' in metrics
+        assert (await http.get("/nope")).status_code == 404
+
+
+async def test_dead_worker_is_restarted(supervisor):
+    worker = supervisor.workers[0]
+    worker.process.kill()
+    deadline = time.monotonic() + 60
+    while worker.restarts == 0 or not worker.healthy:
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.1)
+    assert supervisor.health()["workers"]["0"]["restarts"] == 1
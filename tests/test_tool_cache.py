@@ -0,0 +1,98 @@
+"""可缓存 MCP 工具的结果缓存."""
+
+import time
+
+import pytest
+from langchain_core.tools import ToolException
+
+from agent.mcp import client, tools
+from agent.mcp.tools import (
+    ToolResultCache,
+    _convert_mcp_tools,
+    batch_call_mcp_tool_sync,
+)
+
+SPEC = {
+    "name": "lookup",
+    "description": "查询",
+    "inputSchema": {"type": "object", "properties": {"q": {"type": "string"}}, "required": ["q"]},
+    "_meta": {"cacheable": True},
+}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """把 MCP 调用替换为计数的本地函数，并使用新的结果缓存."""
+    seen: list[tuple[str, dict]] = []
+
+    def call_sync(name, arguments):
+        seen.append((name, arguments))
+        if arguments["q"] == "bad":
+            # server 以 isError 报告失败时客户端抛出 ToolException
+            raise ToolException(f"错误: 无法查询 {arguments['q']}")
+        return f"{name}:{arguments['q']}:{len(seen)}"
+
+    async def call_async(name, arguments):
+        return call_sync(name, arguments)
+
+    monkeypatch.setattr(client, "call_mcp_tool_sync", call_sync)
+    monkeypatch.setattr(client, "call_mcp_tool", call_async)
+    monkeypatch.setattr(tools, "_tool_result_cache", ToolResultCache(max_entries=16, ttl=60))
+    return seen
+
+
+def test_make_key_is_canonical():
+    assert ToolResultCache.make_key("t", {"b": 1.0, "a": [2]}) == ToolResultCache.make_key("t", {"a": [2], "b": 1})
+    assert ToolResultCache.make_key("t", {"a": 1}) != ToolResultCache.make_key("u", {"a": 1})
+
+
+def test_result_cache_respects_ttl_and_records_stats():
+    cache = ToolResultCache(max_entries=4, ttl=60)
+    cache.set("t", {"a": 1}, "short", ttl=0.05)
+    cache.set("t", {"a": 2}, "long")
+    time.sleep(0.08)
+    assert cache.get("t", {"a": 1}) is None
+    assert cache.get("t", {"a": 2}) == "long"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_cacheable_tool_calls_server_once(calls):
+    (tool,) = _convert_mcp_tools([SPEC])
+    first = tool.invoke({"q": "x"})
+    assert tool.invoke({"q": "x"}) == first
+    assert tool.invoke({"q": "y"}) != first
+    assert calls == [("lookup", {"q": "x"}), ("lookup", {"q": "y"})]
+
+
+async def test_cacheable_tool_shares_cache_between_sync_and_async(calls):
+    (tool,) = _convert_mcp_tools([SPEC])
+    first = await tool.ainvoke({"q": "x"})
+    assert tool.invoke({"q": "x"}) == first
+    assert len(calls) == 1
+
+
+def test_uncached_tool_always_calls_server(calls):
+    (tool,) = _convert_mcp_tools([{**SPEC, "name": "fresh", "_meta": {}}])
+    tool.invoke({"q": "x"})
+    tool.invoke({"q": "x"})
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("is_async", [False, True], ids=["sync", "async"])
+async def test_failed_calls_are_errors_and_not_cached(calls, is_async):
+    (tool,) = _convert_mcp_tools([SPEC])
+    call = {"name": "lookup", "args": {"q": "bad"}, "id": "call_1", "type": "tool_call"}
+    for _ in range(2):
+        message = await tool.ainvoke(call) if is_async else tool.invoke(call)
+        assert (message.status, message.content) == ("error", "错误: 无法查询 bad")
+    assert len(calls) == 2
+    assert len(tools._tool_result_cache) == 0
+
+
+def test_batch_errors_are_not_cached(calls, monkeypatch):
+    monkeypatch.setattr(
+        client, "call_mcp_tool_batch_sync", lambda name, arguments_list: ["ok", "错误: 参数 'a' 和 'b' 是必需的"]
+    )
+    _convert_mcp_tools([{**SPEC, "name": "pair", "inputSchema": None, "_meta": {"cacheable": True, "batchable": True}}])
+    batch_call_mcp_tool_sync("pair", [{"a": 1, "b": 1}, {"a": 1}])
+    assert len(tools._tool_result_cache) == 1
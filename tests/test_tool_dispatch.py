@@ -0,0 +1,178 @@
+"""ParallelToolNode：并发执行、结果顺序、单个调用的超时与流式输出期间的投机执行."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.tools import StructuredTool
+
+from agent.tool_dispatch import ParallelToolNode
+
+
+def _sleep(seconds: float) -> str:
+    """睡眠 seconds 秒."""
+    time.sleep(seconds)
+    return f"slept {seconds}"
+
+
+async def _asleep(seconds: float) -> str:
+    await asyncio.sleep(seconds)
+    return f"slept {seconds}"
+
+
+def _fail() -> str:
+    """总是失败."""
+    raise ValueError("boom")
+
+
+SLEEP = StructuredTool.from_function(func=_sleep, coroutine=_asleep, name="sleep", description="sleep")
+FAIL = StructuredTool.from_function(func=_fail, name="fail", description="fail")
+
+
+def _state(*calls: tuple[str, dict]) -> dict:
+    tool_calls = [{"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+
+@pytest.fixture
+def node():
+    return ParallelToolNode([SLEEP, FAIL], max_concurrency=4, timeout=1.0)
+
+
+def test_calls_run_concurrently_and_keep_order(node):
+    started = time.perf_counter()
+    result = node.invoke(_state(("sleep", {"seconds": 0.3}), ("sleep", {"seconds": 0.1}), ("sleep", {"seconds": 0.2})))
+    assert time.perf_counter() - started < 0.55
+    assert [message.tool_call_id for message in result["messages"]] == ["call_0", "call_1", "call_2"]
+    assert [message.content for message in result["messages"]] == ["slept 0.3", "slept 0.1", "slept 0.2"]
+
+
+async def test_async_calls_run_concurrently_and_keep_order(node):
+    started = time.perf_counter()
+    result = await node.ainvoke(_state(("sleep", {"seconds": 0.3}), ("sleep", {"seconds": 0.1})))
+    assert time.perf_counter() - started < 0.45
+    assert [message.content for message in result["messages"]] == ["slept 0.3", "slept 0.1"]
+
+
+def test_max_concurrency_limits_parallelism():
+    node = ParallelToolNode([SLEEP], max_concurrency=1, timeout=5)
+    started = time.perf_counter()
+    node.invoke(_state(("sleep", {"seconds": 0.15}), ("sleep", {"seconds": 0.15})))
+    assert time.perf_counter() - started >= 0.3
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+async def test_slow_call_times_out_without_blocking_others(asynchronous):
+    node = ParallelToolNode([SLEEP], max_concurrency=4, timeout=0.2)
+    state = _state(("sleep", {"seconds": 1.0}), ("sleep", {"seconds": 0.05}))
+    started = time.perf_counter()
+    result = await node.ainvoke(state) if asynchronous else node.invoke(state)
+    assert time.perf_counter() - started < 0.6
+    slow, fast = result["messages"]
+    assert slow.status == "error" and "timed out" in slow.content
+    assert fast.status == "success" and fast.content == "slept 0.05"
+
+
+def test_failures_and_unknown_tools_become_error_messages(node):
+    failed, unknown = node.invoke(_state(("fail", {}), ("missing", {})))["messages"]
+    assert failed.status == "error" and "boom" in failed.content
+    assert unknown.status == "error" and "not a valid tool" in unknown.content
+
+
+def test_no_tool_calls_returns_no_messages(node):
+    assert node.invoke({"messages": [AIMessage(content="done")]}) == {"messages": []}
+
+
+def _chunks(name: str, args: str, call_id: str = "call_0", index: int = 0) -> list[AIMessageChunk]:
+    """把一个工具调用拆成 LLM 流式输出时的多个 chunk（参数 JSON 分两段到达）."""
+    middle = len(args) // 2
+    return [
+        AIMessageChunk(content="", tool_call_chunks=[tool_call_chunk(name=name, args=args[:middle], id=call_id, index=index)]),
+        AIMessageChunk(content="", tool_call_chunks=[tool_call_chunk(args=args[middle:], index=index)]),
+    ]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+async def test_speculative_call_starts_during_streaming(node, asynchronous):
+    speculation = node.speculate(asynchronous=asynchronous)
+    first, second = _chunks("sleep", '{"seconds": 0.3}')
+    speculation.feed(first)
+    assert speculation.started == []
+    started = time.perf_counter()
+    speculation.feed(second)
+    assert [call["id"] for call in speculation.started] == ["call_0"]
+
+    # 模拟 LLM 继续生成一段时间，工具调用在此期间已经在执行
+    await asyncio.sleep(0.2)
+    state = _state(("sleep", {"seconds": 0.3}))
+    speculation.finish(state["messages"][-1])
+    result = await node.ainvoke(state) if asynchronous else node.invoke(state)
+    assert time.perf_counter() - started < 0.45
+    assert result["messages"][0].content == "slept 0.3"
+    assert node._speculative == {}
+
+
+def test_speculation_skips_invalid_and_discards_changed_calls(node):
+    speculation = node.speculate()
+    for chunk in _chunks("sleep", '{"seconds": "soon"}') + _chunks("missing", "{}", "call_1", 1):
+        speculation.feed(chunk)
+    assert speculation.started == []
+
+    for chunk in _chunks("sleep", '{"seconds": 0.01}', "call_2", 2):
+        speculation.feed(chunk)
+    assert list(node._speculative) == ["call_2"]
+    # 最终消息中不存在的调用被丢弃，tools 节点不会用到它
+    speculation.finish(AIMessage(content="done"))
+    assert node._speculative == {}
+
+
+def test_speculative_result_is_not_reused_for_different_arguments(node):
+    speculation = node.speculate()
+    for chunk in _chunks("sleep", '{"seconds": 0.01}'):
+        speculation.feed(chunk)
+    result = node.invoke(_state(("sleep", {"seconds": 0.02})))
+    assert result["messages"][0].content == "slept 0.02"
+    assert node._speculative == {}
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+async def test_speculative_calls_count_against_max_concurrency(asynchronous):
+    running = peak = 0
+    lock = threading.Lock()
+
+    def track(delta: int) -> None:
+        nonlocal running, peak
+        with lock:
+            running += delta
+            peak = max(peak, running)
+
+    def work() -> str:
+        """记录同时执行的调用数."""
+        track(1)
+        time.sleep(0.1)
+        track(-1)
+        return "done"
+
+    async def awork() -> str:
+        track(1)
+        await asyncio.sleep(0.1)
+        track(-1)
+        return "done"
+
+    tool = StructuredTool.from_function(func=work, coroutine=awork, name="work", description="work")
+    node = ParallelToolNode([tool], max_concurrency=2, timeout=5)
+    speculation = node.speculate(asynchronous=asynchronous)
+    for index in range(2):
+        for chunk in _chunks("work", "{}", f"call_{index}", index):
+            speculation.feed(chunk)
+    assert len(speculation.started) == 2
+
+    # 两个投机启动的调用仍在执行时，tools 节点的其余调用需要等待并发额度
+    state = _state(*[("work", {})] * 4)
+    speculation.finish(state["messages"][-1])
+    result = await node.ainvoke(state) if asynchronous else node.invoke(state)
+    assert [message.content for message in result["messages"]] == ["done"] * 4
+    assert peak == 2
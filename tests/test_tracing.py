@@ -0,0 +1,150 @@
+"""Tracer：采样、span 嵌套、有界队列与批量导出."""
+
+import json
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.tracing import (
+    FileExporter,
+    LangfuseExporter,
+    MessagesRef,
+    NoopExporter,
+    Tracer,
+    _preview,
+    create_trace_exporter,
+)
+
+
+class MemoryExporter:
+    def __init__(self, fail: bool = False):
+        self.batches: list[list[dict]] = []
+        self.fail = fail
+
+    def export(self, batch):
+        if self.fail:
+            raise ConnectionError("down")
+        self.batches.append(batch)
+
+    def shutdown(self):
+        pass
+
+    @property
+    def spans(self) -> list[dict]:
+        return [span for batch in self.batches for span in batch]
+
+
+def test_nested_spans_share_the_trace():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter, flush_interval=60)
+    with tracer.span("turn", input="hi") as root:
+        root.update_trace(user_id="u1")
+        with tracer.span("llm", kind="generation", model="m") as child:
+            child.update(output="ok", usage_details={"input": 1})
+    assert tracer.flush()
+    child_span, root_span = exporter.spans
+    assert child_span["trace_id"] == root_span["trace_id"]
+    assert child_span["parent_id"] == root_span["span_id"]
+    assert (child_span["kind"], child_span["model"], child_span["output"]) == ("generation", "m", "ok")
+    assert root_span["trace"] == {"user_id": "u1"}
+    assert tracer.stats()["exported"] == 2
+
+
+def test_unsampled_trace_records_no_children():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter, sample_rate=0.0)
+    with tracer.span("turn") as root, tracer.span("llm") as child:
+        assert root is None and child is None
+    assert tracer.flush()
+    assert exporter.spans == []
+
+
+def test_disabled_tracer_yields_none():
+    tracer = Tracer(None)
+    with tracer.span("turn") as span:
+        assert span is None
+    assert not tracer.enabled
+
+
+def test_error_marks_span():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    with pytest.raises(ValueError), tracer.span("turn"):
+        raise ValueError("boom")
+    assert tracer.flush()
+    assert (exporter.spans[0]["level"], exporter.spans[0]["status_message"]) == ("ERROR", "boom")
+
+
+def test_full_queue_drops_spans_without_blocking():
+    gate = threading.Event()
+
+    class SlowExporter(MemoryExporter):
+        def export(self, batch):
+            gate.wait()
+            super().export(batch)
+
+    tracer = Tracer(SlowExporter(), queue_size=2, batch_size=1, flush_interval=0.01)
+    for _ in range(10):
+        with tracer.span("s"):
+            pass
+    assert tracer.stats()["dropped"] > 0
+    gate.set()
+    assert tracer.flush()
+
+
+def test_export_failures_are_counted():
+    tracer = Tracer(MemoryExporter(fail=True))
+    with tracer.span("s"):
+        pass
+    assert tracer.flush()
+    assert tracer.stats()["failed"] == 1
+
+
+def test_preview_is_bounded():
+    messages = [HumanMessage(content="q" * 50, id="h"), AIMessage(content="a", id="a")] * 3
+    summary = _preview(MessagesRef(messages), limit=10)
+    assert summary["message_count"] == 6
+    assert summary["tail"][0]["content"] == "q" * 10 + "…(+40 chars)"
+    assert len(_preview(list(range(100)), 10)) == 20
+
+
+def test_file_exporter_appends_json_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(FileExporter(str(path)))
+    for name in ("a", "b"):
+        with tracer.span(name):
+            pass
+    assert tracer.flush()
+    assert [json.loads(line)["name"] for line in path.read_text(encoding="utf-8").splitlines()] == ["a", "b"]
+
+
+def test_langfuse_events():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    with tracer.span("turn") as root:
+        root.update_trace(session_id="s1")
+        with tracer.span("llm", kind="generation", model="m"):
+            pass
+    assert tracer.flush()
+    events = [event for span in exporter.spans for event in LangfuseExporter._events(span)]
+    assert [event["type"] for event in events] == ["generation-create", "trace-create", "span-create"]
+    assert events[1]["body"]["sessionId"] == "s1"
+    assert events[0]["body"]["model"] == "m"
+
+
+def test_create_trace_exporter(monkeypatch, tmp_path):
+    monkeypatch.delenv("LANGFUSE_PUBLIC_KEY", raising=False)
+    monkeypatch.delenv("LANGFUSE_SECRET_KEY", raising=False)
+    monkeypatch.delenv("AGENT_TRACE_EXPORTER", raising=False)
+    assert create_trace_exporter() is None
+    monkeypatch.setenv("AGENT_TRACE_EXPORTER", "noop")
+    assert isinstance(create_trace_exporter(), NoopExporter)
+    monkeypatch.setenv("AGENT_TRACE_EXPORTER", "file")
+    monkeypatch.setenv("AGENT_TRACE_FILE", str(tmp_path / "t.jsonl"))
+    assert isinstance(create_trace_exporter(), FileExporter)
+    monkeypatch.setenv("AGENT_TRACE_EXPORTER", "langfuse")
+    assert create_trace_exporter() is None
+    monkeypatch.setenv("AGENT_TRACE_EXPORTER", "zipkin")
+    with pytest.raises(ValueError):
+        create_trace_exporter()